@@ -0,0 +1 @@
+"""Бенчмарк і навантажувальний тест бота: фейковий Bot API, наповнення бази, генератор навантаження."""
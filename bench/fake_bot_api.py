@@ -0,0 +1,132 @@
+import json
+import time
+import asyncio
+import logging
+import itertools
+from collections import Counter
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 1000000, "is_bot": True, "first_name": "BenchBot", "username": "bench_bot"}
+
+
+class FakeBotApi:
+    """
+    Локальна заміна Bot API для бенчмарку: приймає запити python-telegram-bot
+    (POST /bot<token>/<метод>), записує їх і повертає правдоподібні відповіді.
+
+    latency - штучна затримка кожної відповіді в секундах, щоб імітувати мережу до Telegram.
+    last_markup[chat_id] - остання inline-клавіатура, надіслана в чат: генератор навантаження
+    бере з неї callback_data для наступного натискання, як це зробив би користувач.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.calls = Counter()
+        self.last_markup = {}
+        self._message_ids = itertools.count(1)
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Фейковий Bot API слухає на {self.base_url}")
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # --- HTTP ---
+
+    async def _handle_connection(self, reader, writer):
+        # httpx тримає з'єднання відкритими (keep-alive), тому обробляємо запити в циклі
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                path = request_line.decode("latin-1").split()[1]
+                method = path.rsplit("/", 1)[-1]
+                params = self._parse_params(headers.get("content-type", ""), body)
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                payload = json.dumps({"ok": True, "result": self._respond(method, params)}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_params(content_type, body):
+        # Без файлів PTB надсилає параметри як form-urlencoded (складні значення - JSON-рядками).
+        # Multipart (вивантаження файлів) не розбираємо: для відповіді вистачає назви методу.
+        if not content_type.startswith("application/x-www-form-urlencoded"):
+            return {}
+        params = {}
+        for key, value in parse_qsl(body.decode(), keep_blank_values=True):
+            if key in ("reply_markup", "media"):
+                value = json.loads(value)
+            params[key] = value
+        return params
+
+    # --- Відповіді методів ---
+
+    def _message(self, params, **fields):
+        chat_id = int(params.get("chat_id", 0) or 0)
+        if "reply_markup" in params:
+            self.last_markup[chat_id] = params["reply_markup"]
+        message = {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        message.update(fields)
+        return message
+
+    @staticmethod
+    def _photo(file_id):
+        return [{"file_id": file_id, "file_unique_id": file_id, "width": 800, "height": 800}]
+
+    def _respond(self, method, params):
+        self.calls[method] += 1
+        if method == "getMe":
+            return {**BOT_USER, "can_join_groups": False, "can_read_all_group_messages": False,
+                    "supports_inline_queries": False}
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params, text=params.get("text", ""))
+        if method == "sendPhoto":
+            return self._message(params, photo=self._photo(f"photo{next(self._message_ids)}"),
+                                 caption=params.get("caption", ""))
+        if method == "sendDocument":
+            return self._message(params, document={"file_id": "doc", "file_unique_id": "doc"})
+        if method == "sendMediaGroup":
+            return [
+                self._message(params, photo=self._photo(f"photo{next(self._message_ids)}"), caption=item.get("caption", ""))
+                for item in params.get("media", [])
+            ]
+        # answerCallbackQuery, deleteMessage, setWebhook, deleteWebhook тощо
+        return True
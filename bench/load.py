@@ -0,0 +1,205 @@
+"""
+Навантажувальний тест бота без Telegram: справжній Application з усіма обробниками,
+локальний фейковий Bot API і локальна база даних (PostgreSQL або файл SQLite).
+
+Кожен віртуальний користувач проходить сценарій
+/start -> filter_options -> brand_filter -> toggle_brand -> apply_filters -> page (кілька сторінок),
+натискаючи кнопки з клавіатур, які бот йому надіслав. Наприкінці виводиться p50/p99
+і пропускна здатність для кожної дії button_handler, а також статистика запитів до БД та Bot API.
+
+    DATABASE_URL=postgresql://localhost/shoe_bench python -m bench.load --seed-rows 100000 --users 100
+    STORAGE_BACKEND=sqlite SQLITE_PATH=/tmp/shoe_bench.db python -m bench.load --seed-rows 100000 --users 100
+
+--seed-rows спершу видаляє всі товари - як і bench.seed --reset, лише в базі з "bench" у назві
+або з --confirm-reset.
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import itertools
+from collections import defaultdict
+
+from bench.fake_bot_api import FakeBotApi, BOT_USER
+from bench.seed import seed_catalog, check_reset_allowed
+
+
+def percentile(sorted_values, q):
+    """Перцентиль методом найближчого рангу."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class LoadGenerator:
+    def __init__(self, application, api, pages, rng):
+        self.application = application
+        self.api = api
+        self.pages = pages
+        self.rng = rng
+        self.latencies = defaultdict(list)  # дія -> [секунди]
+        self.errors = defaultdict(int)
+        self._update_ids = itertools.count(1)
+        self._actions = {}  # update_id -> дія, для підрахунку помилок обробників
+        # Application.process_update сам перехоплює винятки обробників і передає їх обробникам помилок
+        application.add_error_handler(self._on_error)
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    def _message_update(self, user_id, text):
+        from telegram import Update
+        entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else []
+        return Update.de_json({
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": 1, "date": int(time.time()), "text": text, "entities": entities,
+                "chat": {"id": user_id, "type": "private"}, "from": self._user(user_id),
+            },
+        }, self.application.bot)
+
+    def _callback_update(self, user_id, data):
+        from telegram import Update
+        return Update.de_json({
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)), "chat_instance": str(user_id), "data": data,
+                "from": self._user(user_id),
+                "message": {
+                    "message_id": 1, "date": int(time.time()), "text": "menu",
+                    "chat": {"id": user_id, "type": "private"}, "from": BOT_USER,
+                },
+            },
+        }, self.application.bot)
+
+    async def _on_error(self, update, context):
+        action = self._actions.get(getattr(update, "update_id", None), "unknown")
+        self.errors[action] += 1
+
+    async def _send(self, action, update):
+        """Передає оновлення тим самим шляхом, що й polling/webhook, і вимірює час обробки."""
+        self._actions[update.update_id] = action
+        start = time.perf_counter()
+        try:
+            await self.application.update_processor.process_update(update, self.application.process_update(update))
+        except Exception:
+            self.errors[action] += 1
+        finally:
+            del self._actions[update.update_id]
+        self.latencies[action].append(time.perf_counter() - start)
+
+    async def press(self, user_id, data):
+        from callbacks import decode_callback
+        decoded = decode_callback(data)
+        await self._send(decoded[0] if decoded else "stale", self._callback_update(user_id, data))
+
+    def buttons(self, user_id, action):
+        """callback_data кнопок з останньої клавіатури користувача, що ведуть до дії action."""
+        from callbacks import decode_callback
+        markup = self.api.last_markup.get(user_id) or {}
+        found = []
+        for row in markup.get("inline_keyboard", []):
+            for button in row:
+                decoded = decode_callback(button.get("callback_data"))
+                if decoded and decoded[0] == action:
+                    found.append(button["callback_data"])
+        return found
+
+    async def run_user(self, user_id, rounds):
+        from callbacks import encode_callback
+        for _ in range(rounds):
+            await self._send("start", self._message_update(user_id, "/start"))
+            await self.press(user_id, encode_callback("filter_options"))
+            await self.press(user_id, encode_callback("brand_filter"))
+            toggles = self.buttons(user_id, "toggle_brand")
+            for data in self.rng.sample(toggles, min(len(toggles), self.rng.randint(1, 2))):
+                await self.press(user_id, data)
+            await self.press(user_id, encode_callback("apply_filters"))
+            for _ in range(self.pages):
+                next_pages = [data for data in self.buttons(user_id, "page") if data.split(":")[-1].isdigit()]
+                if not next_pages:
+                    break
+                await self.press(user_id, next_pages[-1])
+            await self.press(user_id, encode_callback("reset_filters"))
+
+    def report(self, elapsed):
+        total = sum(len(values) for values in self.latencies.values())
+        print(f"\nДій: {total} за {elapsed:.2f} с ({total / elapsed:.1f} дій/с)\n")
+        print(f"{'дія':<16} {'к-сть':>7} {'дій/с':>8} {'p50, мс':>9} {'p99, мс':>9} {'помилки':>8}")
+        for action, values in sorted(self.latencies.items(), key=lambda item: -len(item[1])):
+            values.sort()
+            print(
+                f"{action:<16} {len(values):>7} {len(values) / elapsed:>8.1f} "
+                f"{percentile(values, 0.5) * 1000:>9.1f} {percentile(values, 0.99) * 1000:>9.1f} "
+                f"{self.errors.get(action, 0):>8}"
+            )
+
+
+async def run(args):
+    import bot
+    from metrics import metrics
+
+    if args.seed_rows:
+        check_reset_allowed(args.confirm_reset)
+    api = await FakeBotApi(latency=args.api_latency / 1000).start()
+    if args.seed_rows:
+        bot.init_storage()
+        print(f"Наповнюю каталог: {args.seed_rows} товарів...")
+        await seed_catalog(args.seed_rows, reset=True)
+
+    started = time.perf_counter()
+    # --cold-start: як у main() - каталог зі знімка (CATALOG_SNAPSHOT_PATH), а сховище підключається у фоні
+    if not bot.storage_initialized() and not (args.cold_start and bot.load_catalog_snapshot()):
+        bot.init_storage()
+    application = bot.build_application(base_url=api.base_url)
+    await application.initialize()
+    await application.post_init(application)
+    print(f"Запуск бота: {(time.perf_counter() - started) * 1000:.0f} мс")
+
+    generator = LoadGenerator(application, api, args.pages, random.Random(args.random_seed))
+    start = time.perf_counter()
+    await asyncio.gather(*(generator.run_user(100000 + i, args.rounds) for i in range(args.users)))
+    elapsed = time.perf_counter() - start
+
+    await application.shutdown()
+    await application.post_shutdown(application)
+    await api.stop()
+
+    generator.report(elapsed)
+    print("\nЗапити до БД (p50 / p99, мс):")
+    for labels, count, p50, p99 in metrics.summary("db_query_seconds"):
+        print(f"  {labels.get('query', ''):<16} {count:>7} {p50 * 1000:>9.1f} {p99 * 1000:>9.1f}")
+    print("\nВиклики Bot API:")
+    for method, count in api.calls.most_common():
+        print(f"  {method:<20} {count:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Навантажувальний тест бота з фейковим Bot API")
+    parser.add_argument("--users", type=int, default=50, help="кількість одночасних користувачів")
+    parser.add_argument("--rounds", type=int, default=3, help="скільки разів кожен користувач проходить сценарій")
+    parser.add_argument("--pages", type=int, default=3, help="скільки сторінок гортати після застосування фільтрів")
+    parser.add_argument("--seed-rows", type=int, default=0, help="перед тестом очистити каталог і додати стільки товарів")
+    parser.add_argument("--confirm-reset", action="store_true",
+                        help="дозволити --seed-rows для бази, назва якої не містить \"bench\"")
+    parser.add_argument("--api-latency", type=float, default=0, help="затримка відповіді фейкового Bot API, мс")
+    parser.add_argument("--no-rate-limit", action="store_true", help="вимкнути ліміти відправки (SEND_GLOBAL_RATE=0)")
+    parser.add_argument("--cold-start", action="store_true",
+                        help="запуск зі знімка каталогу, як у main() (потрібні CATALOG_INDEX=1 і CATALOG_SNAPSHOT_PATH)")
+    parser.add_argument("--random-seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # bot.py читає налаштування зі змінних середовища під час імпорту
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:bench")
+    os.environ.setdefault("YOUR_ADMIN_ID", "1")
+    # Бенчмарк працює без мережі: фонова перевірка зображень не ходить на зовнішні сервери
+    os.environ.setdefault("IMAGE_CHECK", "0")
+    if args.no_rate_limit:
+        os.environ["SEND_GLOBAL_RATE"] = "0"
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Наповнення локальної бази даних синтетичним каталогом для бенчмарку.
+
+    DATABASE_URL=postgresql://localhost/shoe_bench python -m bench.seed --rows 100000 --reset
+    STORAGE_BACKEND=sqlite SQLITE_PATH=/tmp/shoe_bench.db python -m bench.seed --rows 100000 --reset
+
+--reset видаляє всі товари, тому дозволений лише для бази, назва якої містить "bench"
+(як у прикладах вище), або з --confirm-reset.
+"""
+import io
+import os
+import csv
+import random
+import asyncio
+import argparse
+from urllib.parse import urlsplit
+
+BRANDS = ["Nike", "Adidas", "Puma", "Reebok", "New Balance", "Asics", "Converse", "Vans", "Salomon", "On"]
+MODELS = ["Air", "Runner", "Classic", "Pro", "Trail", "Court", "Street", "Max", "Flex", "Zoom"]
+SIZES = [36, 37, 38, 38.5, 39, 39.5, 40, 40.5, 41, 42, 42.5, 43, 44, 45, 46]
+
+
+def generate_rows(count, photo_share=0.7, rng=None):
+    """Рядки (name, brand, size, price, image) у форматі COPY; частина товарів - з фото за URL."""
+    rng = rng or random.Random(42)
+    for i in range(count):
+        brand = rng.choice(BRANDS)
+        image = f"https://example.com/shoes/{i}.jpg" if rng.random() < photo_share else ""
+        yield (
+            f"{brand} {rng.choice(MODELS)} {rng.choice(MODELS)} {i}",
+            brand,
+            rng.choice(SIZES),
+            rng.randrange(1000, 8000, 50),
+            image,
+        )
+
+
+def reset_target():
+    """Назва бази (або файл SQLite), яку очистить reset_catalog() за поточних налаштувань."""
+    from database import STORAGE_BACKEND, SQLITE_PATH
+
+    if STORAGE_BACKEND == "sqlite":
+        return SQLITE_PATH
+    # Лише назва бази з DATABASE_URL - без логіна та пароля
+    return urlsplit(os.environ.get("DATABASE_URL", "")).path.lstrip("/")
+
+
+def check_reset_allowed(confirmed=False):
+    """Зупиняє бенчмарк, якщо каталог збираються очистити не в окремій базі для бенчмарку."""
+    target = reset_target()
+    if confirmed or "bench" in os.path.basename(target):
+        return
+    raise SystemExit(
+        f"Бенчмарк видалить усі товари в {target!r}. Використайте окрему базу з \"bench\" у назві "
+        f"(напр. shoe_bench) або додайте --confirm-reset."
+    )
+
+
+async def seed_catalog(rows, reset=False, batch_size=50000):
+    """Додає rows згенерованих товарів пакетами через імпорт (COPY у PostgreSQL). reset - спершу очистити таблицю."""
+    from database import reset_catalog, bulk_insert_shoes
+
+    if reset:
+        await reset_catalog()
+    generated = generate_rows(rows)
+    inserted = 0
+    while inserted < rows:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for _ in range(min(batch_size, rows - inserted)):
+            writer.writerow(next(generated))
+        buffer.seek(0)
+        inserted += await bulk_insert_shoes(buffer)
+    return inserted
+
+
+async def _main(args):
+    from database import init_storage, close_storage
+
+    if args.reset:
+        check_reset_allowed(args.confirm_reset)
+    init_storage()
+    try:
+        inserted = await seed_catalog(args.rows, reset=args.reset)
+        print(f"Додано товарів: {inserted}")
+    finally:
+        close_storage()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Наповнення бази синтетичним каталогом")
+    parser.add_argument("--rows", type=int, default=1000, help="скільки товарів додати (напр. 1000 або 100000)")
+    parser.add_argument("--reset", action="store_true", help="спершу видалити всі товари")
+    parser.add_argument("--confirm-reset", action="store_true",
+                        help="дозволити --reset для бази, назва якої не містить \"bench\"")
+    asyncio.run(_main(parser.parse_args()))
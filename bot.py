@@ -1,7 +1,13 @@
 import os # Додано для роботи зі змінними середовища
 import logging
 import re
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import csv
+import html
+import tempfile
+from itertools import groupby
+from datetime import datetime
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, InputFile
+from telegram.error import RetryAfter, BadRequest
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -11,13 +17,39 @@ from telegram.ext import (
     filters
 )
 
-# Імпортуємо psycopg2 для роботи з PostgreSQL
-import psycopg2
-from urllib.parse import urlparse # Допомагає розібрати URL бази даних
-
-# Ініціалізація бази даних
+# Ініціалізація сховища (PostgreSQL або SQLite) та асинхронний доступ до нього
 # Важливо: файл database.py повинен бути в тій же директорії, що і цей файл
-from database import init_db
+from database import (
+    init_storage, close_storage, storage_initialized, start_storage_init, retry_with_backoff, uses_read_cache,
+    read_cache_refresh_loop,
+    SQLITE_READ_CACHE_REFRESH_INTERVAL, prepare_catalog, load_catalog_snapshot, save_catalog_snapshot,
+    fetch_shoes_page, count_shoes, fetch_brands, fetch_sizes,
+    add_shoe, delete_shoes, bulk_insert_shoes, export_shoes, save_shoe_file_id, clear_shoe_file_id, save_image_status,
+    CATALOG_INDEX_ENABLED, CATALOG_INDEX_REFRESH_INTERVAL,
+    catalog_index_refresh_loop, normalize_search_query, pool_stats, replica_status
+)
+# Кеш відрендерених підписів і клавіатур
+from cache import RenderCache
+# Сесії користувачів з обмеженим розміром у пам'яті та збереженням у БД
+from sessions import session_store, empty_filters
+# Перевірка даних товару та розбір файлів імпорту
+from catalog_io import (
+    CATALOG_FIELDS, ImportResult, iter_records, export_to_csv, parse_size, parse_price, parse_image
+)
+# Компактне кодування callback_data кнопок
+from callbacks import (
+    encode_callback, decode_callback, brand_id, size_id, resolve_brand, resolve_size,
+    encode_cursor, decode_cursor
+)
+# Паралельна обробка оновлень різних користувачів зі строгим порядком для кожного користувача
+from update_processor import PerUserUpdateProcessor
+# Черга вихідних запитів до Bot API з лімітами Telegram і пріоритетами
+from send_scheduler import SendScheduler, PRIORITY_BULK, PRIORITY_BACKGROUND
+# Метрики затримок і помилок (ендпоінт Prometheus та команда /stats)
+from metrics import metrics, cache_collector, start_metrics_server, METRICS_PORT
+# Фонова перевірка зображень товарів (стан зображення зберігається в рядку товару)
+from image_checker import image_checker, is_image_fetch_error, IMAGE_CHECK_ENABLED
+from storage import IMAGE_BROKEN
 
 # --- Налаштування ---
 logging.basicConfig(
@@ -28,6 +60,36 @@ logger = logging.getLogger(__name__)
 
 # Константи
 ITEMS_PER_PAGE = 3
+# Режим відображення сторінки каталогу: "album" - товари з фото, що йдуть поспіль, одним альбомом
+# (send_media_group), "single" - кожен товар окремим повідомленням, як раніше
+PAGE_RENDER_MODE = os.environ.get('PAGE_RENDER_MODE', 'album')
+# Кількість товарів на сторінці адмін-списку та максимальна довжина назви/бренду в ньому
+ADMIN_LIST_PAGE_SIZE = 20
+ADMIN_LIST_NAME_LIMIT = 60
+# Кількість товарів на сторінці видалення
+REMOVE_PAGE_SIZE = 10
+# Як часто (у рядках) оновлювати повідомлення про прогрес імпорту
+IMPORT_PROGRESS_EVERY = 500
+# Скільки помилок по рядках показувати у звіті про імпорт
+IMPORT_MAX_REPORTED_ERRORS = 20
+# Діапазони цін у меню фільтра: (підпис, від включно, до не включно); None - без межі
+PRICE_RANGES = [
+    ("до 2000 грн", None, 2000),
+    ("2000–3000 грн", 2000, 3000),
+    ("3000–5000 грн", 3000, 5000),
+    ("від 5000 грн", 5000, None),
+]
+# Порядки сортування каталогу (ключі - як у storage.SORT_ORDERS)
+SORT_LABELS = {
+    "id": "За замовчуванням",
+    "newest": "Спочатку нові",
+    "price_asc": "Спочатку дешевші",
+    "price_desc": "Спочатку дорожчі",
+}
+# Скільки підписів товарів і клавіатур тримати в кеші рендерингу
+RENDER_CACHE_SIZE = int(os.environ.get('RENDER_CACHE_SIZE', '2048'))
+# Скільки оновлень (від різних користувачів) обробляються одночасно
+MAX_CONCURRENT_UPDATES = int(os.environ.get('MAX_CONCURRENT_UPDATES', '64'))
 
 # Отримуємо ID адміністратора та токен бота зі змінних середовища для безпеки
 # Це необхідно налаштувати на Render у розділі "Environment" для вашого сервісу
@@ -41,11 +103,19 @@ if not TOKEN:
 if YOUR_ADMIN_ID == 0:
     logger.warning("⚠️ YOUR_ADMIN_ID environment variable is not set or is 0. Admin features might not work.")
 
+# Режим отримання оновлень: "polling" (за замовчуванням) або "webhook"
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')
+# Налаштування вебхука (використовуються лише в режимі webhook)
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL')                    # Публічна адреса сервісу, напр. https://shoe-bot.onrender.com
+WEBHOOK_LISTEN = os.environ.get('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', os.environ.get('PORT', '8443')))  # Render передає порт у PORT
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET')              # Перевіряється в заголовку X-Telegram-Bot-Api-Secret-Token
+
+# Бот обробляє лише команди, текстові повідомлення адміна та натискання кнопок,
+# тому інші типи оновлень від Telegram не запитуємо
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
 
-# --- Глобальні змінні ---
-user_filters = {}
-adding_shoe_state = {}  # Для відстеження стану додавання нового товару
-user_menu_stack = {}    # Для відстеження історії меню
 
 # Емодзі для інтерфейсу
 EMOJI = {
@@ -53,26 +123,10 @@ EMOJI = {
     "admin": "🛠️", "add": "➕", "remove": "🗑️", "list": "📋",
     "back": "🔙", "apply": "✅", "reset": "❌", "cart": "🛒",
     "home": "🏠", "next": "➡️", "prev": "⬅️", "money": "💵",
-    "info": "ℹ️", "success": "✅", "error": "❌"
+    "info": "ℹ️", "success": "✅", "error": "❌", "import": "📥", "export": "📤", "search": "🔎",
+    "sort": "↕️"
 }
 
-# --- Допоміжна функція для отримання з'єднання з БД ---
-def get_db_connection():
-    """Повертає з'єднання з базою даних PostgreSQL."""
-    DATABASE_URL = os.environ.get('DATABASE_URL')
-    if not DATABASE_URL:
-        logger.error("DATABASE_URL environment variable is not set.")
-        raise ValueError("DATABASE_URL environment variable is not set. Cannot establish database connection.")
-    
-    result = urlparse(DATABASE_URL)
-    return psycopg2.connect(
-        database=result.path[1:],
-        user=result.username,
-        password=result.password,
-        host=result.hostname,
-        port=result.port
-    )
-
 # --- Функції бота ---
 
 # Функція для форматування розміру
@@ -85,59 +139,166 @@ def format_size(size):
     return str(size).rstrip('0').rstrip('.') if '.' in str(size) else str(size)
 
 
-# Відправка деталей товару
-async def send_shoe_details(context, chat_id, item):
-    shoe_id, name, brand, size, price, image_url = item
+# Готові підписи та клавіатури. Ключ - дані, з яких запис будується (дані товару, список
+# брендів чи розмірів), тож застарілі записи ніколи не повертаються, навіть якщо каталог
+# змінили напряму в БД чи з іншого екземпляра бота.
+render_cache = RenderCache(RENDER_CACHE_SIZE)
+metrics.add_collector(cache_collector({"render": render_cache}))
+
+# Підпис до товару
+def build_shoe_caption(item):
+    shoe_id, name, brand, size, price = item[:5]
     display_size = format_size(size)
     telegram_contact_url = "tg://resolve?domain=takar28"
-    
-    caption = (
-        f"{EMOJI['shoes']} <b>{name}</b>\n"
-        f"{EMOJI['brand']} <b>Бренд:</b> {brand}\n"
+
+    return (
+        f"{EMOJI['shoes']} <b>{html.escape(name)}</b>\n"
+        f"{EMOJI['brand']} <b>Бренд:</b> {html.escape(brand)}\n"
         f"{EMOJI['size']} <b>Розмір:</b> {display_size}\n"
         f"{EMOJI['money']} <b>Ціна:</b> {price} грн\n"
         f"🆔 ID: {shoe_id}\n\n"
         f"Для замовлення писати: <a href='{telegram_contact_url}'>@takar28</a>"
     )
 
-    try:
-        if image_url and image_url.startswith('http'):
-            return await context.bot.send_photo(
+def shoe_caption(item):
+    """Підпис до товару з кешу рендерингу."""
+    return render_cache.get_or_build(("caption",) + tuple(item[:5]), build_shoe_caption, item)
+
+def has_photo(item):
+    image_url = item[5]
+    if not (image_url and image_url.startswith('http')):
+        return False
+    # Фото, яке фонова перевірка визнала недоступним, не відправляємо, якщо Telegram ще не зберіг його копію
+    image_broken = len(item) > 7 and item[7] == IMAGE_BROKEN
+    return not image_broken or bool(item[6])
+
+# Відправка деталей товару
+async def send_shoe_details(context, chat_id, item):
+    shoe_id, name, brand, size, price, image_url = item[:6]
+    # file_id фото, яке Telegram вже зберіг після попередньої відправки (якщо є)
+    image_file_id = item[6] if len(item) > 6 else None
+    caption = shoe_caption(item)
+
+    if has_photo(item):
+        # Спочатку пробуємо file_id: Telegram не завантажує зображення повторно
+        if image_file_id:
+            try:
+                return await context.bot.send_photo(
+                    chat_id=chat_id,
+                    photo=image_file_id,
+                    caption=caption,
+                    parse_mode="HTML",
+                    rate_limit_args=PRIORITY_BULK
+                )
+            except RetryAfter:
+                raise  # Ліміт Telegram не означає, що file_id недійсний
+            except Exception as e:
+                logger.warning(f"file_id для товару ID:{shoe_id} більше не дійсний, відправляємо за URL: {e}")
+                await clear_shoe_file_id(shoe_id)
+
+        try:
+            message = await context.bot.send_photo(
                 chat_id=chat_id,
                 photo=image_url,
                 caption=caption,
-                parse_mode="HTML"
+                parse_mode="HTML",
+                rate_limit_args=PRIORITY_BULK
             )
-    except Exception as e:
-        logger.error(f"Помилка відправки фото {image_url}: {e}")
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=caption + f"\n\n{EMOJI['error']} Не вдалося завантажити зображення.",
-            parse_mode="HTML"
-        )
-        return None
+        except Exception as e:
+            logger.error(f"Помилка відправки фото {image_url}: {e}")
+            if is_image_fetch_error(e):
+                # Telegram не зміг завантажити фото за URL: наступні перегляди обійдуться без нього,
+                # доки фонова перевірка не підтвердить, що зображення знову доступне
+                try:
+                    await save_image_status(shoe_id, image_url, IMAGE_BROKEN)
+                except Exception as save_error:
+                    logger.warning(f"Не вдалося зберегти стан зображення товару ID:{shoe_id}: {save_error}")
+            elif isinstance(e, BadRequest):
+                # З помилки не видно, чи винне зображення - хай вирішить фонова перевірка
+                image_checker.submit(shoe_id, image_url)
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text=caption + f"\n\n{EMOJI['error']} Не вдалося завантажити зображення.",
+                parse_mode="HTML",
+                rate_limit_args=PRIORITY_BULK
+            )
+            return None
+
+        # Запам'ятовуємо file_id найбільшої версії фото для наступних відправок
+        if message and message.photo:
+            try:
+                await save_shoe_file_id(shoe_id, image_url, message.photo[-1].file_id)
+            except Exception as e:
+                logger.warning(f"Не вдалося зберегти file_id для товару ID:{shoe_id}: {e}")
+        return message
 
     return await context.bot.send_message(
         chat_id=chat_id,
         text=caption,
-        parse_mode="HTML"
+        parse_mode="HTML",
+        rate_limit_args=PRIORITY_BULK
     )
 
+# Відправка сторінки товарів альбомами
+async def send_shoe_photos(context, chat_id, items):
+    """Відправляє кілька товарів з фото одним send_media_group (один запит до Bot API)."""
+    media = [
+        InputMediaPhoto(
+            media=(item[6] if len(item) > 6 and item[6] else item[5]),
+            caption=shoe_caption(item),
+            parse_mode="HTML"
+        )
+        for item in items
+    ]
+    try:
+        messages = await context.bot.send_media_group(chat_id=chat_id, media=media, rate_limit_args=PRIORITY_BULK)
+    except Exception as e:
+        # Одне недоступне фото ламає весь альбом, тому відправляємо товари по одному
+        logger.warning(f"Не вдалося відправити альбом, відправляємо товари окремо: {e}")
+        for item in items:
+            await send_shoe_details(context, chat_id, item)
+        return
+
+    for item, message in zip(items, messages):
+        cached_file_id = item[6] if len(item) > 6 else None
+        if message.photo and not cached_file_id:
+            try:
+                await save_shoe_file_id(item[0], item[5], message.photo[-1].file_id)
+            except Exception as e:
+                logger.warning(f"Не вдалося зберегти file_id для товару ID:{item[0]}: {e}")
+
+async def send_shoes_album(context, chat_id, items):
+    """
+    Відправляє сторінку в порядку каталогу: товари з фото, що йдуть поспіль, - одним альбомом,
+    решту - окремими повідомленнями, одне за одним (інакше Telegram може доставити їх у
+    довільному порядку). Повідомлення з пагінацією відправляється лише після всіх товарів.
+    """
+    for photos, run in groupby(items, key=has_photo):
+        run = list(run)
+        # Альбом має містити щонайменше 2 фото, одне фото відправляємо звичайним способом
+        if photos and len(run) >= 2:
+            await send_shoe_photos(context, chat_id, run)
+        else:
+            for item in run:
+                await send_shoe_details(context, chat_id, item)
+
 # Зберігаємо поточне меню для користувача
-def save_menu_state(user_id, menu_name):
-    if user_id not in user_menu_stack:
-        user_menu_stack[user_id] = []
-    if not user_menu_stack[user_id] or user_menu_stack[user_id][-1] != menu_name:
-        user_menu_stack[user_id].append(menu_name)
+async def save_menu_state(user_id, menu_name):
+    session = await session_store.get(user_id)
+    if not session.menu or session.menu[-1] != menu_name:
+        session.push_menu(menu_name)
+        session_store.mark_dirty(session)
 
 # Повертаємося до попереднього меню
 async def back_to_previous_menu(update, context):
     query = update.callback_query
     user_id = query.from_user.id
 
-    if user_id in user_menu_stack and len(user_menu_stack[user_id]) > 1:
-        user_menu_stack[user_id].pop()
-        previous_menu = user_menu_stack[user_id][-1]
+    session = await session_store.get(user_id)
+    if len(session.menu) > 1:
+        session.menu.pop()
+        session_store.mark_dirty(session)
+        previous_menu = session.menu[-1]
 
         # Переходимо до попереднього меню
         if previous_menu == "main":
@@ -150,6 +311,10 @@ async def back_to_previous_menu(update, context):
             await show_brand_menu(update, context)
         elif previous_menu == "sizes":
             await show_size_menu(update, context)
+        elif previous_menu == "price":
+            await show_price_menu(update, context)
+        elif previous_menu == "sort":
+            await show_sort_menu(update, context)
         elif previous_menu == "remove_shoes":
             await remove_shoe_menu(update, context)
         elif previous_menu == "admin_list_shoes":
@@ -160,173 +325,356 @@ async def back_to_previous_menu(update, context):
 ### Меню користувача
 
 #### Головне меню
-async def show_main_menu(update, context):
-    save_menu_state(update.effective_user.id, "main")
-
+def build_main_menu_markup(is_admin):
     keyboard = [
-        [InlineKeyboardButton(f"{EMOJI['shoes']} Усі товари", callback_data="show_all")],
-        [InlineKeyboardButton(f"{EMOJI['filter']} Фільтр товарів", callback_data="filter_options")],
+        [InlineKeyboardButton(f"{EMOJI['shoes']} Усі товари", callback_data=encode_callback("show_all"))],
+        [InlineKeyboardButton(f"{EMOJI['filter']} Фільтр товарів", callback_data=encode_callback("filter_options"))],
+        [InlineKeyboardButton(f"{EMOJI['search']} Пошук", callback_data=encode_callback("search_prompt"))],
     ]
+    if is_admin:
+        keyboard.append([InlineKeyboardButton(f"{EMOJI['admin']} Адмін-панель", callback_data=encode_callback("admin_panel"))])
+    return InlineKeyboardMarkup(keyboard)
 
-    if update.effective_user.id == YOUR_ADMIN_ID:
-        keyboard.append([InlineKeyboardButton(f"{EMOJI['admin']} Адмін-панель", callback_data="admin_panel")])
+async def show_main_menu(update, context):
+    await save_menu_state(update.effective_user.id, "main")
+    is_admin = update.effective_user.id == YOUR_ADMIN_ID
+    reply_markup = render_cache.get_or_build(("main_menu", is_admin), build_main_menu_markup, is_admin)
 
     # Визначаємо, яке повідомлення редагувати/відповідати
     if update.callback_query:
         await update.callback_query.message.edit_text(
             "👟 <b>Магазин взуття DoomerSneakers</b>\nОберіть опцію:",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=reply_markup,
             parse_mode="HTML"
         )
     elif update.message:
         await update.message.reply_text(
             "👟 <b>Магазин взуття DoomerSneakers</b>\nОберіть опцію:",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=reply_markup,
             parse_mode="HTML"
         )
 
 ### Фільтри
 
 #### Меню фільтрів
-async def show_filter_menu(update, context):
-    save_menu_state(update.effective_user.id, "filters")
+def build_filter_menu_markup():
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{EMOJI['brand']} Фільтр по бренду", callback_data=encode_callback("brand_filter"))],
+        [InlineKeyboardButton(f"{EMOJI['size']} Фільтр по розміру", callback_data=encode_callback("size_filter"))],
+        [InlineKeyboardButton(f"{EMOJI['money']} Фільтр по ціні", callback_data=encode_callback("price_filter"))],
+        [InlineKeyboardButton(f"{EMOJI['sort']} Сортування", callback_data=encode_callback("sort_menu"))],
+        [InlineKeyboardButton(f"{EMOJI['apply']} Застосувати фільтри", callback_data=encode_callback("apply_filters"))],
+        [InlineKeyboardButton(f"{EMOJI['reset']} Скинути фільтри", callback_data=encode_callback("reset_filters"))],
+        [InlineKeyboardButton(f"{EMOJI['back']} Назад", callback_data=encode_callback("back_menu"))]
+    ])
+
+async def show_filter_menu(update, context, notice=None):
+    """notice - результат попередньої дії (напр. скидання фільтрів), показується над меню."""
+    await save_menu_state(update.effective_user.id, "filters")
     user_id = update.effective_user.id
 
-    if user_id not in user_filters:
-        user_filters[user_id] = {'brands': [], 'sizes': []}
-
-    filters_data = user_filters[user_id]
+    filters_data = (await session_store.get(user_id)).filters
     filter_info = ""
+    if filters_data.get('query'):
+        filter_info += f"{EMOJI['search']} <b>Пошук:</b> {html.escape(filters_data['query'])}\n"
     if filters_data['brands']:
         filter_info += f"{EMOJI['brand']} <b>Бренди:</b> {', '.join(filters_data['brands'])}\n"
     if filters_data['sizes']:
         formatted_sizes = [format_size(s) for s in filters_data['sizes']]
         filter_info += f"{EMOJI['size']} <b>Розміри:</b> {', '.join(formatted_sizes)}\n"
-
-    keyboard = [
-        [InlineKeyboardButton(f"{EMOJI['brand']} Фільтр по бренду", callback_data="brand_filter")],
-        [InlineKeyboardButton(f"{EMOJI['size']} Фільтр по розміру", callback_data="size_filter")],
-        [InlineKeyboardButton(f"{EMOJI['apply']} Застосувати фільтри", callback_data="apply_filters")],
-        [InlineKeyboardButton(f"{EMOJI['reset']} Скинути фільтри", callback_data="reset_filters")],
-        [InlineKeyboardButton(f"{EMOJI['back']} Назад", callback_data="back_menu")]
-    ]
+    if filters_data.get('price_min') is not None or filters_data.get('price_max') is not None:
+        filter_info += f"{EMOJI['money']} <b>Ціна:</b> {format_price_range(filters_data)}\n"
+    if filters_data.get('sort'):
+        filter_info += f"{EMOJI['sort']} <b>Сортування:</b> {SORT_LABELS.get(filters_data['sort'], filters_data['sort'])}\n"
 
     await update.callback_query.message.edit_text(
+        (f"{notice}\n\n" if notice else "") +
         f"⚙️ <b>Фільтрація товарів</b>\n\n"
         f"{'🔍 <b>Поточні фільтри:</b>\n' + filter_info if filter_info else ''}"
         f"Оберіть параметри фільтрації:",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=render_cache.get_or_build(("filter_menu",), build_filter_menu_markup),
         parse_mode="HTML"
     )
 
+#### Клавіатури фасетів (бренди, розміри)
+def build_facet_rows(action, values, value_id, label):
+    """
+    Для кожного значення фасета - пара готових кнопок (не обрано, обрано).
+    Результат кешується за самими значеннями фасета, а вибір користувача накладається в facet_markup.
+    """
+    rows = []
+    for value in values:
+        callback_data = encode_callback(action, value_id(value))
+        rows.append((
+            value,
+            InlineKeyboardButton(f"◻️ {label(value)}", callback_data=callback_data),
+            InlineKeyboardButton(f"✅ {label(value)}", callback_data=callback_data),
+        ))
+    return rows
+
+def facet_markup(rows, selected):
+    """Клавіатура фасета з позначеними обраними значеннями (лише вибір готових кнопок)."""
+    selected = set(selected)
+    keyboard = [[selected_button if value in selected else button] for value, button, selected_button in rows]
+    keyboard.append([InlineKeyboardButton(f"{EMOJI['back']} Назад", callback_data=encode_callback("back_menu"))])
+    return InlineKeyboardMarkup(keyboard)
+
 #### Меню брендів
-async def show_brand_menu(update, context):
-    save_menu_state(update.effective_user.id, "brands")
+async def show_brand_menu(update, context, notice=None):
+    """notice - результат попередньої дії (напр. застаріла кнопка), показується над меню."""
+    await save_menu_state(update.effective_user.id, "brands")
     user_id = update.effective_user.id
+    filters_data = (await session_store.get(user_id)).filters
 
-    conn = None
     try:
-        conn = get_db_connection() # Отримуємо з'єднання з PostgreSQL
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT brand FROM shoes ORDER BY brand") # Додав ORDER BY
-        brands = [row[0] for row in cursor.fetchall()]
+        brands = await fetch_brands()
+        rows = render_cache.get_or_build(("brands", tuple(brands)), build_facet_rows, "toggle_brand", brands, brand_id, str)
     except Exception as e:
         logger.error(f"Помилка при отриманні брендів: {e}")
         await update.callback_query.message.reply_text(f"{EMOJI['error']} Помилка завантаження брендів.")
-        brands = [] # Забезпечуємо порожній список, щоб не було помилок
-    finally:
-        if conn:
-            conn.close()
-
-    keyboard = []
-    for brand in brands:
-        is_selected = brand in user_filters.get(user_id, {}).get('brands', [])
-        text = f"{'✅' if is_selected else '◻️'} {brand}"
-        keyboard.append([InlineKeyboardButton(text, callback_data=f"toggle_brand_{brand}")])
-
-    keyboard.append([InlineKeyboardButton(f"{EMOJI['back']} Назад", callback_data="back_menu")])
+        rows = [] # Забезпечуємо порожній список, щоб не було помилок
 
+    message = f"{EMOJI['brand']} <b>Оберіть бренди:</b>"
+    if notice:
+        message = f"{notice}\n\n{message}"
     await update.callback_query.message.edit_text(
-        f"{EMOJI['brand']} <b>Оберіть бренди:</b>",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        message,
+        reply_markup=facet_markup(rows, filters_data['brands']),
         parse_mode="HTML"
     )
 
 #### Меню розмірів
-async def show_size_menu(update, context):
-    save_menu_state(update.effective_user.id, "sizes")
+def size_label(size):
+    return f"Розмір {format_size(size)}"
+
+async def show_size_menu(update, context, notice=None):
+    """notice - результат попередньої дії (напр. застаріла кнопка), показується над меню."""
+    await save_menu_state(update.effective_user.id, "sizes")
     user_id = update.effective_user.id
+    filters_data = (await session_store.get(user_id)).filters
 
-    conn = None
     try:
-        conn = get_db_connection() # Отримуємо з'єднання з PostgreSQL
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT size FROM shoes ORDER BY size")
-        sizes = [row[0] for row in cursor.fetchall()]
+        sizes = await fetch_sizes()
+        # Для порівняння розмірів у фільтрі використовуємо float
+        rows = render_cache.get_or_build(
+            ("sizes", tuple(sizes)),
+            lambda: build_facet_rows("toggle_size", [float(size) for size in sizes], size_id, size_label)
+        )
     except Exception as e:
         logger.error(f"Помилка при отриманні розмірів: {e}")
         await update.callback_query.message.reply_text(f"{EMOJI['error']} Помилка завантаження розмірів.")
-        sizes = []
-    finally:
-        if conn:
-            conn.close()
+        rows = []
+
+    message = f"{EMOJI['size']} <b>Оберіть розміри:</b>"
+    if notice:
+        message = f"{notice}\n\n{message}"
+    await update.callback_query.message.edit_text(
+        message,
+        reply_markup=facet_markup(rows, filters_data['sizes']),
+        parse_mode="HTML"
+    )
+
+#### Діапазон цін у вигляді тексту
+def format_price_range(filters_data):
+    price_min, price_max = filters_data.get('price_min'), filters_data.get('price_max')
+    if price_min is None:
+        return f"до {price_max} грн"
+    if price_max is None:
+        return f"від {price_min} грн"
+    return f"{price_min}–{price_max} грн"
+
+#### Меню діапазонів цін
+async def show_price_menu(update, context, notice=None):
+    """notice - результат попередньої дії (напр. застаріла кнопка), показується над меню."""
+    await save_menu_state(update.effective_user.id, "price")
+    filters_data = (await session_store.get(update.effective_user.id)).filters
 
     keyboard = []
-    for size_val in sizes:
-        # Для порівняння розмірів у фільтрі використовуємо float
-        is_selected = float(size_val) in user_filters.get(user_id, {}).get('sizes', [])
-        display_size = format_size(size_val)
-        text = f"{'✅' if is_selected else '◻️'} Розмір {display_size}"
-        keyboard.append([InlineKeyboardButton(text, callback_data=f"toggle_size_{size_val}")])
+    for i, (label, price_min, price_max) in enumerate(PRICE_RANGES):
+        is_selected = (filters_data.get('price_min'), filters_data.get('price_max')) == (price_min, price_max)
+        keyboard.append([InlineKeyboardButton(f"{'✅' if is_selected else '◻️'} {label}", callback_data=encode_callback("set_price", i))])
+    keyboard.append([InlineKeyboardButton(f"{EMOJI['back']} Назад", callback_data=encode_callback("back_menu"))])
+
+    message = f"{EMOJI['money']} <b>Оберіть діапазон цін:</b>\n(повторне натискання скасовує вибір)"
+    if notice:
+        message = f"{notice}\n\n{message}"
+    await update.callback_query.message.edit_text(
+        message,
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode="HTML"
+    )
+
+#### Меню сортування
+async def show_sort_menu(update, context, notice=None):
+    """notice - результат попередньої дії (напр. застаріла кнопка), показується над меню."""
+    await save_menu_state(update.effective_user.id, "sort")
+    filters_data = (await session_store.get(update.effective_user.id)).filters
+    current_sort = filters_data.get('sort') or "id"
 
-    keyboard.append([InlineKeyboardButton(f"{EMOJI['back']} Назад", callback_data="back_menu")])
+    keyboard = [
+        [InlineKeyboardButton(f"{'🔘' if key == current_sort else '⚪'} {label}", callback_data=encode_callback("set_sort", i))]
+        for i, (key, label) in enumerate(SORT_LABELS.items())
+    ]
+    keyboard.append([InlineKeyboardButton(f"{EMOJI['back']} Назад", callback_data=encode_callback("back_menu"))])
 
+    message = f"{EMOJI['sort']} <b>Оберіть порядок сортування:</b>\n(під час пошуку товари впорядковані за релевантністю)"
+    if notice:
+        message = f"{notice}\n\n{message}"
     await update.callback_query.message.edit_text(
-        f"{EMOJI['size']} <b>Оберіть розміри:</b>",
+        message,
         reply_markup=InlineKeyboardMarkup(keyboard),
         parse_mode="HTML"
     )
 
-#### Увімкнення/вимкнення фільтра
-async def toggle_filter(update, context):
+#### Вибір діапазону цін
+async def set_price_range(update, context, range_index):
     query = update.callback_query
-    user_id = query.from_user.id
-    data = query.data
+    if not 0 <= range_index < len(PRICE_RANGES):
+        # button_handler вже відповів на запит, тож повідомлення показуємо в самому меню
+        await show_price_menu(update, context, notice=f"{EMOJI['error']} Невідомий діапазон цін.")
+        return
 
-    if user_id not in user_filters:
-        user_filters[user_id] = {'brands': [], 'sizes': []}
+    session = await session_store.get(query.from_user.id)
+    filters_data = session.filters
+    _, price_min, price_max = PRICE_RANGES[range_index]
+    if (filters_data.get('price_min'), filters_data.get('price_max')) == (price_min, price_max):
+        filters_data.pop('price_min', None)
+        filters_data.pop('price_max', None)
+    else:
+        filters_data['price_min'], filters_data['price_max'] = price_min, price_max
+    session_store.mark_dirty(session)
+    await show_price_menu(update, context)
 
-    if data.startswith("toggle_brand_"):
-        brand = data.replace("toggle_brand_", "")
-        if brand in user_filters[user_id]['brands']:
-            user_filters[user_id]['brands'].remove(brand)
-        else:
-            user_filters[user_id]['brands'].append(brand)
-        await show_brand_menu(update, context)
+#### Вибір порядку сортування
+async def set_sort_order(update, context, sort_index):
+    query = update.callback_query
+    sort_keys = list(SORT_LABELS)
+    if not 0 <= sort_index < len(sort_keys):
+        # button_handler вже відповів на запит, тож повідомлення показуємо в самому меню
+        await show_sort_menu(update, context, notice=f"{EMOJI['error']} Невідомий порядок сортування.")
+        return
 
-    elif data.startswith("toggle_size_"):
-        size_str = data.replace("toggle_size_", "")
-        try:
-            size_float = float(size_str)
-            if size_float in user_filters[user_id]['sizes']:
-                user_filters[user_id]['sizes'].remove(size_float)
-            else:
-                user_filters[user_id]['sizes'].append(size_float)
-            await show_size_menu(update, context)
-        except ValueError:
-            logger.error(f"Невірний формат розміру в callback_data: {size_str}")
-            await query.answer(f"{EMOJI['error']} Помилка формату розміру.", show_alert=True)
+    session = await session_store.get(query.from_user.id)
+    sort = sort_keys[sort_index]
+    # Порядок за замовчуванням не зберігаємо, щоб не роздувати сесію
+    if sort == "id":
+        session.filters.pop('sort', None)
+    else:
+        session.filters['sort'] = sort
+    session_store.mark_dirty(session)
+    await show_sort_menu(update, context)
+
+#### Увімкнення/вимкнення фільтра по бренду
+async def toggle_brand_filter(update, context, value_id):
+    query = update.callback_query
+    session = await session_store.get(query.from_user.id)
+    filters_data = session.filters
+
+    # Шукаємо бренд за id серед брендів каталогу та вже обраних (обраний бренд міг зникнути з каталогу)
+    try:
+        brands = await fetch_brands()
+    except Exception as e:
+        logger.error(f"Помилка при отриманні брендів: {e}")
+        brands = []
+    brand = resolve_brand(value_id, filters_data['brands'] + list(brands))
+    if brand is None:
+        # button_handler вже відповів на запит, тож повідомлення показуємо в самому меню
+        await show_brand_menu(update, context, notice=f"{EMOJI['error']} Цього бренду вже немає в каталозі.")
+        return
+    if brand in filters_data['brands']:
+        filters_data['brands'].remove(brand)
+    else:
+        filters_data['brands'].append(brand)
+    session_store.mark_dirty(session)
+    await show_brand_menu(update, context)
+
+#### Увімкнення/вимкнення фільтра по розміру
+async def toggle_size_filter(update, context, value_id):
+    query = update.callback_query
+    session = await session_store.get(query.from_user.id)
+    filters_data = session.filters
+
+    try:
+        sizes = await fetch_sizes()
+    except Exception as e:
+        logger.error(f"Помилка при отриманні розмірів: {e}")
+        sizes = []
+    size = resolve_size(value_id, filters_data['sizes'] + list(sizes))
+    if size is None:
+        # button_handler вже відповів на запит, тож повідомлення показуємо в самому меню
+        await show_size_menu(update, context, notice=f"{EMOJI['error']} Цього розміру вже немає в каталозі.")
+        return
+    if size in filters_data['sizes']:
+        filters_data['sizes'].remove(size)
+    else:
+        filters_data['sizes'].append(size)
+    session_store.mark_dirty(session)
+    await show_size_menu(update, context)
 
 #### Скидання фільтрів
 async def reset_filters(update, context):
-    user_id = update.effective_user.id
-    user_filters[user_id] = {'brands': [], 'sizes': []}
-    await show_filter_menu(update, context)
-    await update.callback_query.answer("Фільтри скинуто!", show_alert=True)
+    session = await session_store.get(update.effective_user.id)
+    sort = session.filters.get('sort')
+    session.filters = empty_filters()
+    # Сортування - не фільтр, тому зберігаємо обраний порядок
+    if sort:
+        session.filters['sort'] = sort
+    session_store.mark_dirty(session)
+    # button_handler вже відповів на запит, тож повідомлення показуємо в самому меню
+    await show_filter_menu(update, context, notice=f"{EMOJI['success']} Фільтри скинуто!")
+
+### Пошук
+
+#### Підказка для пошуку
+async def show_search_prompt(update, context):
+    keyboard = [[InlineKeyboardButton(f"{EMOJI['back']} Назад", callback_data=encode_callback("back_menu"))]]
+    await update.callback_query.message.edit_text(
+        f"{EMOJI['search']} <b>Пошук товарів</b>\n\n"
+        f"Напишіть у чат назву або бренд (можна частину слова), наприклад: <code>nike air</code>.\n"
+        f"Також можна використати команду /search.",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode="HTML"
+    )
+
+#### Пошук за назвою та брендом (результати показуються тією ж сторінкою каталогу)
+async def search_shoes(update, context, text):
+    query_text = normalize_search_query(text)
+    if not query_text:
+        await update.message.reply_text(f"{EMOJI['search']} Введіть назву або бренд для пошуку, наприклад: /search nike air")
+        return
+
+    session = await session_store.get(update.effective_user.id)
+    session.filters = empty_filters()
+    session.filters['query'] = query_text
+    session_store.mark_dirty(session)
+    await show_shoes_page(update, context, page=0)
+
+#### Обробка команди /search
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await search_shoes(update, context, " ".join(context.args or []))
+
+#### Обробка текстових повідомлень: крок додавання товару (для адміна) або пошук
+async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id == YOUR_ADMIN_ID:
+        session = await session_store.get(update.effective_user.id)
+        if session.adding:
+            await add_shoe_message_handler(update, context)
+            return
+    await search_shoes(update, context, update.message.text)
 
 ### Адмін-панель
 
 #### Адмін-меню
+def build_admin_menu_markup():
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{EMOJI['add']} Додати товар", callback_data=encode_callback("add_shoe_prompt"))],
+        [InlineKeyboardButton(f"{EMOJI['remove']} Видалити товар", callback_data=encode_callback("remove_shoe_menu"))],
+        [InlineKeyboardButton(f"{EMOJI['list']} Список товарів", callback_data=encode_callback("admin_list_shoes"))],
+        [InlineKeyboardButton(f"{EMOJI['import']} Імпорт товарів з файлу", callback_data=encode_callback("import_help"))],
+        [InlineKeyboardButton(f"{EMOJI['export']} Експорт каталогу (CSV)", callback_data=encode_callback("export_shoes"))],
+        [InlineKeyboardButton(f"{EMOJI['back']} Головне меню", callback_data=encode_callback("back_menu"))]
+    ])
+
 async def show_admin_menu(update, context):
     if update.callback_query:
         user_id = update.callback_query.from_user.id
@@ -345,25 +693,19 @@ async def show_admin_menu(update, context):
             await update.message.reply_text("У вас немає доступу до цієї функції.")
         return
 
-    save_menu_state(user_id, "admin")
-
-    keyboard = [
-        [InlineKeyboardButton(f"{EMOJI['add']} Додати товар", callback_data="add_shoe_prompt")],
-        [InlineKeyboardButton(f"{EMOJI['remove']} Видалити товар", callback_data="remove_shoe_menu")],
-        [InlineKeyboardButton(f"{EMOJI['list']} Список товарів", callback_data="admin_list_shoes")],
-        [InlineKeyboardButton(f"{EMOJI['back']} Головне меню", callback_data="back_menu")]
-    ]
+    await save_menu_state(user_id, "admin")
+    reply_markup = render_cache.get_or_build(("admin_menu",), build_admin_menu_markup)
 
     if update.callback_query:
         await message_to_edit.edit_text(
             f"{EMOJI['admin']} <b>Адмін-панель</b>\nОберіть дію:",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=reply_markup,
             parse_mode="HTML"
         )
     elif update.message:
         await message_to_edit.reply_text(
             f"{EMOJI['admin']} <b>Адмін-панель</b>\nОберіть дію:",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=reply_markup,
             parse_mode="HTML"
         )
 
@@ -375,7 +717,9 @@ async def add_shoe_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     user_id = update.effective_user.id
-    adding_shoe_state[user_id] = {'step': 1, 'data': {}}
+    session = await session_store.get(user_id)
+    session.adding = {'step': 1, 'data': {}}
+    session_store.mark_dirty(session)
     
     # Видаляємо попереднє повідомлення адмін-меню, якщо воно було викликано з кнопки
     if update.callback_query:
@@ -393,18 +737,18 @@ async def add_shoe_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
 #### Обробник повідомлень для додавання товару
 async def add_shoe_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
+    session = await session_store.get(user_id)
 
     # Перевірка, чи користувач є адміном і чи він у процесі додавання товару
-    if user_id != YOUR_ADMIN_ID or user_id not in adding_shoe_state:
+    if user_id != YOUR_ADMIN_ID or not session.adding:
         # Ігноруємо повідомлення або відповідаємо, якщо це не адмін
         if user_id != YOUR_ADMIN_ID:
             await update.message.reply_text("У вас немає доступу до цієї функції. Будь ласка, використовуйте кнопки меню.")
         return
 
-    state = adding_shoe_state[user_id]
+    state = session.adding
     text = update.message.text
 
-    conn = None # Ініціалізуємо conn тут
     try:
         if state['step'] == 1:
             state['data']['name'] = text
@@ -416,87 +760,195 @@ async def add_shoe_message_handler(update: Update, context: ContextTypes.DEFAULT
             await update.message.reply_text("Введіть <b>розмір</b> товару (наприклад 42.5 або 43):", parse_mode="HTML")
         elif state['step'] == 3:
             try:
-                text = text.replace(',', '.').strip()
-                size = float(text)
-                if size <= 0:
-                    raise ValueError("Розмір повинен бути додатнім числом.")
-                state['data']['size'] = size
+                state['data']['size'] = parse_size(text)
                 state['step'] = 4
                 await update.message.reply_text("Введіть <b>ціну</b> товару (ціле число):", parse_mode="HTML")
             except ValueError as e:
                 await update.message.reply_text(f"{EMOJI['error']} Некоректний розмір. Будь ласка, введіть число (наприклад 42.5): {str(e)}")
         elif state['step'] == 4:
             try:
-                price = int(text)
-                if price <= 0:
-                    raise ValueError("Ціна повинна бути додатнім числом.")
-                state['data']['price'] = price
+                state['data']['price'] = parse_price(text)
                 state['step'] = 5
                 await update.message.reply_text("Надішліть <b>URL зображення</b> товару (або напишіть 'ні', якщо немає):", parse_mode="HTML")
             except ValueError as e:
                 await update.message.reply_text(f"{EMOJI['error']} Некоректна ціна. Будь ласка, введіть ціле число: {str(e)}")
         elif state['step'] == 5:
-            image_url = text if text.lower() != 'ні' else None
-            state['data']['image'] = image_url
+            state['data']['image'] = parse_image(text)
 
-            conn = get_db_connection() # Отримуємо з'єднання з PostgreSQL
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                # Змінено ? на %s
-                "INSERT INTO shoes (name, brand, size, price, image) VALUES (%s, %s, %s, %s, %s)",
-                (state['data']['name'], state['data']['brand'], state['data']['size'],
-                 state['data']['price'], state['data']['image'])
+            # Запит виконується у пулі з'єднань; при помилці транзакція відкочується автоматично.
+            # add_shoe також оновлює індекс і кеші каталогу.
+            shoe_id = await add_shoe(
+                state['data']['name'], state['data']['brand'], state['data']['size'],
+                state['data']['price'], state['data']['image']
             )
-            conn.commit()
+            # Зображення перевіряється у фоні; якщо воно недоступне, бот повідомить адміна
+            image_checker.submit(shoe_id, state['data']['image'], notify_chat_id=update.effective_chat.id)
             await update.message.reply_text(f"{EMOJI['success']} Товар успішно додано!")
             logger.info(f"Товар додано: {state['data']}")
-            del adding_shoe_state[user_id]  # Завершуємо стан додавання
+            session.adding = None  # Завершуємо стан додавання
             
             # Після додавання товару, повертаємося до адмін-меню
             await show_admin_menu(update, context) # Це буде викликано через update.message
 
     except Exception as e:
-        if conn: conn.rollback() # Відкат у випадку помилки
         await update.message.reply_text(f"{EMOJI['error']} Виникла внутрішня помилка при додаванні товару: {e}")
         logger.error(f"Помилка при додаванні товару: {e}")
     finally:
-        if conn: conn.close()
+        # Кожен крок змінює стан майстра, тож сесію потрібно зберегти. Позначаємо її після
+        # останньої зміни: якщо запис у БД відбудеться під час await, а adding обнулиться вже
+        # після нього, у БД лишився б крок 5, і наступний текст адміна додав би товар ще раз
+        session_store.mark_dirty(session)
 
 
-#### Меню видалення товарів (список з кнопками видалення)
-async def remove_shoe_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+#### Інструкція з імпорту товарів
+async def show_import_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != YOUR_ADMIN_ID:
         await update.callback_query.answer("У вас немає доступу до цієї функції.", show_alert=True)
         return
 
-    save_menu_state(update.effective_user.id, "remove_shoes")
+    keyboard = [[InlineKeyboardButton(f"{EMOJI['back']} Назад", callback_data=encode_callback("back_menu"))]]
+    await update.callback_query.message.edit_text(
+        f"{EMOJI['import']} <b>Імпорт товарів з файлу</b>\n\n"
+        f"Надішліть документ у форматі CSV (з заголовком), JSON (масив об'єктів) або JSON Lines "
+        f"з полями: <code>{','.join(CATALOG_FIELDS)}</code>.\n"
+        f"Розмір - додатне число (наприклад 42.5), ціна - ціле додатне число, image можна залишити порожнім.\n\n"
+        f"Рядки з помилками буде пропущено, решту буде додано однією транзакцією.",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode="HTML"
+    )
+
+#### Імпорт товарів з документа (CSV/JSON)
+async def import_shoes_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != YOUR_ADMIN_ID:
+        await update.message.reply_text("У вас немає доступу до цієї функції.")
+        return
+
+    document = update.message.document
+    file_name = document.file_name or ""
+    status = await update.message.reply_text(f"{EMOJI['import']} Завантажую файл <b>{html.escape(file_name)}</b>...", parse_mode="HTML")
 
-    conn = None
+    result = ImportResult()
     try:
-        conn = get_db_connection() # Отримуємо з'єднання з PostgreSQL
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, brand, size, price FROM shoes ORDER BY id DESC")
-        shoes = cursor.fetchall()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Файл завантажується на диск, а потім читається потоково, рядок за рядком
+            path = os.path.join(tmp_dir, "import")
+            tg_file = await context.bot.get_file(document.file_id)
+            await tg_file.download_to_drive(path)
+
+            for row_number, record in enumerate(iter_records(path, file_name), start=1):
+                result.add(row_number, record)
+                if row_number % IMPORT_PROGRESS_EVERY == 0:
+                    await status.edit_text(f"⏳ Перевірено рядків: {row_number}...")
+
+        inserted = await bulk_insert_shoes(result.rewind()) if result.valid else 0
+        if inserted:
+            image_checker.wake()  # Нові товари ще не перевірені - вони першими потраплять у чергу
+    except (ValueError, csv.Error, UnicodeDecodeError) as e:
+        # json.JSONDecodeError - підклас ValueError
+        await status.edit_text(f"{EMOJI['error']} Не вдалося прочитати файл: {e}")
+        return
+    except Exception as e:
+        logger.error(f"Помилка імпорту товарів з файлу {file_name}: {e}")
+        await status.edit_text(f"{EMOJI['error']} Помилка імпорту, жоден товар не додано: {e}")
+        return
+    finally:
+        result.close()
+
+    logger.info(f"Імпорт з файлу {file_name}: додано {inserted}, помилок {len(result.errors)}")
+    report = [f"{EMOJI['success']} Імпорт завершено. Додано товарів: <b>{inserted}</b>."]
+    if result.errors:
+        report.append(f"{EMOJI['error']} Пропущено записів з помилками: <b>{len(result.errors)}</b>")
+        for row_number, error in result.errors[:IMPORT_MAX_REPORTED_ERRORS]:
+            report.append(f"• запис {row_number}: {error}")
+        if len(result.errors) > IMPORT_MAX_REPORTED_ERRORS:
+            report.append("…")
+    # Опис помилок може містити довільний текст з файлу, тому надсилаємо без HTML-розмітки в помилках
+    await status.edit_text("\n".join(report[:2]), parse_mode="HTML")
+    if len(report) > 2:
+        await update.message.reply_text("\n".join(report[2:]))
+
+#### Експорт каталогу в CSV (команда /export або кнопка в адмін-панелі)
+async def export_catalog(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != YOUR_ADMIN_ID:
+        if update.callback_query:
+            await update.callback_query.answer("У вас немає доступу до цієї функції.", show_alert=True)
+        else:
+            await update.message.reply_text("У вас немає доступу до цієї функції.")
+        return
+
+    chat_id = update.effective_chat.id
+    status = await context.bot.send_message(chat_id=chat_id, text=f"{EMOJI['export']} Формую файл каталогу...")
+    file_name = f"shoes_{datetime.now():%Y%m%d_%H%M}.csv"
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Рядки читаються серверним курсором пакетами і одразу пишуться у файл на диску
+            path = os.path.join(tmp_dir, file_name)
+            total = await export_to_csv(path, export_shoes)
+            with open(path, "rb") as f:
+                # read_file_handle=False: файл вивантажується з диска частинами, а не читається в пам'ять цілком
+                await context.bot.send_document(
+                    chat_id=chat_id,
+                    document=InputFile(f, filename=file_name, read_file_handle=False),
+                    caption=f"{EMOJI['success']} Експортовано товарів: {total}",
+                    rate_limit_args=PRIORITY_BACKGROUND
+                )
+        await status.delete()
+    except Exception as e:
+        logger.error(f"Помилка експорту каталогу: {e}")
+        await status.edit_text(f"{EMOJI['error']} Помилка експорту каталогу: {e}")
+
+#### Меню видалення товарів (посторінковий список з множинним вибором)
+async def remove_shoe_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, page=0, after_id=None, before_id=None, notice=None):
+    """notice - результат попередньої дії (напр. видалення), показується над списком."""
+    if update.effective_user.id != YOUR_ADMIN_ID:
+        await update.callback_query.answer("У вас немає доступу до цієї функції.", show_alert=True)
+        return
+
+    await save_menu_state(update.effective_user.id, "remove_shoes")
+    session = await session_store.get(update.effective_user.id)
+
+    # Загальна кількість тут не потрібна, тому перерисовка коштує один запит сторінки
+    shoes, has_prev, has_next = [], False, False
+    try:
+        shoes, has_more = await fetch_shoes_page({}, REMOVE_PAGE_SIZE, after_id=after_id, before_id=before_id)
+        if before_id is not None:
+            has_prev, has_next = has_more, True
+            if not has_prev:
+                page = 0
+        else:
+            has_prev, has_next = page > 0, has_more
     except Exception as e:
         logger.error(f"Помилка при отриманні списку товарів для видалення: {e}")
         await update.callback_query.message.reply_text(f"{EMOJI['error']} Помилка завантаження товарів для видалення.")
-        shoes = []
-    finally:
-        if conn:
-            conn.close()
+
+    # Поточна сторінка (номер і курсор): після перемикання чекбокса перерисовуємо ту саму сторінку
+    view = (page, encode_cursor(after_id, before_id))
 
     keyboard = []
-    if not shoes:
+    if not shoes and not session.selected:
         message = f"{EMOJI['info']} Наразі немає товарів для видалення."
     else:
-        message = f"{EMOJI['remove']} <b>Оберіть товар для видалення:</b>"
-        for shoe_id, name, brand, size, price in shoes:
+        message = (
+            f"{EMOJI['remove']} <b>Оберіть товари для видалення</b> (сторінка {page+1}).\n"
+            f"Обрано: <b>{len(session.selected)}</b>"
+        )
+        for shoe_id, name, brand, size, price, *_ in shoes:
             display_size = format_size(size)
-            btn_text = f"🗑️ {name} ({brand}, {display_size}, {price} грн) - ID: {shoe_id}"
-            keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"remove_{shoe_id}")])
-
-    keyboard.append([InlineKeyboardButton(f"{EMOJI['back']} Назад", callback_data="back_menu")])
+            mark = '✅' if shoe_id in session.selected else '◻️'
+            btn_text = f"{mark} {name} ({brand}, {display_size}, {price} грн) - ID: {shoe_id}"
+            keyboard.append([InlineKeyboardButton(btn_text, callback_data=encode_callback("remove_toggle", shoe_id, *view))])
+    if notice:
+        message = f"{notice}\n\n{message}"
+
+    nav_buttons = pagination_buttons("remove_page", page, shoes, has_prev, has_next)
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+    if session.selected:
+        keyboard.append([
+            InlineKeyboardButton(f"{EMOJI['remove']} Видалити обрані ({len(session.selected)})", callback_data=encode_callback("remove_delete")),
+            InlineKeyboardButton(f"{EMOJI['reset']} Скасувати вибір", callback_data=encode_callback("remove_clear")),
+        ])
+    keyboard.append([InlineKeyboardButton(f"{EMOJI['back']} Назад", callback_data=encode_callback("back_menu"))])
 
     await update.callback_query.message.edit_text(
         message,
@@ -504,103 +956,150 @@ async def remove_shoe_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode="HTML"
     )
 
-#### Видалення товару
-async def remove_shoe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+#### Вибір товару для видалення (чекбокс)
+async def toggle_remove_selection(update: Update, context: ContextTypes.DEFAULT_TYPE, shoe_id, page=0, cursor=0):
     if update.effective_user.id != YOUR_ADMIN_ID:
         await update.callback_query.answer("У вас немає доступу до цієї функції.", show_alert=True)
         return
 
-    query = update.callback_query
-    shoe_id = int(query.data.replace("remove_", ""))
+    session = await session_store.get(update.effective_user.id)
+    if shoe_id in session.selected:
+        session.selected.remove(shoe_id)
+    else:
+        session.selected.append(shoe_id)
+    session_store.mark_dirty(session)
+
+    page, after_id, before_id = decode_cursor(page, cursor)
+    await remove_shoe_menu(update, context, page, after_id=after_id, before_id=before_id)
 
-    conn = None
+#### Видалення обраних товарів
+async def remove_selected_shoes(update: Update, context: ContextTypes.DEFAULT_TYPE, clear=False):
+    if update.effective_user.id != YOUR_ADMIN_ID:
+        await update.callback_query.answer("У вас немає доступу до цієї функції.", show_alert=True)
+        return
+
+    session = await session_store.get(update.effective_user.id)
+    shoe_ids = list(session.selected)
+
+    if clear or not shoe_ids:
+        session.selected = []
+        session_store.mark_dirty(session)
+        await remove_shoe_menu(update, context)
+        return
+
+    # button_handler уже відповів на натискання, тому результат показуємо в самому оновленому списку
     try:
-        conn = get_db_connection() # Отримуємо з'єднання з PostgreSQL
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM shoes WHERE id = %s", (shoe_id,)) # Змінено ? на %s
-        conn.commit()
-        await query.answer(f"{EMOJI['success']} Товар ID:{shoe_id} успішно видалено!", show_alert=True)
-        logger.info(f"Товар ID:{shoe_id} видалено.")
+        # Одна транзакція: DELETE ... WHERE id = ANY(...)
+        deleted = await delete_shoes(shoe_ids)
+        session.selected = []
+        session_store.mark_dirty(session)
+        notice = f"{EMOJI['success']} Видалено товарів: <b>{deleted}</b>"
+        logger.info(f"Товари видалено: {shoe_ids}")
     except Exception as e:
-        if conn: conn.rollback()
-        await query.answer(f"{EMOJI['error']} Помилка при видаленні товару: {e}", show_alert=True)
-        logger.error(f"Помилка при видаленні товару ID:{shoe_id}: {e}")
-    finally:
-        if conn:
-            conn.close()
+        notice = f"{EMOJI['error']} Помилка при видаленні товарів: {html.escape(str(e))}"
+        logger.error(f"Помилка при видаленні товарів {shoe_ids}: {e}")
 
-    await remove_shoe_menu(update, context) # Оновлюємо список після видалення
+    await remove_shoe_menu(update, context, notice=notice) # Оновлюємо список після видалення
+
+### Пагінація та відображення товарів
+
+async def load_page(filters_data, page_size, page=0, after_id=None, before_id=None, cursor_price=None):
+    """
+    Завантажує одну сторінку товарів за курсором і кешовану загальну кількість.
+    Повертає (items, current_page, total_pages, total_items, has_prev, has_next).
+    """
+    items, has_more = await fetch_shoes_page(
+        filters_data, page_size, after_id=after_id, before_id=before_id, cursor_price=cursor_price
+    )
+    if before_id is not None:
+        has_prev, has_next = has_more, True
+        if not has_prev:
+            page = 0  # Дійшли до початку каталогу
+    else:
+        has_prev, has_next = page > 0, has_more
+    total_items = await count_shoes(filters_data)
 
-#### Список товарів (для адміна, без пагінації, простіший список)
-async def list_shoes(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    total_pages = (total_items + page_size - 1) // page_size if total_items > 0 else 1
+    current_page = max(0, min(page, total_pages - 1))
+    return items, current_page, total_pages, total_items, has_prev, has_next
+
+def pagination_buttons(action, current_page, items, has_prev, has_next, with_price=False):
+    """
+    Кнопки «Попередні»/«Наступні» з курсорами крайніх товарів сторінки.
+    action - дія пагінації з callbacks.ACTION_CODES, однаковий формат для каталогу та адмін-списків.
+    with_price - додати в курсор ціну крайнього товару (сортування за ціною): тоді сусідня
+    сторінка знаходиться, навіть якщо цей товар тим часом видалять.
+    """
+    def cursor_args(item, **cursor):
+        return (encode_cursor(**cursor), item[4]) if with_price else (encode_cursor(**cursor),)
+
+    buttons = []
+    if has_prev:
+        if items:
+            prev_data = encode_callback(action, current_page - 1, *cursor_args(items[0], before_id=items[0][0]))
+        else:
+            prev_data = encode_callback(action, 0)
+        buttons.append(InlineKeyboardButton(f"{EMOJI['prev']} Попередні", callback_data=prev_data))
+    if items and has_next:
+        next_data = encode_callback(action, current_page + 1, *cursor_args(items[-1], after_id=items[-1][0]))
+        buttons.append(InlineKeyboardButton(f"Наступні {EMOJI['next']}", callback_data=next_data))
+    return buttons
+
+#### Список товарів (для адміна, посторінково)
+async def list_shoes(update: Update, context: ContextTypes.DEFAULT_TYPE, page=0, after_id=None, before_id=None):
     if update.effective_user.id != YOUR_ADMIN_ID:
         await update.callback_query.answer("У вас немає доступу до цієї функції.", show_alert=True)
         return
 
-    save_menu_state(update.effective_user.id, "admin_list_shoes")
+    await save_menu_state(update.effective_user.id, "admin_list_shoes")
 
-    conn = None
+    shoes = []
+    current_page, total_pages, total_items, has_prev, has_next = 0, 1, 0, False, False
     try:
-        conn = get_db_connection() # Отримуємо з'єднання з PostgreSQL
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, brand, size, price FROM shoes ORDER BY id") # Додав ORDER BY
-        shoes = cursor.fetchall()
+        shoes, current_page, total_pages, total_items, has_prev, has_next = await load_page(
+            {}, ADMIN_LIST_PAGE_SIZE, page, after_id=after_id, before_id=before_id
+        )
     except Exception as e:
         logger.error(f"Помилка при отриманні списку товарів: {e}")
         await update.callback_query.message.reply_text(f"{EMOJI['error']} Помилка завантаження списку товарів.")
-        shoes = []
-    finally:
-        if conn:
-            conn.close()
 
-    message = f"{EMOJI['list']} <b>Список усіх товарів:</b>\n\n"
+    # Розмір сторінки обмежений, тож повідомлення гарантовано вміщується в ліміт Telegram
+    lines = [f"{EMOJI['list']} <b>Список усіх товарів</b> (сторінка {current_page+1}/{total_pages}, усього {total_items}):", ""]
     if not shoes:
-        message += "Наразі немає доданих товарів."
-    else:
-        for shoe_id, name, brand, size, price in shoes:
-            display_size = format_size(size)
-            message += f"🆔 {shoe_id}: {name} ({brand}, {display_size} розмір, {price} грн)\n"
+        lines.append("Наразі немає доданих товарів.")
+    for shoe_id, name, brand, size, price, *_ in shoes:
+        display_size = format_size(size)
+        # Спершу обрізаємо, потім екрануємо: інакше обрізання може розрізати сутність на кшталт &amp;
+        name = html.escape(name[:ADMIN_LIST_NAME_LIMIT])
+        brand = html.escape(brand[:ADMIN_LIST_NAME_LIMIT])
+        lines.append(f"🆔 {shoe_id}: {name} ({brand}, {display_size} розмір, {price} грн)")
 
-    keyboard = [[InlineKeyboardButton(f"{EMOJI['back']} Назад", callback_data="back_menu")]]
+    keyboard = []
+    nav_buttons = pagination_buttons("admin_list_page", current_page, shoes, has_prev, has_next)
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+    keyboard.append([InlineKeyboardButton(f"{EMOJI['back']} Назад", callback_data=encode_callback("back_menu"))])
 
     await update.callback_query.message.edit_text(
-        message,
+        "\n".join(lines),
         reply_markup=InlineKeyboardMarkup(keyboard),
         parse_mode="HTML"
     )
 
-### Пагінація та відображення товарів
-
-async def show_shoes_page(update, context, page=0):
+async def show_shoes_page(update, context, page=0, after_id=None, before_id=None, cursor_price=None):
+    """
+    Показує сторінку каталогу. Сторінки гортаються за курсором (id першого/останнього товару),
+    тому кожне натискання коштує один запит на ITEMS_PER_PAGE рядків, а не весь каталог.
+    """
     user_id = update.effective_user.id
-    filters_data = user_filters.get(user_id, {})
+    filters_data = (await session_store.get(user_id)).filters
 
-    conn = None
-    all_items = []
+    page_items = []
+    current_page, total_pages, total_items, has_prev, has_next = 0, 1, 0, False, False
     try:
-        conn = get_db_connection() # Отримуємо з'єднання з PostgreSQL
-        cursor = conn.cursor()
-
-        query = "SELECT id, name, brand, size, price, image FROM shoes WHERE 1=1"
-        params = []
-
-        # Фільтр по брендам
-        if 'brands' in filters_data and filters_data['brands']:
-            # Використовуємо IN з %s для кожного елемента
-            query += f" AND brand IN ({','.join(['%s']*len(filters_data['brands']))})"
-            params.extend(filters_data['brands'])
-
-        # Фільтр по розмірам
-        if 'sizes' in filters_data and filters_data['sizes']:
-            # Використовуємо IN з %s для кожного елемента
-            query += f" AND size IN ({','.join(['%s']*len(filters_data['sizes']))})"
-            params.extend(filters_data['sizes'])
-
-        # Додаємо сортування, якщо потрібно, наприклад, за ID або назвою
-        query += " ORDER BY id" 
-
-        cursor.execute(query, params)
-        all_items = cursor.fetchall()
+        page_items, current_page, total_pages, total_items, has_prev, has_next = await load_page(
+            filters_data, ITEMS_PER_PAGE, page, after_id=after_id, before_id=before_id, cursor_price=cursor_price
+        )
     except Exception as e:
         logger.error(f"Помилка при отриманні товарів для сторінки: {e}")
         await context.bot.send_message(
@@ -608,17 +1107,7 @@ async def show_shoes_page(update, context, page=0):
             text=f"{EMOJI['error']} Виникла помилка при завантаженні товарів. Будь ласка, спробуйте пізніше.",
             parse_mode="HTML"
         )
-        all_items = [] # Забезпечуємо порожній список
-    finally:
-        if conn:
-            conn.close()
-
-    total_items = len(all_items)
-    total_pages = (total_items + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE if total_items > 0 else 1
-    current_page = max(0, min(page, total_pages - 1))
-
-    start_idx = current_page * ITEMS_PER_PAGE
-    end_idx = min(start_idx + ITEMS_PER_PAGE, total_items)
+        page_items = [] # Забезпечуємо порожній список
 
     # Видаляємо попереднє повідомлення меню
     if update.callback_query:
@@ -628,42 +1117,45 @@ async def show_shoes_page(update, context, page=0):
             logger.warning(f"Не вдалося видалити повідомлення (можливо, вже видалено або не існує): {e}")
 
     # Відправляємо товари
-    if not all_items:
+    if not page_items and total_items == 0:
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text="🙁 <b>На жаль, товарів за вашим запитом не знайдено.</b>",
             parse_mode="HTML"
         )
-    elif not all_items[start_idx:end_idx]: # Додаткова перевірка, якщо сторінка виходить за межі
+    elif not page_items: # Додаткова перевірка, якщо сторінка виходить за межі
          await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text="🙁 <b>На цій сторінці немає товарів.</b>",
             parse_mode="HTML"
         )
+    elif PAGE_RENDER_MODE == "album":
+        await send_shoes_album(context, update.effective_chat.id, page_items)
     else:
-        for item in all_items[start_idx:end_idx]:
+        for item in page_items:
             await send_shoe_details(context, update.effective_chat.id, item)
 
-    # Кнопки пагінації
-    pagination_buttons = []
-    if current_page > 0:
-        pagination_buttons.append(InlineKeyboardButton(f"{EMOJI['prev']} Попередні", callback_data=f"page_{current_page-1}"))
-    if end_idx < total_items:
-        pagination_buttons.append(InlineKeyboardButton(f"Наступні {EMOJI['next']}", callback_data=f"page_{current_page+1}"))
+    # Кнопки пагінації: у callback_data передаємо номер сторінки та курсор (id крайнього товару)
+    price_sorted = filters_data.get('sort') in ('price_asc', 'price_desc') and not filters_data.get('query')
+    nav_buttons = pagination_buttons("page", current_page, page_items, has_prev, has_next, with_price=price_sorted)
 
     menu_buttons = [
-        InlineKeyboardButton(f"{EMOJI['back']} Головне меню", callback_data="back_menu"),
-        InlineKeyboardButton(f"{EMOJI['filter']} Змінити фільтри", callback_data="filter_options")
+        InlineKeyboardButton(f"{EMOJI['back']} Головне меню", callback_data=encode_callback("back_menu")),
+        InlineKeyboardButton(f"{EMOJI['filter']} Змінити фільтри", callback_data=encode_callback("filter_options"))
     ]
 
     keyboard = []
-    if pagination_buttons:
-        keyboard.append(pagination_buttons)
+    if nav_buttons:
+        keyboard.append(nav_buttons)
     keyboard.append(menu_buttons)
 
+    header = f"📄 <b>Сторінка {current_page+1}/{total_pages} | Знайдено товарів: {total_items}</b>"
+    if filters_data.get('query'):
+        header = f"{EMOJI['search']} <b>Пошук «{html.escape(filters_data['query'])}»</b>\n" + header
+
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
-        text=f"📄 <b>Сторінка {current_page+1}/{total_pages} | Знайдено товарів: {total_items}</b>",
+        text=header,
         reply_markup=InlineKeyboardMarkup(keyboard),
         parse_mode="HTML"
     )
@@ -675,49 +1167,199 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await show_main_menu(update, context)
 
 #### Обробка кнопок
+async def show_all_shoes(update, context):
+    """Усі товари: скидає фільтри (крім сортування) і показує першу сторінку каталогу."""
+    session = await session_store.get(update.effective_user.id)
+    sort = session.filters.get('sort')
+    session.filters = empty_filters()
+    if sort:
+        session.filters['sort'] = sort
+    session_store.mark_dirty(session)
+    await show_shoes_page(update, context, page=0)
+
+def _paged(handler):
+    """
+    Обгортка для дій пагінації: аргументи (сторінка, курсор[, ціна товару-курсора])
+    -> page, after_id, before_id[, cursor_price]. Ціну передає лише каталог (show_shoes_page).
+    """
+    async def _handle(update, context, page=0, cursor=0, *cursor_price):
+        page, after_id, before_id = decode_cursor(page, cursor)
+        if cursor_price and (after_id or before_id):
+            await handler(update, context, page, after_id=after_id, before_id=before_id, cursor_price=cursor_price[0])
+        else:
+            await handler(update, context, page, after_id=after_id, before_id=before_id)
+    return _handle
+
+# Таблиця маршрутизації: дія з callbacks.ACTION_CODES -> обробник(update, context, *аргументи)
+CALLBACK_ROUTES = {
+    "back_menu": back_to_previous_menu,
+    "show_all": show_all_shoes,
+    "search_prompt": show_search_prompt,
+    "filter_options": show_filter_menu,
+    "brand_filter": show_brand_menu,
+    "size_filter": show_size_menu,
+    "price_filter": show_price_menu,
+    "sort_menu": show_sort_menu,
+    "toggle_brand": toggle_brand_filter,
+    "toggle_size": toggle_size_filter,
+    "set_price": set_price_range,
+    "set_sort": set_sort_order,
+    "apply_filters": show_shoes_page,
+    "reset_filters": reset_filters,
+    "page": _paged(show_shoes_page),
+    "admin_panel": show_admin_menu,
+    "add_shoe_prompt": add_shoe_prompt,
+    "remove_shoe_menu": remove_shoe_menu,
+    "remove_page": _paged(remove_shoe_menu),
+    "remove_toggle": toggle_remove_selection,
+    "remove_delete": remove_selected_shoes,
+    "remove_clear": lambda update, context: remove_selected_shoes(update, context, clear=True),
+    "import_help": show_import_help,
+    "export_shoes": export_catalog,
+    "admin_list_shoes": list_shoes,
+    "admin_list_page": _paged(list_shoes),
+}
+
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
+    decoded = decode_callback(query.data)
+    if decoded is None:
+        # Кнопка зі старого повідомлення (інший формат або версія) - просто відкриваємо головне меню
+        await query.answer(f"{EMOJI['info']} Це меню застаріло, відкриваю головне меню.")
+        await show_main_menu(update, context)
+        return
+
     await query.answer()
-    data = query.data
-
-    if data == "back_menu":
-        await back_to_previous_menu(update, context)
-    elif data == "show_all":
-        user_id = update.effective_user.id
-        user_filters[user_id] = {'brands': [], 'sizes': []}
-        await show_shoes_page(update, context, page=0)
-    elif data == "filter_options":
-        await show_filter_menu(update, context)
-    elif data == "brand_filter":
-        await show_brand_menu(update, context)
-    elif data == "size_filter":
-        await show_size_menu(update, context)
-    elif data.startswith("toggle_"):
-        await toggle_filter(update, context)
-    elif data == "apply_filters":
-        await show_shoes_page(update, context, page=0)
-    elif data == "reset_filters":
-        await reset_filters(update, context)
-    elif data == "admin_panel":
-        await show_admin_menu(update, context)
-    elif data == "add_shoe_prompt":
-        await add_shoe_prompt(update, context)
-    elif data == "remove_shoe_menu":
-        await remove_shoe_menu(update, context)
-    elif data.startswith("remove_"):
-        await remove_shoe(update, context)
-    elif data == "admin_list_shoes":
-        await list_shoes(update, context)
-    elif data.startswith("page_"):
-        page = int(data.split("_")[1])
-        await show_shoes_page(update, context, page)
+    action, args = decoded
+    with metrics.timer("handler", action=action):
+        await CALLBACK_ROUTES[action](update, context, *args)
+
+#### Статистика роботи бота (команда /stats, лише для адміна)
+def format_latency_table(title, rows, label, limit=8):
+    lines = [title]
+    for labels, count, p50, p99 in rows[:limit]:
+        name = ",".join(str(value) for value in labels.values()) if labels else label
+        lines.append(f"  {name[:24]:<24} {count:>7} {p50 * 1000:>8.1f} {p99 * 1000:>8.1f}")
+    if len(lines) == 1:
+        lines.append("  немає даних")
+    return lines
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != YOUR_ADMIN_ID:
+        await update.message.reply_text("У вас немає доступу до цієї функції.")
+        return
+
+    lines = [f"{'':<26} {'к-сть':>7} {'p50, мс':>8} {'p99, мс':>8}"]
+    lines += format_latency_table("Кнопки:", metrics.summary("handler_seconds"), "handler")
+    lines += format_latency_table("Запити до БД:", metrics.summary("db_query_seconds"), "query")
+    lines += format_latency_table("Очікування з'єднання:", metrics.summary("db_pool_wait_seconds"), "pool")
+    lines += format_latency_table("Bot API:", metrics.summary("bot_api_seconds"), "api")
+
+    pool = pool_stats()
+    if pool['max']:  # Пул є лише у PostgreSQL
+        lines.append(f"Пул БД: зайнято {pool['in_use']}/{pool['max']}, в черзі {pool['waiting']}")
+    replica = replica_status()
+    if replica is not None:
+        pool = pool_stats("replica")
+        lines.append(f"Репліка ({replica}): зайнято {pool['in_use']}/{pool['max']}, в черзі {pool['waiting']}")
+
+    errors = []
+    for name in ("handler_errors_total", "db_query_errors_total", "bot_api_errors_total"):
+        for labels, value in metrics.counter_values(name):
+            errors.append(f"  {name.split('_')[0]} {','.join(str(v) for v in labels.values())}: {value}")
+    lines.append("Помилки:" if errors else "Помилок немає.")
+    lines += errors[:10]
+
+    lines.append("Кеші (влучання):")
+    for name, labels, value in metrics.collect_gauges():
+        if name == "cache_hit_rate":
+            lines.append(f"  {labels['cache']}: {value:.0%}")
+
+    await update.message.reply_text(
+        f"{EMOJI['info']} <b>Статистика</b>\n<pre>{html.escape(chr(10).join(lines))}</pre>",
+        parse_mode="HTML"
+    )
 
 # Основна функція
+async def prepare_catalog_in_background(storage_init):
+    """Після фонового підключення сховища звіряє каталог; обидва кроки повторюються, доки не вдадуться."""
+    await storage_init
+    await retry_with_backoff(prepare_catalog, "звірити каталог")
+
+async def post_init(application: Application):
+    """
+    Запускає фонове збереження сесій, ендпоінт метрик і перевірку зображень, оновлює локальну
+    копію каталогу і будує індекс каталогу (якщо вони увімкнені).
+    """
+    storage_init = None
+    if not storage_initialized():
+        # Каталог уже завантажено зі знімка: підключення до БД і звірка індексу йдуть у фоні,
+        # а бот тим часом відповідає користувачам
+        storage_init = start_storage_init()
+    application.create_task(session_store.run_flush_loop())
+    if METRICS_PORT:
+        application.bot_data["metrics_server"] = await start_metrics_server()
+    if storage_init is not None:
+        application.create_task(prepare_catalog_in_background(storage_init))
+    else:
+        await prepare_catalog()
+    if uses_read_cache() and SQLITE_READ_CACHE_REFRESH_INTERVAL > 0:
+        application.create_task(read_cache_refresh_loop(SQLITE_READ_CACHE_REFRESH_INTERVAL))
+    if CATALOG_INDEX_ENABLED and CATALOG_INDEX_REFRESH_INTERVAL > 0:
+        application.create_task(catalog_index_refresh_loop(CATALOG_INDEX_REFRESH_INTERVAL))
+    if IMAGE_CHECK_ENABLED:
+        application.create_task(image_checker.run(application.bot))
+
+async def post_shutdown(application: Application):
+    """Зберігає незаписані сесії та знімок каталогу, закриває сховище і ендпоінт метрик при зупинці бота."""
+    await session_store.flush()
+    try:
+        await save_catalog_snapshot()
+    except Exception as e:
+        logger.error(f"Не вдалося зберегти знімок каталогу: {e}")
+    close_storage()
+    metrics_server = application.bot_data.get("metrics_server")
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+
+def build_application(base_url=None):
+    """
+    Створює Application з усіма обробниками.
+    base_url - адреса Bot API (за замовчуванням api.telegram.org; бенчмарк підставляє локальний фейковий сервер).
+    """
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .rate_limiter(SendScheduler())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
+
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("export", export_catalog))
+    application.add_handler(CommandHandler("search", search_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    # Обробник текстових повідомлень: для адміна в стані додавання товару - наступний крок майстра,
+    # в усіх інших випадках текст вважається пошуковим запитом.
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, text_message_handler))
+    # Документи від адміна - імпорт товарів з CSV/JSON
+    application.add_handler(MessageHandler(filters.Document.ALL & filters.User(user_id=YOUR_ADMIN_ID), import_shoes_document))
+    application.add_handler(CallbackQueryHandler(button_handler))
+    return application
+
 def main():
     # Викликаємо ініціалізацію БД тут, після того, як всі імпорти та змінні середовища готові
-    # або переконайтеся, що init_db() виконується першим
+    # або переконайтеся, що init_storage() виконується першим
     try:
-        init_db()
+        # Сховище (пул з'єднань з PostgreSQL або файл SQLite) створюється один раз і використовується всіма обробниками.
+        # Якщо каталог вдалося завантажити зі знімка, сховище підключається у фоні (post_init).
+        if not load_catalog_snapshot():
+            init_storage()
     except ValueError as e:
         logger.critical(f"Fatal error during database initialization: {e}")
         # Якщо база даних не може бути ініціалізована, бот не може працювати.
@@ -729,17 +1371,28 @@ def main():
         logger.critical("❌ Bot token is not available. Exiting.")
         exit(1)
 
-    application = Application.builder().token(TOKEN).build()
-
-    application.add_handler(CommandHandler("start", start))
-    # Обробник текстових повідомлень, але тільки якщо користувач знаходиться в стані додавання товару
-    # та є адміном. Переконайтесь, що `filters.User(YOUR_ADMIN_ID)` спрацює коректно.
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & filters.User(user_id=YOUR_ADMIN_ID), add_shoe_message_handler))
-    application.add_handler(CallbackQueryHandler(button_handler))
-
-    logger.info("Бот запускається...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
-    logger.info("Бот запущений")
+    application = build_application()
+
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            logger.critical("❌ BOT_MODE=webhook, але WEBHOOK_URL не задано. Exiting.")
+            exit(1)
+        if not WEBHOOK_SECRET:
+            logger.warning("⚠️ WEBHOOK_SECRET не задано: запити до вебхука не перевірятимуться.")
+
+        logger.info(f"Бот запускається у режимі webhook на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}...")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES
+        )
+    else:
+        logger.info("Бот запускається...")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
+    logger.info("Бот зупинено")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,89 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Простий кеш у пам'яті процесу з часом життя записів (TTL) та обмеженням розміру (LRU).
+    Рахує влучання та промахи, щоб можна було оцінити ефективність кешу.
+    """
+
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # ключ -> (час завершення дії, значення)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Видаляє один запис або, якщо ключ не вказано, весь кеш."""
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class RenderCache:
+    """
+    LRU-кеш готових до відправки об'єктів (підписів, клавіатур) без часу життя.
+    Актуальність забезпечує сам ключ: він містить дані, з яких об'єкт побудовано (дані товару,
+    список брендів чи розмірів), тож застарілі записи просто витісняються з кінця LRU.
+    """
+
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get_or_build(self, key, build, *args):
+        """Повертає збережене значення для key або будує його викликом build(*args)."""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            value = self._data[key] = build(*args)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return value
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def invalidate(self):
+        self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
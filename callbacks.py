@@ -0,0 +1,124 @@
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Версія формату callback_data. Кнопки зі старих повідомлень з іншою версією (або старого
+# текстового формату на кшталт "toggle_brand_Nike") відкидаються ще до маршрутизації.
+CALLBACK_VERSION = "1"
+# Ліміт Telegram на довжину callback_data
+MAX_CALLBACK_BYTES = 64
+
+# Дія -> короткий код. Код не можна змінювати чи використовувати для іншої дії без зміни CALLBACK_VERSION.
+ACTION_CODES = {
+    "back_menu": "b",
+    "show_all": "a",
+    "search_prompt": "q",
+    "filter_options": "f",
+    "brand_filter": "fb",
+    "size_filter": "fs",
+    "price_filter": "fp",
+    "sort_menu": "fo",
+    "toggle_brand": "tb",
+    "toggle_size": "ts",
+    "set_price": "sp",
+    "set_sort": "so",
+    "apply_filters": "fa",
+    "reset_filters": "fr",
+    "page": "p",
+    "admin_panel": "ad",
+    "add_shoe_prompt": "aa",
+    "remove_shoe_menu": "ar",
+    "remove_page": "rp",
+    "remove_toggle": "rt",
+    "remove_delete": "rd",
+    "remove_clear": "rc",
+    "import_help": "ai",
+    "export_shoes": "ae",
+    "admin_list_shoes": "al",
+    "admin_list_page": "lp",
+}
+_ACTIONS_BY_CODE = {code: action for action, code in ACTION_CODES.items()}
+
+# Кількість цілих аргументів дії: (мінімум, максимум). Дії без запису аргументів не мають.
+ACTION_ARITY = {
+    "toggle_brand": (1, 1),     # id бренду
+    "toggle_size": (1, 1),      # id розміру
+    "set_price": (1, 1),        # номер діапазону цін
+    "set_sort": (1, 1),         # номер порядку сортування
+    "page": (1, 3),             # сторінка, курсор, ціна товару-курсора (для сортувань за ціною)
+    "remove_page": (1, 2),      # сторінка, курсор
+    "remove_toggle": (1, 3),    # id товару, сторінка, курсор
+    "admin_list_page": (1, 2),  # сторінка, курсор
+}
+
+
+def encode_callback(action, *args):
+    """
+    Кодує дію та цілі аргументи у callback_data: "{версія}{код}:{арг}:{арг}",
+    напр. encode_callback("page", 2, 17) -> "1p:2:17".
+    """
+    data = CALLBACK_VERSION + ACTION_CODES[action] + "".join(f":{int(arg)}" for arg in args)
+    if len(data.encode()) > MAX_CALLBACK_BYTES:
+        raise ValueError(f"callback_data для дії {action} довше за {MAX_CALLBACK_BYTES} байт: {data}")
+    return data
+
+
+def decode_callback(data):
+    """Повертає (дія, аргументи) або None, якщо callback_data застаріла чи пошкоджена."""
+    if not data or len(data) > MAX_CALLBACK_BYTES or data[0] != CALLBACK_VERSION:
+        return None
+    code, *raw_args = data[1:].split(":")
+    action = _ACTIONS_BY_CODE.get(code)
+    if action is None:
+        return None
+    min_args, max_args = ACTION_ARITY.get(action, (0, 0))
+    if not min_args <= len(raw_args) <= max_args:
+        return None
+    args = []
+    for raw in raw_args:
+        digits = raw[1:] if raw.startswith("-") else raw
+        if not (digits.isascii() and digits.isdigit()):
+            return None
+        args.append(int(raw))
+    return action, tuple(args)
+
+
+# --- Числові id значень фільтрів ---
+
+def brand_id(brand):
+    """Стабільний числовий id бренду (CRC32 назви): не залежить від довжини назви та порядку брендів."""
+    return zlib.crc32(brand.encode())
+
+
+def size_id(size):
+    """Числовий id розміру (розмір у сотих), без перетворення float у рядок і назад."""
+    return round(float(size) * 100)
+
+
+def resolve_brand(value_id, brands):
+    """Бренд зі списку brands з таким id або None (бренд зник з каталогу - кнопка застаріла)."""
+    return next((brand for brand in brands if brand_id(brand) == value_id), None)
+
+
+def resolve_size(value_id, sizes):
+    """Розмір (float) зі списку sizes з таким id або None."""
+    return next((float(size) for size in sizes if size_id(size) == value_id), None)
+
+
+# --- Курсори пагінації ---
+# Курсор - одне ціле: id товару > 0 означає after_id, < 0 - before_id, 0 - перша сторінка.
+
+def encode_cursor(after_id=None, before_id=None):
+    if before_id is not None:
+        return -before_id
+    return after_id or 0
+
+
+def decode_cursor(page=0, cursor=0):
+    """Повертає (номер сторінки, after_id, before_id) з аргументів дії пагінації."""
+    if cursor > 0:
+        return page, cursor, None
+    if cursor < 0:
+        return page, None, -cursor
+    return 0, None, None  # Без курсора починаємо з першої сторінки
@@ -0,0 +1,307 @@
+import bisect
+import logging
+from array import array
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+
+# Операції над великим int коштують O(розміру маски), тому маска один раз перетворюється
+# на байти, а біти перебираються по байтах (інакше обхід маски з n бітів - O(n^2))
+def _iter_bits(mask):
+    """Повертає позиції встановлених бітів від молодших до старших."""
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    for index, byte in enumerate(data):
+        base = index << 3
+        while byte:
+            low = byte & -byte
+            yield base + low.bit_length() - 1
+            byte ^= low
+
+
+def _iter_bits_reversed(mask):
+    """Повертає позиції встановлених бітів від старших до молодших."""
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    for index in range(len(data) - 1, -1, -1):
+        byte = data[index]
+        base = index << 3
+        while byte:
+            pos = byte.bit_length() - 1
+            yield base + pos
+            byte ^= 1 << pos
+
+
+def _mask_from_positions(positions, size):
+    """Бітова маска з позицій (через bytearray - без зростаючих проміжних int)."""
+    bitmap = bytearray(size // 8 + 1)
+    for pos in positions:
+        bitmap[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(bitmap, 'little')
+
+
+class CatalogIndex:
+    """
+    Компактний колонковий індекс каталогу в пам'яті.
+
+    Кожна колонка таблиці shoes зберігається окремим масивом, а рядки впорядковані за id.
+    Для кожного бренду та розміру зберігається бітова маска позицій (звичайний int Python),
+    тож фільтри з user_filters обчислюються операціями AND/OR над масками без SQL.
+    Видалені рядки лише знімаються з маски alive; повна перебудова прибирає «дірки».
+    PostgreSQL залишається джерелом істини - індекс можна будь-коли перебудувати з нього.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._reset()
+
+    def _reset(self):
+        self.ids = array('q')
+        self.sizes = array('d')
+        self.prices = array('q')
+        self.names = []
+        self.brands = []
+        self.images = []
+        self.file_ids = []
+        self.image_statuses = []
+        self.alive = 0
+        self.brand_bits = {}
+        self.size_bits = {}
+        self._positions = {}  # id -> позиція в масивах
+        self._orders = {}       # сортування -> (позиції в порядку сортування, позиція -> номер у цьому порядку)
+        self._price_masks = {}  # (price_min, price_max) -> маска
+
+    def _changed(self):
+        """Скидає похідні структури, що залежать від набору рядків."""
+        self._orders.clear()
+        self._price_masks.clear()
+
+    # --- Побудова та оновлення ---
+
+    def load(self, rows):
+        """Повністю перебудовує індекс з рядків у порядку storage.SHOE_COLUMNS."""
+        rows = sorted(rows, key=lambda r: r[0])
+        self.load_columns(
+            [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows],
+            [row[3] for row in rows], [row[4] for row in rows], [row[5] for row in rows],
+            [row[6] if len(row) > 6 else None for row in rows],
+            [row[7] if len(row) > 7 else None for row in rows],
+        )
+
+    def load_columns(self, ids, names, brands, sizes, prices, images, file_ids, image_statuses):
+        """Повністю перебудовує індекс з колонок, упорядкованих за id (див. columns)."""
+        self._reset()
+        self.ids = array('q', ids)
+        self.names = list(names)
+        self.brands = list(brands)
+        self.sizes = array('d', (float(size) for size in sizes))
+        self.prices = array('q', prices)
+        self.images = list(images)
+        self.file_ids = list(file_ids)
+        self.image_statuses = list(image_statuses)
+        self._positions = {shoe_id: pos for pos, shoe_id in enumerate(self.ids)}
+
+        count = len(self.ids)
+        self.alive = (1 << count) - 1
+        for bits, values in ((self.brand_bits, self.brands), (self.size_bits, self.sizes)):
+            positions = {}
+            for pos, value in enumerate(values):
+                positions.setdefault(value, []).append(pos)
+            for value, value_positions in positions.items():
+                bits[value] = _mask_from_positions(value_positions, count)
+        self.ready = True
+        logger.info(f"Індекс каталогу побудовано: {len(self)} товарів.")
+
+    def columns(self):
+        """
+        Копія живих рядків індексу по колонках (ids, names, brands, sizes, prices, images, file_ids, image_statuses)
+        у порядку id - для знімка каталогу на диску.
+        """
+        if self.alive == (1 << len(self.ids)) - 1:
+            return (
+                array('q', self.ids), list(self.names), list(self.brands), array('d', self.sizes),
+                array('q', self.prices), list(self.images), list(self.file_ids), list(self.image_statuses),
+            )
+        positions = list(_iter_bits(self.alive))
+        return (
+            array('q', (self.ids[pos] for pos in positions)),
+            [self.names[pos] for pos in positions],
+            [self.brands[pos] for pos in positions],
+            array('d', (self.sizes[pos] for pos in positions)),
+            array('q', (self.prices[pos] for pos in positions)),
+            [self.images[pos] for pos in positions],
+            [self.file_ids[pos] for pos in positions],
+            [self.image_statuses[pos] for pos in positions],
+        )
+
+    def _append(self, row):
+        shoe_id, name, brand, size, price, image = row[:6]
+        image_file_id = row[6] if len(row) > 6 else None
+        image_status = row[7] if len(row) > 7 else None
+        pos = len(self.ids)
+        self.ids.append(shoe_id)
+        self.names.append(name)
+        self.brands.append(brand)
+        self.sizes.append(float(size))
+        self.prices.append(price)
+        self.images.append(image)
+        self.file_ids.append(image_file_id)
+        self.image_statuses.append(image_status)
+        self._positions[shoe_id] = pos
+        self._changed()
+
+        bit = 1 << pos
+        self.alive |= bit
+        self.brand_bits[brand] = self.brand_bits.get(brand, 0) | bit
+        self.size_bits[float(size)] = self.size_bits.get(float(size), 0) | bit
+
+    def add(self, row):
+        """Додає новий товар. id нових товарів зростають, тому порядок масивів зберігається."""
+        if self.ids and row[0] <= self.ids[-1]:
+            # Малоймовірно (id видано не послідовно) - простіше перебудувати з уже наявних даних
+            self.load([self._row(pos) for pos in _iter_bits(self.alive)] + [row])
+            return
+        self._append(row)
+
+    def remove(self, shoe_id):
+        """Видаляє товар з індексу (позиція лишається у масивах, але зникає з усіх масок)."""
+        pos = self._positions.pop(shoe_id, None)
+        if pos is None:
+            return
+        bit = 1 << pos
+        self.alive &= ~bit
+        self._changed()
+        for bits in (self.brand_bits, self.size_bits):
+            key = self.brands[pos] if bits is self.brand_bits else self.sizes[pos]
+            bits[key] &= ~bit
+            if not bits[key]:
+                del bits[key]
+
+    def set_file_id(self, shoe_id, file_id, image_url=None):
+        """Оновлює file_id фото; якщо передано image_url, лише коли зображення не змінилося."""
+        pos = self._positions.get(shoe_id)
+        if pos is not None and (image_url is None or self.images[pos] == image_url):
+            self.file_ids[pos] = file_id
+
+    def set_image_status(self, shoe_id, status, image_url=None):
+        """Оновлює результат перевірки зображення; якщо передано image_url, лише коли зображення не змінилося."""
+        pos = self._positions.get(shoe_id)
+        if pos is not None and (image_url is None or self.images[pos] == image_url):
+            self.image_statuses[pos] = status
+
+    # --- Запити ---
+
+    def __len__(self):
+        return self.alive.bit_count()
+
+    def _row(self, pos):
+        return (
+            self.ids[pos], self.names[pos], self.brands[pos], self.sizes[pos],
+            self.prices[pos], self.images[pos], self.file_ids[pos], self.image_statuses[pos]
+        )
+
+    def _mask(self, filters_data):
+        mask = self.alive
+        if filters_data.get('brands'):
+            brand_mask = 0
+            for brand in filters_data['brands']:
+                brand_mask |= self.brand_bits.get(brand, 0)
+            mask &= brand_mask
+        if filters_data.get('sizes'):
+            size_mask = 0
+            for size in filters_data['sizes']:
+                size_mask |= self.size_bits.get(float(size), 0)
+            mask &= size_mask
+        if filters_data.get('price_min') is not None or filters_data.get('price_max') is not None:
+            mask &= self._price_mask(filters_data.get('price_min'), filters_data.get('price_max'))
+        return mask
+
+    def _price_mask(self, price_min, price_max):
+        """Маска рядків з price_min <= ціна < price_max (межа None - без обмеження)."""
+        key = (price_min, price_max)
+        if key not in self._price_masks:
+            order, _ = self._order('price_asc')
+            prices = [self.prices[pos] for pos in order]
+            start = bisect.bisect_left(prices, price_min) if price_min is not None else 0
+            end = bisect.bisect_left(prices, price_max) if price_max is not None else len(prices)
+            self._price_masks[key] = _mask_from_positions(order[start:end], len(self.ids))
+        return self._price_masks[key]
+
+    def _order(self, sort):
+        """Живі позиції в порядку сортування (як SORT_ORDERS у storage.py) та зворотний словник."""
+        if sort not in self._orders:
+            positions = list(_iter_bits(self.alive))  # вже за зростанням id
+            if sort == 'newest':
+                positions.reverse()
+            elif sort in ('price_asc', 'price_desc'):
+                positions.sort(key=lambda pos: (self.prices[pos], self.ids[pos]), reverse=(sort == 'price_desc'))
+            self._orders[sort] = (positions, {pos: rank for rank, pos in enumerate(positions)})
+        return self._orders[sort]
+
+    def count(self, filters_data):
+        return self._mask(filters_data).bit_count()
+
+    def page(self, filters_data, limit, after_id=None, before_id=None, cursor_price=None):
+        """Та сама семантика, що й database.fetch_shoes_page: повертає (rows, has_more)."""
+        mask = self._mask(filters_data)
+        sort = filters_data.get('sort') or 'id'
+        if sort != 'id':
+            positions = self._sorted_positions(sort, after_id, before_id, cursor_price)
+        elif before_id is not None:
+            # Лишаємо лише позиції з id < before_id і йдемо від старших до молодших
+            mask &= (1 << bisect.bisect_left(self.ids, before_id)) - 1
+            positions = _iter_bits_reversed(mask)
+        else:
+            if after_id is not None:
+                mask &= ~((1 << bisect.bisect_right(self.ids, after_id)) - 1)
+            positions = _iter_bits(mask)
+
+        rows = []
+        for pos in positions:
+            if sort != 'id' and not (mask >> pos) & 1:
+                continue
+            rows.append(self._row(pos))
+            if len(rows) > limit:
+                break
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if before_id is not None:
+            rows.reverse()
+        return rows, has_more
+
+    def _sorted_positions(self, sort, after_id, before_id, cursor_price=None):
+        """Позиції в порядку сортування, починаючи від курсора (у зворотному порядку для before_id)."""
+        order, rank = self._order(sort)
+        cursor_id = before_id if before_id is not None else after_id
+        if cursor_id is None:
+            return iter(order)
+        pos = self._positions.get(cursor_id)
+        if pos is not None:
+            start = rank[pos]
+            end = start + 1
+        else:
+            # Товар-курсор видалено: шукаємо місце його ключа в порядку сортування (як SQL-запит)
+            key = self._cursor_key(sort, cursor_id, cursor_price)
+            if key is None:
+                return iter(())  # Ціни курсора немає - як і SQL-запит без неї, повертаємо порожню сторінку
+            keys = [self._cursor_key(sort, self.ids[p], self.prices[p]) for p in order]
+            start = end = bisect.bisect_left(keys, key)
+        if before_id is not None:
+            return reversed(order[:start])
+        return islice(order, end, None)
+
+    @staticmethod
+    def _cursor_key(sort, shoe_id, price):
+        """Ключ, за яким зростає порядок сортування sort (None, якщо для нього потрібна ціна, а її немає)."""
+        if sort == 'newest':
+            return -shoe_id
+        if price is None:
+            return None
+        if sort == 'price_desc':
+            return (-price, -shoe_id)
+        return (price, shoe_id)
+
+    def facet_brands(self):
+        return sorted(self.brand_bits)
+
+    def facet_sizes(self):
+        return sorted(self.size_bits)
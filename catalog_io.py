@@ -0,0 +1,130 @@
+import csv
+import json
+import math
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Колонки файлу імпорту/експорту (в тому ж порядку, що й у таблиці shoes)
+CATALOG_FIELDS = ("name", "brand", "size", "price", "image")
+
+# Розмір пакета рядків, що читаються з БД під час експорту
+EXPORT_BATCH_SIZE = 1000
+
+# Спільний буфер рядків, що пройшли перевірку, тримається в пам'яті до цього розміру, далі - на диску
+IMPORT_SPOOL_SIZE = 1024 * 1024
+
+
+# --- Правила перевірки даних товару (спільні для майстра додавання та імпорту) ---
+
+def parse_size(text):
+    """Перетворює текст на розмір (дозволяє кому як десятковий роздільник)."""
+    size = float(str(text).replace(',', '.').strip())
+    # float() приймає й "nan" та "inf" - такий розмір зламав би клавіатуру розмірів для всіх
+    if not math.isfinite(size) or size <= 0:
+        raise ValueError("Розмір повинен бути додатнім числом.")
+    return size
+
+
+def parse_price(text):
+    """Перетворює текст на ціну (ціле додатне число)."""
+    price = int(str(text).strip())
+    if price <= 0:
+        raise ValueError("Ціна повинна бути додатнім числом.")
+    return price
+
+
+def parse_image(text):
+    """URL зображення або None, якщо його немає ('' або 'ні')."""
+    text = (text or "").strip()
+    return text if text and text.lower() != 'ні' else None
+
+
+def validate_row(record):
+    """
+    Перевіряє один запис файлу імпорту (dict з ключами CATALOG_FIELDS).
+    Повертає кортеж (name, brand, size, price, image) або кидає ValueError з описом помилки.
+    """
+    name = str(record.get("name") or "").strip()
+    brand = str(record.get("brand") or "").strip()
+    if not name:
+        raise ValueError("порожня назва")
+    if not brand:
+        raise ValueError("порожній бренд")
+    try:
+        size = parse_size(record.get("size"))
+    except ValueError as e:
+        raise ValueError(f"некоректний розмір {record.get('size')!r}: {e}")
+    try:
+        price = parse_price(record.get("price"))
+    except ValueError as e:
+        raise ValueError(f"некоректна ціна {record.get('price')!r}: {e}")
+    return name, brand, size, price, parse_image(record.get("image"))
+
+
+# --- Імпорт ---
+
+def iter_records(path, file_name):
+    """
+    Читає файл імпорту запис за записом.
+    CSV (з заголовком name,brand,size,price,image) та JSON Lines читаються потоково,
+    JSON - як масив об'єктів.
+    """
+    lower_name = file_name.lower()
+    if lower_name.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f)
+    elif lower_name.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif lower_name.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError("JSON-файл повинен містити масив товарів.")
+        yield from data
+    else:
+        raise ValueError("Підтримуються лише файли .csv, .json та .jsonl.")
+
+
+class ImportResult:
+    """Результат розбору файлу імпорту: буфер CSV для COPY та помилки по рядках."""
+
+    def __init__(self):
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE, mode="w+", newline="", encoding="utf-8")
+        self._writer = csv.writer(self.buffer)
+        self.valid = 0
+        self.errors = []  # (номер рядка, опис помилки)
+
+    def add(self, row_number, record):
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("запис повинен бути об'єктом")
+            self._writer.writerow(validate_row(record))
+            self.valid += 1
+        except (ValueError, TypeError) as e:
+            self.errors.append((row_number, str(e)))
+
+    def rewind(self):
+        self.buffer.seek(0)
+        return self.buffer
+
+    def close(self):
+        self.buffer.close()
+
+
+# --- Експорт ---
+
+async def export_to_csv(path, export_fn):
+    """
+    Пише каталог у CSV-файл path. export_fn(write_rows, batch_size) - корутина, що передає
+    рядки БД пакетами (database.export_shoes); кожен пакет одразу записується на диск.
+    Файл можна повторно імпортувати (колонка id ігнорується). Повертає кількість рядків.
+    """
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(("id",) + CATALOG_FIELDS)
+        return await export_fn(writer.writerows, EXPORT_BATCH_SIZE)
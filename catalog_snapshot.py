@@ -0,0 +1,139 @@
+import os
+import mmap
+import time
+import zlib
+import struct
+import logging
+from array import array
+from itertools import accumulate
+
+logger = logging.getLogger(__name__)
+
+# Формат файлу знімка каталогу. FORMAT_VERSION збільшується при будь-якій зміні розкладки,
+# і знімок старого формату просто ігнорується (індекс буде перебудовано з БД).
+MAGIC = b"SHOESNAP"
+FORMAT_VERSION = 2
+# magic, версія формату, кількість товарів, час створення (Unix), CRC32 даних, вирівнювання до 8 байтів
+_HEADER = struct.Struct("<8sIIdI4x")
+_LENGTH = struct.Struct("<q")
+
+
+class SnapshotError(ValueError):
+    """Файл знімка пошкоджений, обрізаний або іншого формату."""
+
+
+def _pad(size):
+    return b"\0" * (-size % 8)
+
+
+def _dump_texts(values):
+    """Текстова колонка: довжини рядків у символах (-1 - NULL) та всі рядки одним UTF-8 блоком."""
+    lengths = array('i', (-1 if value is None else len(value) for value in values))
+    blob = "".join(value for value in values if value is not None).encode("utf-8")
+    lengths_bytes = lengths.tobytes()
+    return b"".join((_LENGTH.pack(len(blob)), lengths_bytes, _pad(len(lengths_bytes)), blob, _pad(len(blob))))
+
+
+def dump_snapshot(columns):
+    """
+    Серіалізує колонки каталогу (ids, names, brands, sizes, prices, images, file_ids, image_statuses)
+    у байти знімка.
+
+    Числові колонки лежать у файлі як є (int64/float64, little-endian, вирівняні до 8 байтів),
+    тому читаються з mmap одним копіюванням без розбору по рядках.
+    """
+    ids, names, brands, sizes, prices, images, file_ids, image_statuses = columns
+    payload = b"".join((
+        array('q', ids).tobytes(),
+        array('q', prices).tobytes(),
+        array('d', sizes).tobytes(),
+        _dump_texts(names),
+        _dump_texts(brands),
+        _dump_texts(images),
+        _dump_texts(file_ids),
+        _dump_texts(image_statuses),
+    ))
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(ids), time.time(), zlib.crc32(payload))
+    return header + payload
+
+
+def snapshot_checksum(data):
+    """CRC32 даних знімка (без заголовка): однаковий для однакового каталогу, незалежно від часу створення."""
+    return _HEADER.unpack_from(data)[4]
+
+
+def write_snapshot(path, data):
+    """Атомарно записує знімок: спершу в тимчасовий файл, потім os.replace."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class _Reader:
+    def __init__(self, buffer, offset):
+        self.buffer = buffer
+        self.offset = offset
+
+    def take(self, size):
+        end = self.offset + size
+        if end > len(self.buffer):
+            raise SnapshotError("знімок обрізано")
+        chunk = self.buffer[self.offset:end]
+        self.offset = end + (-size % 8)
+        return chunk
+
+    def numbers(self, typecode, count):
+        values = array(typecode)
+        values.frombytes(self.take(values.itemsize * count))
+        return values
+
+    def texts(self, count):
+        blob_size = _LENGTH.unpack(self.take(_LENGTH.size))[0]
+        lengths = self.numbers('i', count)
+        text = self.take(blob_size).decode("utf-8")
+        values = []
+        start = 0
+        for length, end in zip(lengths, accumulate(max(length, 0) for length in lengths)):
+            values.append(None if length < 0 else text[start:end])
+            start = end
+        return values
+
+
+def read_snapshot(path):
+    """
+    Читає знімок через mmap. Повертає (columns, info), де info - {'rows', 'created_at', 'checksum'}.
+    Кидає FileNotFoundError, якщо файлу немає, і SnapshotError, якщо він непридатний.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            raise SnapshotError("файл коротший за заголовок")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            magic, version, count, created_at, checksum = _HEADER.unpack_from(buffer)
+            if magic != MAGIC:
+                raise SnapshotError("це не знімок каталогу")
+            if version != FORMAT_VERSION:
+                raise SnapshotError(f"формат {version}, очікується {FORMAT_VERSION}")
+            # Контрольна сума рахується прямо по відображеній пам'яті, без копіювання файлу
+            view = memoryview(buffer)
+            try:
+                payload_checksum = zlib.crc32(view[_HEADER.size:])
+            finally:
+                view.release()
+            if payload_checksum != checksum:
+                raise SnapshotError("контрольна сума не збігається")
+
+            reader = _Reader(buffer, _HEADER.size)
+            ids = reader.numbers('q', count)
+            prices = reader.numbers('q', count)
+            sizes = reader.numbers('d', count)
+            names = reader.texts(count)
+            brands = reader.texts(count)
+            images = reader.texts(count)
+            file_ids = reader.texts(count)
+            image_statuses = reader.texts(count)
+
+    info = {"rows": count, "created_at": created_at, "checksum": checksum}
+    return (ids, names, brands, sizes, prices, images, file_ids, image_statuses), info
@@ -1,8 +1,21 @@
 import os
+import re
+import asyncio
+import time
+import threading
+from contextlib import contextmanager
 import psycopg2 # Імпортуємо бібліотеку для PostgreSQL
-from urllib.parse import urlparse # Допомагає розібрати URL бази даних
+from psycopg2.pool import ThreadedConnectionPool # Пул з'єднань, безпечний для використання з кількох потоків
+from psycopg2.extras import Json, execute_values
 import logging # Для логування
 
+from cache import TTLCache
+from catalog_index import CatalogIndex
+from catalog_snapshot import SnapshotError, dump_snapshot, read_snapshot, snapshot_checksum, write_snapshot
+from metrics import metrics, cache_collector
+from storage import CatalogStore, MirroredStore, SHOE_COLUMNS, SAMPLE_SHOES, filters_where, page_query
+from sqlite_store import SqliteStore
+
 # Налаштування логування (можна перенести в основний файл, якщо вже є)
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -10,11 +23,1108 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# --- Налаштування пулу з'єднань ---
+# Розміри пулу та інтервал перевірки з'єднань задаються змінними середовища
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '10'))
+# Через скільки секунд простою з'єднання перевіряється запитом SELECT 1 перед видачею
+DB_POOL_HEALTHCHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTHCHECK_INTERVAL', '30'))
+
+# Необов'язкова репліка для читання каталогу (перегляд, фасети, пошук). Зміни, міграції та сесії
+# завжди йдуть на основний сервер DATABASE_URL.
+DATABASE_READ_URL = os.environ.get('DATABASE_READ_URL')
+DB_READ_POOL_MAX = int(os.environ.get('DB_READ_POOL_MAX', str(DB_POOL_MAX)))
+# Read-your-writes: стільки секунд після зміни каталогу читання йде на основний сервер,
+# щоб адмін одразу побачив свій товар, навіть якщо репліка ще не наздогнала. Має перевищувати звичне відставання репліки.
+DB_READ_AFTER_WRITE_WINDOW = float(os.environ.get('DB_READ_AFTER_WRITE_WINDOW', '5'))
+# На скільки секунд репліка виключається з маршрутизації після помилки з'єднання
+DB_REPLICA_RETRY_INTERVAL = float(os.environ.get('DB_REPLICA_RETRY_INTERVAL', '30'))
+# Скільки секунд чекати на з'єднання з реплікою (connect_timeout libpq, щонайменше 2; 0 - без обмеження).
+# Без нього недоступна репліка затримувала б читання на весь системний таймаут TCP, перш ніж спрацює перехід на основний сервер
+DB_READ_CONNECT_TIMEOUT = int(os.environ.get('DB_READ_CONNECT_TIMEOUT', '3'))
+
+
+class ConnectionPool:
+    """
+    Пул з'єднань з одним сервером PostgreSQL (основним або реплікою).
+
+    psycopg2 блокує потік, тому запити виконуються у пулі потоків через asyncio.to_thread,
+    а семафор обмежує кількість корутин, що одночасно чекають на з'єднання.
+    Неробочі з'єднання замінюються при видачі.
+    """
+
+    def __init__(self, name, dsn, minconn, maxconn, **connect_kwargs):
+        self.name = name
+        self.max = maxconn
+        # psycopg2 сам розбирає URL бази даних (включно з параметрами на кшталт sslmode);
+        # connect_kwargs (напр. connect_timeout) доповнюють параметри з URL
+        self._pool = ThreadedConnectionPool(minconn, maxconn, dsn=dsn, **connect_kwargs)
+        self._semaphore = asyncio.Semaphore(maxconn)
+        self._last_used = {}       # id(conn) -> час останнього повернення в пул
+        self._lock = threading.Lock()
+        self.in_use = 0            # Скільки з'єднань зараз видано з пулу (змінюється під _lock)
+        self.waiting = 0           # Скільки запитів чекають на вільне місце в пулі
+
+    def close(self):
+        self._pool.closeall()
+        with self._lock:
+            self._last_used.clear()
+
+    def _is_healthy(self, conn):
+        """Перевіряє, чи з'єднання ще живе. Запит SELECT 1 робиться лише для з'єднань, що довго простоювали."""
+        if conn.closed:
+            return False
+        with self._lock:
+            last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < DB_POOL_HEALTHCHECK_INTERVAL:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"З'єднання з пулу {self.name} не пройшло перевірку, буде замінене: {e}")
+            return False
+
+    @contextmanager
+    def connection(self):
+        """
+        Видає з'єднання з пулу (синхронно) та повертає його назад після використання.
+        Транзакція підтверджується при успішному виході та відкочується при помилці.
+        """
+        conn = self._pool.getconn()
+        # Неробочі з'єднання закриваємо та беремо нові, доки не отримаємо живе
+        attempts = 0
+        while not self._is_healthy(conn):
+            self._pool.putconn(conn, close=True)
+            attempts += 1
+            if attempts > self.max:
+                raise psycopg2.OperationalError("Не вдалося отримати робоче з'єднання з пулу.")
+            conn = self._pool.getconn()
+
+        with self._lock:
+            self.in_use += 1
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            broken = bool(conn.closed)
+            raise
+        finally:
+            with self._lock:
+                self.in_use -= 1
+                if broken:
+                    self._last_used.pop(id(conn), None)
+                else:
+                    self._last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn, close=broken)
+
+    async def run(self, fn, *args, label):
+        """Виконує fn(conn, *args) в окремому потоці з з'єднанням із пулу. Повертає результат fn."""
+        queued_at = time.perf_counter()
+
+        def _work():
+            with self.connection() as conn:
+                # Час від постановки в чергу до отримання з'єднання показує насиченість пулу
+                metrics.observe("db_pool_wait_seconds", time.perf_counter() - queued_at, pool=self.name)
+                with metrics.timer("db_query", query=label):
+                    return fn(conn, *args)
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            return await asyncio.to_thread(_work)
+        finally:
+            self._semaphore.release()
+
+    def stats(self):
+        """Стан пулу: видано, максимум, очікують на з'єднання."""
+        return {"in_use": self.in_use, "max": self.max, "waiting": self.waiting}
+
+
+_pool = None                # Основний сервер (DATABASE_URL)
+_replica_pool = None        # Репліка для читання (DATABASE_READ_URL), якщо задана
+_replica_down_until = 0.0   # До цього часу (time.monotonic) репліка вважається недоступною
+_last_catalog_write = None  # Час останньої зміни каталогу (time.monotonic) для read-your-writes
+
+
+def init_pool(minconn=None, maxconn=None):
+    """
+    Створює спільний пул з'єднань з PostgreSQL (і з реплікою, якщо задано DATABASE_READ_URL).
+    Викликається один раз у main() перед запуском бота.
+    """
+    global _pool, _replica_pool
+
+    DATABASE_URL = os.environ.get('DATABASE_URL')
+    if not DATABASE_URL:
+        logger.error("❌ DATABASE_URL environment variable is not set. Cannot connect to PostgreSQL.")
+        raise ValueError("DATABASE_URL environment variable is not set.")
+
+    if _pool is not None:
+        return _pool
+
+    minconn = DB_POOL_MIN if minconn is None else minconn
+    maxconn = DB_POOL_MAX if maxconn is None else maxconn
+    _pool = ConnectionPool("primary", DATABASE_URL, minconn, maxconn)
+    logger.info(f"✅ Пул з'єднань з PostgreSQL створено (min={minconn}, max={maxconn})")
+
+    if DATABASE_READ_URL:
+        # Без з'єднань наперед: недоступна при запуску репліка не заважає боту стартувати
+        _replica_pool = ConnectionPool(
+            "replica", DATABASE_READ_URL, 0, DB_READ_POOL_MAX, connect_timeout=DB_READ_CONNECT_TIMEOUT
+        )
+        logger.info(f"✅ Пул з'єднань з реплікою для читання створено (max={DB_READ_POOL_MAX})")
+    return _pool
+
+
+def close_pool():
+    """Закриває всі з'єднання пулів (викликається при зупинці бота)."""
+    global _pool, _replica_pool
+    if _replica_pool is not None:
+        _replica_pool.close()
+        _replica_pool = None
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+        logger.info("Пул з'єднань з PostgreSQL закрито.")
+
+
+@contextmanager
+def get_connection():
+    """З'єднання з основним сервером (синхронно), див. ConnectionPool.connection."""
+    if _pool is None:
+        init_pool()
+    with _pool.connection() as conn:
+        yield conn
+
+
+def note_catalog_write():
+    """Позначає зміну каталогу: найближчі DB_READ_AFTER_WRITE_WINDOW секунд читання йде на основний сервер."""
+    global _last_catalog_write
+    _last_catalog_write = time.monotonic()
+
+
+def _read_pool():
+    """Пул для читання каталогу: репліка, якщо вона задана, доступна і не діє вікно read-your-writes."""
+    if _replica_pool is None:
+        return _pool
+    now = time.monotonic()
+    if now < _replica_down_until:
+        return _pool
+    if _last_catalog_write is not None and now - _last_catalog_write < DB_READ_AFTER_WRITE_WINDOW:
+        return _pool
+    return _replica_pool
+
+
+# --- Асинхронний API запитів ---
+# psycopg2 блокує потік, тому всі запити виконуються у пулі потоків через asyncio.to_thread,
+# а цикл подій python-telegram-bot ніколи не чекає на PostgreSQL.
+
+async def run_with_connection(fn, *args, label=None, read_only=False):
+    """
+    Виконує синхронну функцію fn(conn, *args) в окремому потоці з з'єднанням із пулу.
+    Транзакція підтверджується після успішного завершення fn. Повертає результат fn.
+    label - назва запиту в метриках (за замовчуванням ім'я fn).
+    read_only=True - запит лише читає каталог і може піти на репліку; якщо репліка
+    не відповідає, він повторюється на основному сервері, а репліка на
+    DB_REPLICA_RETRY_INTERVAL секунд виключається з маршрутизації.
+    """
+    global _replica_down_until
+    if _pool is None:
+        init_pool()
+    label = label or fn.__name__.strip('_')
+
+    pool = _read_pool() if read_only else _pool
+    if pool is _pool:
+        return await _pool.run(fn, *args, label=label)
+    try:
+        return await pool.run(fn, *args, label=label)
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        _replica_down_until = time.monotonic() + DB_REPLICA_RETRY_INTERVAL
+        metrics.inc("db_replica_fallbacks_total")
+        logger.warning(f"Репліка недоступна, читання йде на основний сервер {DB_REPLICA_RETRY_INTERVAL:.0f} с: {e}")
+        return await _pool.run(fn, *args, label=label)
+
+
+async def run_in_transaction(fn, *args, label=None, read_only=False):
+    """
+    Виконує синхронну функцію fn(cursor, *args) в окремому потоці в межах однієї транзакції.
+    Повертає результат fn.
+    """
+    def _work(conn):
+        with conn.cursor() as cursor:
+            return fn(cursor, *args)
+
+    return await run_with_connection(_work, label=label or fn.__name__.strip('_'), read_only=read_only)
+
+
+def _query_label(query):
+    """Назва запиту для метрик за замовчуванням - перше слово SQL (select, insert, ...)."""
+    return query.split(None, 1)[0].lower()
+
+
+async def fetch_all(query, params=None, label=None, read_only=False):
+    """Виконує SELECT-запит і повертає всі рядки. read_only=True - можна прочитати з репліки."""
+    def _fetch(cursor):
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    return await run_in_transaction(_fetch, label=label or _query_label(query), read_only=read_only)
+
+
+async def fetch_one(query, params=None, label=None, read_only=False):
+    """Виконує SELECT-запит і повертає перший рядок (або None)."""
+    def _fetch(cursor):
+        cursor.execute(query, params)
+        return cursor.fetchone()
+    return await run_in_transaction(_fetch, label=label or _query_label(query), read_only=read_only)
+
+
+async def execute(query, params=None, label=None):
+    """Виконує запит, що змінює дані, і повертає кількість змінених рядків."""
+    def _execute(cursor):
+        cursor.execute(query, params)
+        return cursor.rowcount
+    return await run_in_transaction(_execute, label=label or _query_label(query))
+
+
+def pool_stats(name="primary"):
+    """Стан пулу з'єднань (primary або replica): видано, максимум, очікують на з'єднання."""
+    pool = _replica_pool if name == "replica" else _pool
+    if pool is None:
+        return {"in_use": 0, "max": 0, "waiting": 0}
+    return pool.stats()
+
+
+def replica_status():
+    """Стан репліки для /stats: None - не налаштована, інакше 'ok', 'down' або 'read-your-writes'."""
+    if _replica_pool is None:
+        return None
+    if time.monotonic() < _replica_down_until:
+        return "down"
+    return "ok" if _read_pool() is _replica_pool else "read-your-writes"
+
+
+def _pool_collector():
+    gauges = []
+    for pool in (_pool, _replica_pool):
+        if pool is None:
+            continue
+        stats = pool.stats()
+        gauges += [
+            ("db_pool_connections_in_use", {"pool": pool.name}, stats["in_use"]),
+            ("db_pool_connections_max", {"pool": pool.name}, stats["max"]),
+            ("db_pool_waiting", {"pool": pool.name}, stats["waiting"]),
+        ]
+    if _replica_pool is not None:
+        gauges.append(("db_replica_up", {}, 0 if time.monotonic() < _replica_down_until else 1))
+    return gauges
+
+
+metrics.add_collector(_pool_collector)
+
+
+# --- Сховище PostgreSQL ---
+
+class PostgresStore(CatalogStore):
+    """
+    Основне сховище: PostgreSQL через спільний пул з'єднань (запити - у пулі потоків).
+    Читання каталогу може йти на репліку (DATABASE_READ_URL), зміни та сесії - лише на основний сервер.
+    """
+
+    name = "postgres"
+
+    def init(self):
+        init_pool()
+        init_db()
+
+    def close(self):
+        close_pool()
+
+    async def fetch_page(self, filters_data, limit, after_id=None, before_id=None, cursor_price=None):
+        query, params, reverse = page_query(filters_data, limit, after_id, before_id, cursor_price=cursor_price)
+        rows = await fetch_all(query, params, label="shoes_page", read_only=True)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if reverse:
+            rows.reverse()
+        return rows, has_more
+
+    async def count(self, filters_data):
+        clauses, params = filters_where(filters_data)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        row = await fetch_one(f"SELECT COUNT(*) FROM shoes{where}", params, label="shoes_count", read_only=True)
+        return row[0]
+
+    async def search_ids(self, filters_data, limit):
+        # Кожне слово запиту шукаємо як префікс: "nik air" знайде "Nike Air Max"
+        tsquery = " & ".join(f"{word}:*" for word in filters_data['query'].split())
+        clauses, params = filters_where(filters_data)
+        clauses.insert(0, f"{SEARCH_DOCUMENT} @@ to_tsquery('simple', %s)")
+        rows = await fetch_all(
+            f"SELECT id FROM shoes WHERE {' AND '.join(clauses)} "
+            f"ORDER BY ts_rank({SEARCH_DOCUMENT}, to_tsquery('simple', %s)) DESC, id LIMIT %s",
+            [tsquery] + params + [tsquery, limit],
+            label="search",
+            read_only=True
+        )
+        return [row[0] for row in rows]
+
+    async def fetch_by_ids(self, shoe_ids):
+        return await fetch_all(
+            f"SELECT {SHOE_COLUMNS} FROM shoes WHERE id = ANY(%s)", (list(shoe_ids),), label="search_page", read_only=True
+        )
+
+    async def brands(self):
+        rows = await fetch_all("SELECT DISTINCT brand FROM shoes ORDER BY brand", label="brands", read_only=True)
+        return [row[0] for row in rows]
+
+    async def sizes(self):
+        rows = await fetch_all("SELECT DISTINCT size FROM shoes ORDER BY size", label="sizes", read_only=True)
+        return [row[0] for row in rows]
+
+    async def fetch_all_shoes(self):
+        return await fetch_all(f"SELECT {SHOE_COLUMNS} FROM shoes ORDER BY id", label="index_rebuild", read_only=True)
+
+    async def export(self, write_rows, batch_size):
+        # Іменований (серверний) курсор: у пам'яті одночасно лише один пакет, незалежно від розміру каталогу
+        def _export(conn):
+            total = 0
+            with conn.cursor(name="shoes_export") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute("SELECT id, name, brand, size, price, image FROM shoes ORDER BY id")
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    write_rows(rows)
+                    total += len(rows)
+            return total
+
+        return await run_with_connection(_export)
+
+    async def add_shoe(self, name, brand, size, price, image):
+        row = await fetch_one(
+            f"INSERT INTO shoes (name, brand, size, price, image) VALUES (%s, %s, %s, %s, %s) RETURNING {SHOE_COLUMNS}",
+            (name, brand, size, price, image),
+            label="add_shoe"
+        )
+        note_catalog_write()
+        return row
+
+    async def delete_shoes(self, shoe_ids):
+        deleted = await execute("DELETE FROM shoes WHERE id = ANY(%s)", (list(shoe_ids),), label="delete_shoes")
+        note_catalog_write()
+        return deleted
+
+    async def bulk_insert(self, csv_file):
+        def _copy(cursor):
+            cursor.copy_expert(
+                "COPY shoes (name, brand, size, price, image) FROM STDIN WITH (FORMAT csv)",
+                csv_file
+            )
+            return cursor.rowcount
+
+        inserted = await run_in_transaction(_copy, label="import_copy")
+        note_catalog_write()
+        return inserted
+
+    async def set_file_id(self, shoe_id, file_id, image_url=None):
+        if image_url is None:
+            await execute("UPDATE shoes SET image_file_id = %s WHERE id = %s", (file_id, shoe_id),
+                          label="save_file_id" if file_id else "clear_file_id")
+        else:
+            # Умова image = %s гарантує, що file_id не прив'яжеться до вже зміненого зображення
+            await execute(
+                "UPDATE shoes SET image_file_id = %s WHERE id = %s AND image = %s",
+                (file_id, shoe_id, image_url),
+                label="save_file_id"
+            )
+
+    async def set_image_status(self, shoe_id, image_url, status, checked_ago=0):
+        await execute(
+            "UPDATE shoes SET image_status = COALESCE(%s, image_status), "
+            "image_checked_at = now() - make_interval(secs => %s) "
+            "WHERE id = %s AND image = %s",
+            (status, checked_ago, shoe_id, image_url),
+            label="image_status"
+        )
+
+    async def images_to_check(self, limit, recheck_after):
+        return await fetch_all(
+            "SELECT id, image, image_file_id FROM shoes "
+            "WHERE image LIKE 'http%%' "
+            "AND (image_checked_at IS NULL OR image_checked_at < now() - make_interval(secs => %s)) "
+            "ORDER BY image_checked_at NULLS FIRST, id LIMIT %s",
+            (recheck_after, limit),
+            label="images_to_check"
+        )
+
+    async def reset_catalog(self):
+        await execute("TRUNCATE shoes RESTART IDENTITY", label="reset_catalog")
+        note_catalog_write()
+
+    async def load_session(self, user_id):
+        row = await fetch_one("SELECT data FROM user_sessions WHERE user_id = %s", (user_id,), label="session_load")
+        return row[0] if row else None
+
+    async def save_sessions(self, sessions):
+        rows = [(user_id, Json(data)) for user_id, data in sessions]
+
+        def _upsert(cursor):
+            execute_values(
+                cursor,
+                "INSERT INTO user_sessions (user_id, data, updated_at) VALUES %s "
+                "ON CONFLICT (user_id) DO UPDATE SET data = EXCLUDED.data, updated_at = EXCLUDED.updated_at",
+                rows,
+                template="(%s, %s, now())"
+            )
+
+        await run_in_transaction(_upsert, label="session_flush")
+
+    async def purge_sessions(self, days):
+        def _purge(cursor):
+            cursor.execute(
+                "DELETE FROM user_sessions WHERE updated_at < now() - make_interval(days => %s)",
+                (days,)
+            )
+            return cursor.rowcount
+        return await run_in_transaction(_purge, label="session_purge")
+
+
+# --- Вибір сховища ---
+# postgres - лише PostgreSQL (DATABASE_URL); sqlite - лише локальний файл SQLITE_PATH, без зовнішніх сервісів.
+# SQLITE_READ_CACHE=1 разом із postgres тримає копію каталогу в SQLITE_PATH і читає каталог з неї.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'postgres')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'shoes.db')
+SQLITE_READ_CACHE = os.environ.get('SQLITE_READ_CACHE', '0') == '1'
+# Як часто локальна копія перечитується з PostgreSQL, щоб підхопити зміни, зроблені в БД напряму (0 - лише при запуску)
+SQLITE_READ_CACHE_REFRESH_INTERVAL = float(os.environ.get('SQLITE_READ_CACHE_REFRESH_INTERVAL', '300'))
+# Найдовша пауза між спробами фонового підключення сховища та звірки каталогу (паузи зростають вдвічі від 1 с)
+STORAGE_RETRY_MAX_DELAY = float(os.environ.get('STORAGE_RETRY_MAX_DELAY', '60'))
+
+_store = None
+_storage_ready = False      # init_storage() вже виконано
+_storage_init = None        # Поточна спроба фонової ініціалізації сховища (asyncio.Future), поки сховище не готове
+_storage_init_task = None   # Фонові спроби ініціалізації (див. start_storage_init)
+
+
+def _create_store():
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteStore(SQLITE_PATH)
+    if STORAGE_BACKEND != "postgres":
+        raise ValueError(f"Невідоме сховище STORAGE_BACKEND={STORAGE_BACKEND!r} (postgres або sqlite).")
+    if SQLITE_READ_CACHE:
+        return MirroredStore(PostgresStore(), SqliteStore(SQLITE_PATH))
+    return PostgresStore()
+
+
+def get_store():
+    """Поточне сховище (створюється за налаштуваннями при першому зверненні)."""
+    global _store
+    if _store is None:
+        _store = _create_store()
+    return _store
+
+
+def init_storage():
+    """
+    Підключає сховище за STORAGE_BACKEND та застосовує міграції схеми.
+    Викликається один раз у main() перед запуском бота.
+    """
+    global _storage_ready
+    store = get_store()
+    store.init()
+    _storage_ready = True
+    logger.info(f"Сховище каталогу: {store.name}")
+    return store
+
+
+def storage_initialized():
+    return _storage_ready
+
+
+async def retry_with_backoff(func, description):
+    """
+    Викликає корутинну функцію func, доки вона не виконається без помилки, і повертає її результат.
+    Паузи між спробами зростають вдвічі від 1 с до STORAGE_RETRY_MAX_DELAY.
+    """
+    delay = 1.0
+    while True:
+        try:
+            return await func()
+        except Exception as e:
+            logger.error(f"Не вдалося {description}: {e}. Наступна спроба через {delay:.0f} с")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, STORAGE_RETRY_MAX_DELAY)
+
+
+async def _init_storage_attempt():
+    global _storage_init
+    # Першу спробу start_storage_init запускає сам; наступні - після помилки попередньої
+    if _storage_init is None or _storage_init.done():
+        _storage_init = asyncio.ensure_future(asyncio.to_thread(init_storage))
+    store = await _storage_init
+    _storage_init = None
+    return store
+
+
+def start_storage_init():
+    """
+    Запускає init_storage() в окремому потоці, не блокуючи цикл подій (запуск бота зі знімка каталогу).
+    Після помилки спроба повторюється, доки сховище не підключиться і міграції не застосуються;
+    до того storage_initialized() повертає False. Повертає задачу, що завершується разом з ініціалізацією.
+    """
+    global _storage_init, _storage_init_task
+    get_store()  # Об'єкт сховища створюється в основному потоці, щоб не створити його двічі
+    # Спроба створюється одразу, щоб ready_store() з першого ж запиту чекав на неї,
+    # а не відкривав з'єднання в обхід міграцій
+    _storage_init = asyncio.ensure_future(asyncio.to_thread(init_storage))
+    _storage_init_task = asyncio.ensure_future(retry_with_backoff(_init_storage_attempt, "підключити сховище"))
+    return _storage_init_task
+
+
+async def ready_store():
+    """
+    Поточне сховище; якщо його ініціалізація ще йде у фоні - спершу чекає на поточну спробу.
+    Якщо вона не вдалася, запит отримує її помилку (без з'єднань в обхід міграцій), а наступна спроба йде у фоні.
+    """
+    init = _storage_init
+    if init is not None:
+        await asyncio.shield(init)
+    return get_store()
+
+
+def close_storage():
+    """Закриває з'єднання сховища (викликається при зупинці бота)."""
+    global _store, _storage_ready, _storage_init, _storage_init_task
+    if _storage_init_task is not None:
+        _storage_init_task.cancel()
+        _storage_init_task = None
+        _storage_init = None
+    if _store is not None:
+        _store.close()
+        _store = None
+    _storage_ready = False
+
+
+def uses_read_cache():
+    return isinstance(get_store(), MirroredStore)
+
+
+async def refresh_read_cache():
+    """Перечитує локальну копію каталогу з PostgreSQL (лише з SQLITE_READ_CACHE=1)."""
+    store = await ready_store()
+    if isinstance(store, MirroredStore):
+        await store.sync()
+        invalidate_catalog_caches()
+
+
+async def read_cache_refresh_loop(interval):
+    """Періодично оновлює локальну копію каталогу, щоб підхопити зміни, зроблені в БД напряму."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_read_cache()
+        except Exception as e:
+            logger.error(f"Помилка оновлення локальної копії каталогу: {e}")
+
+
+# --- Запити каталогу ---
+# Кеші та індекс каталогу в пам'яті працюють поверх будь-якого сховища.
+
+# Кількість товарів для кожної комбінації фільтрів кешується, щоб не рахувати COUNT(*) на кожну сторінку
+COUNT_CACHE_TTL = float(os.environ.get('COUNT_CACHE_TTL', '60'))
+count_cache = TTLCache(COUNT_CACHE_TTL)
+
+# Списки брендів і розмірів для меню фільтрів (DISTINCT по всій таблиці) кешуються,
+# тому перемикання чекбоксів не звертається до БД
+FACET_CACHE_TTL = float(os.environ.get('FACET_CACHE_TTL', '300'))
+facet_cache = TTLCache(FACET_CACHE_TTL, maxsize=8)
+
+# Необов'язковий індекс каталогу в пам'яті: якщо увімкнений і побудований,
+# сторінки, лічильники та фасети обчислюються без звернень до сховища
+CATALOG_INDEX_ENABLED = os.environ.get('CATALOG_INDEX', '0') == '1'
+# Період повної перебудови індексу з БД у секундах (0 - лише при запуску)
+CATALOG_INDEX_REFRESH_INTERVAL = float(os.environ.get('CATALOG_INDEX_REFRESH_INTERVAL', '0'))
+# Файл знімка індексу на диску (потребує CATALOG_INDEX=1): при запуску каталог одразу читається з нього,
+# а підключення до БД і звірка індексу з нею відбуваються у фоні
+CATALOG_SNAPSHOT_PATH = os.environ.get('CATALOG_SNAPSHOT_PATH', '')
+catalog_index = CatalogIndex()
+_snapshot_checksum = None  # Контрольна сума знімка, що зараз лежить на диску
+
+
+def _use_index():
+    return CATALOG_INDEX_ENABLED and catalog_index.ready
+
+
+# Пошук за назвою та брендом: повнотекстовий GIN-індекс (міграція 5) з префіксним збігом слів
+# (у SQLite - таблиця FTS5). Ранжований список id для популярних запитів тримається
+# в короткоживучому кеші, а сторінки результатів гортаються по цьому списку.
+SEARCH_DOCUMENT = "to_tsvector('simple', name || ' ' || brand)"
+SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS', '200'))
+SEARCH_CACHE_TTL = float(os.environ.get('SEARCH_CACHE_TTL', '60'))
+search_cache = TTLCache(SEARCH_CACHE_TTL, maxsize=256)
+
+metrics.add_collector(cache_collector({"count": count_cache, "facet": facet_cache, "search": search_cache}))
+
+
+def normalize_search_query(text):
+    """Зводить пошуковий запит до нижнього регістру та не більше ніж 8 слів (None, якщо слів немає)."""
+    words = re.findall(r"[^\W_]+", (text or "").lower())[:8]
+    return " ".join(words) or None
+
+
+def _filters_key(filters_data):
+    """Незмінний ключ для комбінації фільтрів (порядок вибору та сортування не важливі)."""
+    return (
+        tuple(sorted(filters_data.get('brands') or [])),
+        tuple(sorted(filters_data.get('sizes') or [])),
+        filters_data.get('price_min'),
+        filters_data.get('price_max'),
+        filters_data.get('query') or None,
+    )
+
+
+async def fetch_shoes_page(filters_data, limit, after_id=None, before_id=None, cursor_price=None):
+    """
+    Повертає одну сторінку товарів (keyset-пагінація за колонками сортування filters_data['sort']).
+
+    after_id  - наступна сторінка після товару з цим id;
+    before_id - попередня сторінка перед товаром з цим id;
+    cursor_price - ціна товару-курсора (для сортувань за ціною, див. storage.page_query).
+    Повертає (rows, has_more): рядки завжди впорядковані в порядку сортування,
+    has_more показує, чи є ще товари в напрямку гортання.
+    Якщо у фільтрах є пошуковий запит ('query'), рядки впорядковані за релевантністю,
+    а курсор - це id товару в ранжованому списку результатів.
+    """
+    if filters_data.get('query'):
+        return await _fetch_search_page(filters_data, limit, after_id=after_id, before_id=before_id)
+
+    if _use_index():
+        return catalog_index.page(filters_data, limit, after_id=after_id, before_id=before_id, cursor_price=cursor_price)
+
+    store = await ready_store()
+    return await store.fetch_page(filters_data, limit, after_id=after_id, before_id=before_id, cursor_price=cursor_price)
+
+
+async def count_shoes(filters_data):
+    """Повертає кількість товарів для фільтрів, використовуючи кеш з TTL."""
+    if filters_data.get('query'):
+        return len(await search_shoe_ids(filters_data))
+
+    if _use_index():
+        return catalog_index.count(filters_data)
+
+    key = _filters_key(filters_data)
+    cached = count_cache.get(key)
+    if cached is not None:
+        return cached
+
+    store = await ready_store()
+    count = await store.count(filters_data)
+    count_cache.set(key, count)
+    return count
+
+
+async def search_shoe_ids(filters_data):
+    """
+    Повертає id товарів, що відповідають пошуковому запиту (та фільтрам бренду/розміру),
+    впорядковані за релевантністю. Результат кешується на SEARCH_CACHE_TTL секунд.
+    """
+    key = _filters_key(filters_data)
+    ids = search_cache.get(key)
+    if ids is not None:
+        return ids
+
+    store = await ready_store()
+    ids = await store.search_ids(filters_data, SEARCH_MAX_RESULTS)
+    search_cache.set(key, ids)
+    return ids
+
+
+async def _fetch_search_page(filters_data, limit, after_id=None, before_id=None):
+    """Сторінка результатів пошуку: зріз ранжованого списку id та один запит за первинним ключем."""
+    ids = await search_shoe_ids(filters_data)
+    if before_id is not None:
+        end = ids.index(before_id) if before_id in ids else 0
+        start = max(0, end - limit)
+        page_ids, has_more = ids[start:end], start > 0
+    else:
+        start = ids.index(after_id) + 1 if after_id in ids else 0
+        page_ids, has_more = ids[start:start + limit], start + limit < len(ids)
+
+    if not page_ids:
+        return [], has_more
+    store = await ready_store()
+    rows = await store.fetch_by_ids(page_ids)
+    by_id = {row[0]: row for row in rows}
+    return [by_id[shoe_id] for shoe_id in page_ids if shoe_id in by_id], has_more
+
+
+async def fetch_brands():
+    """Повертає відсортований список брендів (з кешу, якщо він ще дійсний)."""
+    if _use_index():
+        return catalog_index.facet_brands()
+    brands = facet_cache.get('brands')
+    if brands is None:
+        store = await ready_store()
+        brands = await store.brands()
+        facet_cache.set('brands', brands)
+    return brands
+
+
+async def fetch_sizes():
+    """Повертає відсортований список розмірів (з кешу, якщо він ще дійсний)."""
+    if _use_index():
+        return catalog_index.facet_sizes()
+    sizes = facet_cache.get('sizes')
+    if sizes is None:
+        store = await ready_store()
+        sizes = await store.sizes()
+        facet_cache.set('sizes', sizes)
+    return sizes
+
+
+def invalidate_catalog_caches():
+    """Скидає кеші каталогу (викликається після додавання/видалення товарів)."""
+    count_cache.invalidate()
+    facet_cache.invalidate()
+    search_cache.invalidate()
+
+
+async def add_shoe(name, brand, size, price, image):
+    """Додає товар, оновлює індекс і кеші каталогу. Повертає id нового товару."""
+    store = await ready_store()
+    row = await store.add_shoe(name, brand, size, price, image)
+    if catalog_index.ready:
+        catalog_index.add(row)
+    invalidate_catalog_caches()
+    return row[0]
+
+
+async def delete_shoes(shoe_ids):
+    """
+    Видаляє кілька товарів одним запитом в одній транзакції, оновлює індекс і кеші каталогу.
+    Повертає кількість видалених рядків.
+    """
+    shoe_ids = list(shoe_ids)
+    store = await ready_store()
+    deleted = await store.delete_shoes(shoe_ids)
+    if catalog_index.ready:
+        for shoe_id in shoe_ids:
+            catalog_index.remove(shoe_id)
+    invalidate_catalog_caches()
+    return deleted
+
+
+async def bulk_insert_shoes(csv_file):
+    """
+    Завантажує товари з CSV-потоку (name, brand, size, price, image) в одній транзакції
+    (у PostgreSQL - одним COPY). Кеші та індекс каталогу оновлюються один раз після
+    завантаження. Повертає кількість доданих рядків.
+    """
+    store = await ready_store()
+    inserted = await store.bulk_insert(csv_file)
+    invalidate_catalog_caches()
+    if catalog_index.ready:
+        await rebuild_catalog_index()
+    return inserted
+
+
+async def export_shoes(write_rows, batch_size=1000):
+    """
+    Читає всю таблицю shoes пакетами по batch_size рядків і передає кожен пакет
+    у write_rows(rows). Повертає кількість прочитаних рядків.
+    """
+    store = await ready_store()
+    return await store.export(write_rows, batch_size)
+
+
+async def reset_catalog():
+    """Видаляє всі товари та скидає кеші й індекс каталогу."""
+    store = await ready_store()
+    await store.reset_catalog()
+    invalidate_catalog_caches()
+    if catalog_index.ready:
+        catalog_index.load([])
+
+
+async def rebuild_catalog_index():
+    """Повністю перебудовує індекс каталогу зі сховища та оновлює знімок на диску."""
+    store = await ready_store()
+    rows = await store.fetch_all_shoes()
+    catalog_index.load(rows)
+    await save_catalog_snapshot()
+
+
+def load_catalog_snapshot():
+    """
+    Завантажує індекс каталогу зі знімка CATALOG_SNAPSHOT_PATH (синхронно, при запуску).
+    Повертає True, якщо індекс готовий і каталог можна показувати ще до підключення до БД.
+    """
+    global _snapshot_checksum
+    if not (CATALOG_INDEX_ENABLED and CATALOG_SNAPSHOT_PATH):
+        return False
+    try:
+        columns, info = read_snapshot(CATALOG_SNAPSHOT_PATH)
+    except FileNotFoundError:
+        logger.info("Знімка каталогу ще немає - індекс буде побудовано з БД.")
+        return False
+    except (OSError, SnapshotError) as e:
+        logger.warning(f"Знімок каталогу {CATALOG_SNAPSHOT_PATH} не використано: {e}")
+        return False
+    catalog_index.load_columns(*columns)
+    _snapshot_checksum = info["checksum"]
+    logger.info(f"Каталог завантажено зі знімка: {info['rows']} товарів, знімку {time.time() - info['created_at']:.0f} с.")
+    return True
+
+
+async def save_catalog_snapshot():
+    """Записує індекс каталогу у знімок, якщо каталог змінився з часу останнього запису. Повертає True, якщо записано."""
+    global _snapshot_checksum
+    if not (CATALOG_SNAPSHOT_PATH and catalog_index.ready):
+        return False
+    # Колонки копіюються в циклі подій (індекс змінюють лише обробники), а серіалізація й запис - у потоці
+    columns = catalog_index.columns()
+    data = await asyncio.to_thread(dump_snapshot, columns)
+    checksum = snapshot_checksum(data)
+    if checksum == _snapshot_checksum:
+        return False
+    await asyncio.to_thread(write_snapshot, CATALOG_SNAPSHOT_PATH, data)
+    if _snapshot_checksum is not None:
+        logger.info(f"Знімок каталогу оновлено: {len(columns[0])} товарів.")
+    _snapshot_checksum = checksum
+    return True
+
+
+async def prepare_catalog():
+    """Після підключення сховища оновлює локальну копію каталогу та індекс (якщо вони увімкнені)."""
+    if uses_read_cache():
+        await refresh_read_cache()
+    if CATALOG_INDEX_ENABLED:
+        await rebuild_catalog_index()
+
+
+async def catalog_index_refresh_loop(interval):
+    """Періодично перебудовує індекс, щоб підхопити зміни, зроблені в БД напряму."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await rebuild_catalog_index()
+        except Exception as e:
+            logger.error(f"Помилка перебудови індексу каталогу: {e}")
+
+
+
+async def save_shoe_file_id(shoe_id, image_url, file_id):
+    """
+    Зберігає Telegram file_id фото товару.
+    Прив'язка до image_url гарантує, що file_id не прив'яжеться до вже зміненого зображення.
+    Поки сховище підключається у фоні, file_id потрапляє лише в індекс, щоб сторінка не чекала
+    на БД: після підключення індекс перебудовується зі сховища, і file_id збережеться при наступній відправці.
+    """
+    if storage_initialized():
+        store = await ready_store()
+        await store.set_file_id(shoe_id, file_id, image_url)
+    catalog_index.set_file_id(shoe_id, file_id, image_url)
+
+
+async def clear_shoe_file_id(shoe_id):
+    """Видаляє збережений file_id (наприклад, якщо Telegram його більше не приймає)."""
+    store = await ready_store()
+    await store.set_file_id(shoe_id, None)
+    catalog_index.set_file_id(shoe_id, None)
+
+
+async def save_image_status(shoe_id, image_url, status, checked_ago=0):
+    """
+    Записує результат перевірки зображення товару (IMAGE_OK / IMAGE_BROKEN; None - лише час перевірки).
+    Як і file_id, результат прив'язаний до image_url і не застосується до вже зміненого зображення.
+    checked_ago - див. CatalogStore.set_image_status.
+    """
+    store = await ready_store()
+    await store.set_image_status(shoe_id, image_url, status, checked_ago)
+    if status is not None:
+        catalog_index.set_image_status(shoe_id, status, image_url)
+
+
+async def fetch_images_to_check(limit, recheck_after):
+    """Наступні товари для фонової перевірки зображень: список (id, image, image_file_id)."""
+    store = await ready_store()
+    return await store.images_to_check(limit, recheck_after)
+
+# --- Міграції схеми ---
+# Кожна міграція - це (версія, опис, кроки). Крок - SQL-рядок або функція fn(cursor).
+# Нові зміни схеми додаються лише в кінець списку з наступним номером версії.
+# Перші міграції написані ідемпотентно (IF NOT EXISTS), щоб безпечно пройти на вже існуючих базах,
+# створених до появи таблиці schema_migrations.
+
+def _seed_sample_data(cursor):
+    """Додає зразки товарів, якщо таблиця порожня."""
+    cursor.execute("SELECT COUNT(*) FROM shoes")
+    if cursor.fetchone()[0] == 0:
+        # У psycopg2 плейсхолдери для значень - це %s, а не ? як в SQLite
+        cursor.executemany(
+            "INSERT INTO shoes (name, brand, size, price, image) VALUES (%s, %s, %s, %s, %s)",
+            SAMPLE_SHOES
+        )
+        logger.info("Sample data inserted into shoes table.")
+
+
+MIGRATIONS = [
+    (1, "Таблиця shoes та тестові дані", [
+        # - SERIAL PRIMARY KEY для автоінкременту в PostgreSQL (замість INTEGER PRIMARY KEY)
+        # - REAL для дробових чисел (size)
+        '''
+        CREATE TABLE IF NOT EXISTS shoes (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            brand TEXT NOT NULL,
+            size REAL NOT NULL,
+            price INTEGER NOT NULL,
+            image TEXT
+        )
+        ''',
+        _seed_sample_data,
+    ]),
+    (2, "Кеш Telegram file_id для фото товару", [
+        "ALTER TABLE shoes ADD COLUMN IF NOT EXISTS image_file_id TEXT",
+        # Тригер скидає file_id, щойно змінюється URL зображення (навіть якщо його змінили прямо в БД)
+        '''
+        CREATE OR REPLACE FUNCTION shoes_reset_image_file_id() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.image IS DISTINCT FROM OLD.image THEN
+                NEW.image_file_id := NULL;
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        ''',
+        "DROP TRIGGER IF EXISTS shoes_reset_image_file_id ON shoes",
+        '''
+        CREATE TRIGGER shoes_reset_image_file_id
+        BEFORE UPDATE OF image ON shoes
+        FOR EACH ROW EXECUTE FUNCTION shoes_reset_image_file_id()
+        ''',
+    ]),
+    (3, "Сесії користувачів", [
+        # Фільтри, незавершене додавання товару, історія меню
+        '''
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            user_id BIGINT PRIMARY KEY,
+            data JSONB NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        ''',
+    ]),
+    (4, "Індекси для фільтрів за брендом і розміром", [
+        "CREATE INDEX IF NOT EXISTS idx_shoes_brand ON shoes (brand)",
+        "CREATE INDEX IF NOT EXISTS idx_shoes_size ON shoes (size)",
+        # Покриває brand IN (...) AND size IN (...) ORDER BY id та keyset-пагінацію за id
+        "CREATE INDEX IF NOT EXISTS idx_shoes_brand_size_id ON shoes (brand, size, id)",
+    ]),
+    (5, "Повнотекстовий індекс для пошуку за назвою та брендом", [
+        # Вираз має збігатися з SEARCH_DOCUMENT, інакше планувальник не використає індекс
+        "CREATE INDEX IF NOT EXISTS idx_shoes_search ON shoes USING gin (to_tsvector('simple', name || ' ' || brand))",
+    ]),
+    (6, "Індекси для діапазону цін і сортування за ціною", [
+        # Сортування за ціною (і діапазон цін) без фільтрів, з фільтром бренду та з фільтром розміру
+        "CREATE INDEX IF NOT EXISTS idx_shoes_price_id ON shoes (price, id)",
+        "CREATE INDEX IF NOT EXISTS idx_shoes_brand_price_id ON shoes (brand, price, id)",
+        "CREATE INDEX IF NOT EXISTS idx_shoes_size_price_id ON shoes (size, price, id)",
+    ]),
+    (7, "Стан перевірки зображень товарів", [
+        "ALTER TABLE shoes ADD COLUMN IF NOT EXISTS image_status TEXT",
+        "ALTER TABLE shoes ADD COLUMN IF NOT EXISTS image_checked_at TIMESTAMPTZ",
+        # Новий URL зображення - це нове зображення: скидаємо і file_id, і результат перевірки
+        '''
+        CREATE OR REPLACE FUNCTION shoes_reset_image_file_id() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.image IS DISTINCT FROM OLD.image THEN
+                NEW.image_file_id := NULL;
+                NEW.image_status := NULL;
+                NEW.image_checked_at := NULL;
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        ''',
+        # Черга перевірки (images_to_check): неперевірені першими, далі найдавніше перевірені
+        "CREATE INDEX IF NOT EXISTS idx_shoes_image_checked_at ON shoes (image_checked_at NULLS FIRST, id) "
+        "WHERE image LIKE 'http%'",
+    ]),
+]
+
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(cursor):
+    """Повертає поточну версію схеми (0, якщо міграції ще не запускалися)."""
+    cursor.execute("SELECT to_regclass('schema_migrations')")
+    if cursor.fetchone()[0] is None:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cursor.fetchone()[0]
+
+
+def run_migrations(conn):
+    """
+    Застосовує всі нові міграції, кожну в окремій транзакції.
+    Advisory-блокування не дає двом екземплярам бота мігрувати одночасно.
+    Повертає список застосованих версій.
+    """
+    cursor = conn.cursor()
+
+    # Швидкий шлях: схема вже актуальна - жодних блокувань і перевірок
+    if get_schema_version(cursor) >= LATEST_SCHEMA_VERSION:
+        conn.rollback()
+        return []
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    ''')
+    conn.commit()
+
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('shoe_bot_migrations'))")
+        cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+        if cursor.fetchone():
+            conn.rollback()  # Знімаємо блокування
+            continue
+
+        for step in steps:
+            if callable(step):
+                step(cursor)
+            else:
+                cursor.execute(step)
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+            (version, description)
+        )
+        conn.commit()
+        applied.append(version)
+        logger.info(f"Застосовано міграцію {version}: {description}")
+
+    return applied
+
+
 def init_db():
     """
     Ініціалізує базу даних PostgreSQL.
-    Підключається до БД за допомогою DATABASE_URL зі змінних середовища.
-    Створює таблицю 'shoes' та додає тестові дані, якщо таблиця порожня.
+    Підключається до БД через спільний пул з'єднань (DATABASE_URL зі змінних середовища)
+    та застосовує нові міграції схеми. Якщо схема вже актуальна, виконується лише один запит.
     """
     # Отримуємо URL бази даних зі змінних середовища Render
     DATABASE_URL = os.environ.get('DATABASE_URL')
@@ -26,65 +1136,17 @@ def init_db():
         raise ValueError("DATABASE_URL environment variable is not set.")
         # return # Або поверніть, якщо ви хочете, щоб бот все одно запускався, але без БД
 
-    conn = None # Змінна для об'єкта з'єднання з базою даних
     try:
-        # Розбираємо URL бази даних на складові частини (користувач, пароль, хост, порт, назва БД)
-        result = urlparse(DATABASE_URL)
-        
-        # Встановлюємо з'єднання з PostgreSQL
-        conn = psycopg2.connect(
-            database=result.path[1:],  # result.path[1:] дає назву БД без першого '/'
-            user=result.username,
-            password=result.password,
-            host=result.hostname,
-            port=result.port,
-            # sslmode='require' може бути потрібен, якщо ви підключаєтесь ззовні Render
-            # Але для внутрішніх сервісів Render зазвичай не потрібен або за замовчуванням
-        )
-        cursor = conn.cursor() # Створюємо курсор для виконання SQL-запитів
-
-        # Створення таблиці 'shoes', якщо вона ще не існує
-        # Зверніть увагу:
-        # - SERIAL PRIMARY KEY для автоінкременту в PostgreSQL (замість INTEGER PRIMARY KEY)
-        # - REAL для дробових чисел (size)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS shoes (
-                id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL,
-                brand TEXT NOT NULL,
-                size REAL NOT NULL,  
-                price INTEGER NOT NULL,
-                image TEXT
-            )
-        ''')
-        conn.commit() # Підтверджуємо зміни в базі даних (створення таблиці)
-
-        # Перевіряємо, чи таблиця порожня, і додаємо зразки даних, якщо так
-        cursor.execute("SELECT COUNT(*) FROM shoes")
-        if cursor.fetchone()[0] == 0:
-            sample_data = [
-                ('Nike Air Max', 'Nike', 42.5, 4500, 'https://i.ibb.co/23ZMzTj/image.jpg'),
-                ('Adidas Ultraboost', 'Adidas', 39.5, 3800, 'https://i.ibb.co/abc123/adidas.jpg'),
-                ('Puma RS-X', 'Puma', 40.5, 3200, 'https://i.ibb.co/xyz456/puma.jpg'),
-                ('New Balance 574', 'New Balance', 41.0, 2900, 'https://i.ibb.co/def789/nb.jpg'),
-                ('Reebok Classic', 'Reebok', 43.0, 2700, None)
-            ]
-            # У psycopg2 плейсхолдери для значень - це %s, а не ? як в SQLite
-            cursor.executemany(
-                "INSERT INTO shoes (name, brand, size, price, image) VALUES (%s, %s, %s, %s, %s)",
-                sample_data
-            )
-            conn.commit() # Підтверджуємо вставку зразків даних
-            logger.info("Sample data inserted into shoes table.")
+        # Міграції завжди виконуються на основному сервері; з'єднання береться зі спільного пулу
+        # (пул створюється, якщо його ще немає), а при помилці зміни відкочуються
+        with get_connection() as conn:
+            applied = run_migrations(conn)
+        if applied:
+            logger.info(f"✅ Схему бази даних оновлено до версії {LATEST_SCHEMA_VERSION}.")
 
         logger.info("✅ Database successfully initialized and connected to PostgreSQL!")
 
     except Exception as e:
         logger.error(f"❌ Error initializing database: {e}")
-        if conn:
-            conn.rollback() # Відкочуємо всі зміни, якщо сталася помилка
         # Прокидаємо виняток, щоб основний додаток знав про проблему з БД
-        raise e 
-    finally:
-        if conn:
-            conn.close() # Завжди закриваємо з'єднання, незалежно від результату
+        raise e
@@ -0,0 +1,218 @@
+import os
+import asyncio
+import logging
+
+import httpx
+from telegram.error import BadRequest, TelegramError
+
+from database import save_image_status, save_shoe_file_id, fetch_images_to_check
+from metrics import metrics
+from send_scheduler import PRIORITY_BACKGROUND
+from storage import IMAGE_OK, IMAGE_BROKEN
+
+logger = logging.getLogger(__name__)
+
+# Фонова перевірка зображень товарів (0 - вимкнено, напр. без доступу до інтернету)
+IMAGE_CHECK_ENABLED = os.environ.get('IMAGE_CHECK', '1') == '1'
+# Як часто шукати товари, зображення яких пора перевірити, і скільки товарів брати за раз
+IMAGE_CHECK_INTERVAL = float(os.environ.get('IMAGE_CHECK_INTERVAL', '60'))
+IMAGE_CHECK_BATCH = int(os.environ.get('IMAGE_CHECK_BATCH', '50'))
+# Пауза між повними пакетами: після великого імпорту перевірка не забирає ресурси в покупців
+IMAGE_CHECK_BATCH_PAUSE = float(os.environ.get('IMAGE_CHECK_BATCH_PAUSE', '1'))
+# Через скільки секунд зображення перевіряється повторно (за замовчуванням - раз на добу)
+IMAGE_RECHECK_AFTER = float(os.environ.get('IMAGE_RECHECK_AFTER', '86400'))
+# Через скільки секунд повторити перевірку, що не дала відповіді (таймаут, 5xx, 429)
+IMAGE_CHECK_RETRY_AFTER = float(os.environ.get('IMAGE_CHECK_RETRY_AFTER', str(5 * IMAGE_CHECK_INTERVAL)))
+# Скільки зображень перевіряються одночасно та скільки секунд чекати на відповідь сервера
+IMAGE_CHECK_CONCURRENCY = int(os.environ.get('IMAGE_CHECK_CONCURRENCY', '4'))
+IMAGE_CHECK_TIMEOUT = float(os.environ.get('IMAGE_CHECK_TIMEOUT', '10'))
+# Чат (напр. приватний канал адміна), куди фото завантажується наперед, щоб отримати file_id.
+# Повідомлення одразу видаляється. 0 - не завантажувати
+IMAGE_PREUPLOAD_CHAT_ID = int(os.environ.get('IMAGE_PREUPLOAD_CHAT_ID', '0'))
+
+# Telegram приймає фото за URL розміром до 5 МБ
+IMAGE_MAX_BYTES = 5 * 1024 * 1024
+# Відповіді, після яких варто спробувати пізніше, а не вважати зображення недоступним
+TRANSIENT_STATUS_CODES = (408, 425, 429)
+# Тексти BadRequest, з яких видно, що Telegram не зміг завантажити фото за URL
+# (інші BadRequest, напр. через підпис, про саме зображення нічого не кажуть)
+IMAGE_FETCH_ERRORS = (
+    "wrong file identifier/http url",
+    "failed to get http url content",
+    "wrong type of the web page content",
+)
+
+
+def is_image_fetch_error(error):
+    """Чи означає помилка Bot API, що Telegram не зміг завантажити зображення за URL."""
+    message = str(error).lower()
+    return isinstance(error, BadRequest) and any(marker in message for marker in IMAGE_FETCH_ERRORS)
+
+
+class ImageChecker:
+    """
+    Фонова перевірка зображень товарів.
+
+    Новий товар потрапляє в чергу одразу після додавання, а решта каталогу перевіряється
+    пакетами: спершу неперевірені товари (напр. після імпорту), потім ті, що перевірялися
+    найдавніше. Результат записується в рядок товару (image_status), тож сторінки каталогу
+    не пробують відправити фото, яке вже відомо як недоступне. Якщо задано
+    IMAGE_PREUPLOAD_CHAT_ID, фото наперед завантажується в Telegram, і покупці одразу
+    отримують його за file_id.
+    """
+
+    def __init__(self):
+        self.bot = None
+        self._client = None
+        self._queue = asyncio.Queue()
+        self._queued = set()       # id товарів у черзі (без повторів)
+        self._wake = asyncio.Event()
+
+    def submit(self, shoe_id, image_url, file_id=None, notify_chat_id=None):
+        """
+        Ставить зображення товару в чергу перевірки.
+        notify_chat_id - куди повідомити, якщо зображення виявиться недоступним (напр. адміну).
+        """
+        if self.bot is None or shoe_id in self._queued:
+            return
+        if not (image_url and image_url.startswith('http')):
+            return
+        self._queued.add(shoe_id)
+        self._queue.put_nowait((shoe_id, image_url, file_id, notify_chat_id))
+
+    def wake(self):
+        """Запускає наступний пакет перевірки, не чекаючи IMAGE_CHECK_INTERVAL (напр. після імпорту)."""
+        self._wake.set()
+
+    async def run(self, bot):
+        """Фоновий цикл: воркери черги та періодичний пошук зображень, які пора перевірити."""
+        self.bot = bot
+        async with httpx.AsyncClient(timeout=IMAGE_CHECK_TIMEOUT, follow_redirects=True) as client:
+            self._client = client
+            workers = [asyncio.create_task(self._worker()) for _ in range(IMAGE_CHECK_CONCURRENCY)]
+            try:
+                while True:
+                    try:
+                        rows = await fetch_images_to_check(IMAGE_CHECK_BATCH, IMAGE_RECHECK_AFTER)
+                    except Exception as e:
+                        logger.error(f"Не вдалося отримати товари для перевірки зображень: {e}")
+                        rows = []
+                    for shoe_id, image_url, file_id in rows:
+                        self.submit(shoe_id, image_url, file_id)
+                    await self._queue.join()
+                    # Повний пакет - мабуть, є ще товари на перевірку, тож наступний беремо після короткої паузи
+                    if len(rows) >= IMAGE_CHECK_BATCH:
+                        await asyncio.sleep(IMAGE_CHECK_BATCH_PAUSE)
+                        continue
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), IMAGE_CHECK_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                self._client = None
+
+    async def _worker(self):
+        while True:
+            shoe_id, image_url, file_id, notify_chat_id = await self._queue.get()
+            try:
+                status = await self.check(shoe_id, image_url, file_id)
+                if status == IMAGE_BROKEN and notify_chat_id:
+                    await self.bot.send_message(
+                        chat_id=notify_chat_id,
+                        text=f"⚠️ Зображення товару ID:{shoe_id} недоступне, товар показується без фото.\n{image_url}",
+                        rate_limit_args=PRIORITY_BACKGROUND
+                    )
+            except Exception as e:
+                logger.error(f"Помилка перевірки зображення товару ID:{shoe_id}: {e}")
+            finally:
+                self._queued.discard(shoe_id)
+                self._queue.task_done()
+
+    async def check(self, shoe_id, image_url, file_id=None):
+        """
+        Перевіряє зображення одного товару, за потреби завантажує його наперед і записує результат.
+        Повертає IMAGE_OK, IMAGE_BROKEN або None, якщо з'ясувати не вдалося (спробуємо при наступній перевірці).
+        """
+        with metrics.timer("image_check"):
+            status = await self._probe(image_url)
+        if status == IMAGE_OK and IMAGE_PREUPLOAD_CHAT_ID and not file_id:
+            status, file_id = await self._preupload(image_url)
+            if file_id:
+                await save_shoe_file_id(shoe_id, image_url, file_id)
+        # Перевірка без відповіді повторюється через IMAGE_CHECK_RETRY_AFTER, а не через добу:
+        # час перевірки записуємо так, ніби вона була раніше
+        checked_ago = max(0.0, IMAGE_RECHECK_AFTER - IMAGE_CHECK_RETRY_AFTER) if status is None else 0
+        await save_image_status(shoe_id, image_url, status, checked_ago)
+        metrics.inc("image_checks_total", result=status or "unknown")
+        if status == IMAGE_BROKEN:
+            logger.warning(f"Зображення товару ID:{shoe_id} недоступне: {image_url}")
+        return status
+
+    async def _probe(self, image_url):
+        """
+        Завантажує зображення так, як це зробив би Telegram: сервер має відповісти
+        зображенням (Content-Type image/*) розміром до IMAGE_MAX_BYTES.
+        """
+        try:
+            # GET, а не HEAD: частина хостингів зображень відповідає на HEAD інакше
+            async with self._client.stream("GET", image_url) as response:
+                if response.status_code >= 500 or response.status_code in TRANSIENT_STATUS_CODES:
+                    return None
+                if response.status_code >= 400:
+                    return IMAGE_BROKEN
+                if not response.headers.get("content-type", "").startswith("image/"):
+                    return IMAGE_BROKEN
+                length = response.headers.get("content-length", "")
+                if length.isdigit():
+                    return IMAGE_OK if int(length) <= IMAGE_MAX_BYTES else IMAGE_BROKEN
+                # Розмір невідомий - читаємо тіло, але не більше за ліміт
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > IMAGE_MAX_BYTES:
+                        return IMAGE_BROKEN
+                return IMAGE_OK
+        except httpx.InvalidURL:
+            return IMAGE_BROKEN
+        except httpx.HTTPError as e:
+            # Таймаут чи помилка мережі можуть бути й на нашому боці - стан зображення не змінюємо
+            logger.debug(f"Не вдалося перевірити зображення {image_url}: {e!r}")
+            return None
+
+    async def _preupload(self, image_url):
+        """Відправляє фото в IMAGE_PREUPLOAD_CHAT_ID і видаляє повідомлення. Повертає (статус, file_id)."""
+        try:
+            message = await self.bot.send_photo(
+                chat_id=IMAGE_PREUPLOAD_CHAT_ID,
+                photo=image_url,
+                disable_notification=True,
+                rate_limit_args=PRIORITY_BACKGROUND
+            )
+        except BadRequest as e:
+            if is_image_fetch_error(e):
+                # Telegram не зміг завантажити фото - покупці отримали б ту саму помилку
+                return IMAGE_BROKEN, None
+            if "chat" in str(e).lower():
+                logger.error(f"Попереднє завантаження фото неможливе, перевірте IMAGE_PREUPLOAD_CHAT_ID: {e}")
+                return IMAGE_OK, None
+            logger.warning(f"Не вдалося завантажити фото {image_url} наперед: {e}")
+            return IMAGE_OK, None
+        except TelegramError as e:
+            logger.warning(f"Не вдалося завантажити фото {image_url} наперед: {e}")
+            return IMAGE_OK, None
+
+        try:
+            await self.bot.delete_message(
+                chat_id=IMAGE_PREUPLOAD_CHAT_ID,
+                message_id=message.message_id,
+                rate_limit_args=PRIORITY_BACKGROUND
+            )
+        except TelegramError as e:
+            logger.warning(f"Не вдалося видалити службове повідомлення з фото: {e}")
+        return IMAGE_OK, (message.photo[-1].file_id if message.photo else None)
+
+
+image_checker = ImageChecker()
@@ -0,0 +1,210 @@
+import os
+import time
+import bisect
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Порт HTTP-ендпоінта /metrics у форматі Prometheus (0 - не запускати) та адреса, на якій він слухає
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '0'))
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+
+METRICS_PREFIX = "shoe_bot_"
+# Межі кошиків гістограм затримок, у секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гістограма з фіксованими кошиками LATENCY_BUCKETS (останній кошик - все, що більше)."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оцінка квантиля лінійною інтерполяцією всередині кошика."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if i == len(LATENCY_BUCKETS):
+                    return LATENCY_BUCKETS[-1]  # Більше за останню межу - точніше оцінити не можна
+                lower = LATENCY_BUCKETS[i - 1] if i else 0.0
+                return lower + (LATENCY_BUCKETS[i] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return LATENCY_BUCKETS[-1]
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels_key, extra=()):
+    pairs = list(labels_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    """
+    Реєстр метрик процесу: гістограми затримок, лічильники та показники (gauge), які
+    обчислюються під час збору функціями-колекторами (стан пулу з'єднань, кеші тощо).
+    Запити до БД виконуються в потоках, тому запис захищено блокуванням.
+    """
+
+    def __init__(self):
+        self.histograms = {}  # (назва, мітки) -> Histogram
+        self.counters = {}    # (назва, мітки) -> значення
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Вимірює тривалість блоку в гістограму {name}_seconds; виняток додатково
+        рахується в {name}_errors_total з міткою error (тип винятку).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.inc(f"{name}_errors_total", error=type(e).__name__, **labels)
+            raise
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+    def add_collector(self, collector):
+        """collector() повертає список (назва, мітки, значення) поточних показників."""
+        self._collectors.append(collector)
+
+    def collect_gauges(self):
+        gauges = []
+        for collector in self._collectors:
+            try:
+                gauges.extend(collector())
+            except Exception as e:
+                logger.error(f"Помилка збору метрик {collector.__name__}: {e}")
+        return gauges
+
+    def render_prometheus(self):
+        """Усі метрики в текстовому форматі Prometheus 0.0.4."""
+        lines = []
+        with self._lock:
+            histograms = sorted((key, list(h.counts), h.sum, h.count) for key, h in self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        declared = set()
+        for (name, labels), counts, total, count in histograms:
+            full_name = METRICS_PREFIX + name
+            if full_name not in declared:
+                declared.add(full_name)
+                lines.append(f"# TYPE {full_name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{full_name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{full_name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{full_name}_count{_format_labels(labels)} {count}")
+
+        for (name, labels), value in counters:
+            full_name = METRICS_PREFIX + name
+            if full_name not in declared:
+                declared.add(full_name)
+                lines.append(f"# TYPE {full_name} counter")
+            lines.append(f"{full_name}{_format_labels(labels)} {value}")
+
+        for name, labels, value in sorted(self.collect_gauges(), key=lambda g: (g[0], _labels_key(g[1]))):
+            full_name = METRICS_PREFIX + name
+            if full_name not in declared:
+                declared.add(full_name)
+                lines.append(f"# TYPE {full_name} gauge")
+            lines.append(f"{full_name}{_format_labels(_labels_key(labels))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self, name):
+        """[(мітки, кількість, p50, p99)] для гістограми name - для команди /stats."""
+        with self._lock:
+            items = [(dict(labels), h.count, h.quantile(0.5), h.quantile(0.99))
+                     for (metric, labels), h in self.histograms.items() if metric == name]
+        return sorted(items, key=lambda item: -item[1])
+
+    def counter_values(self, name):
+        with self._lock:
+            return sorted(((dict(labels), value) for (metric, labels), value in self.counters.items() if metric == name),
+                          key=lambda item: -item[1])
+
+
+metrics = Metrics()
+
+
+def cache_collector(caches):
+    """Колектор розміру, влучань і промахів кешів з методом stats() (caches: назва -> кеш)."""
+    def _collect():
+        gauges = []
+        for cache_name, cache in caches.items():
+            stats = cache.stats()
+            for key in ("size", "hits", "misses", "hit_rate"):
+                gauges.append((f"cache_{key}", {"cache": cache_name}, stats[key]))
+        return gauges
+    _collect.__name__ = "cache_collector"
+    return _collect
+
+
+# --- HTTP-ендпоінт ---
+
+async def _handle_http(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Заголовки запиту не потрібні, але їх треба дочитати до порожнього рядка
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", metrics.render_prometheus().encode()
+        else:
+            status, body = "404 Not Found", b"Not Found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        logger.warning(f"Помилка запиту до ендпоінта метрик: {e}")
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Запускає локальний HTTP-сервер з ендпоінтом GET /metrics. Повертає asyncio.Server."""
+    server = await asyncio.start_server(_handle_http, host, port)
+    logger.info(f"Метрики Prometheus доступні на http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,216 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Ліміти Bot API: ~30 повідомлень на секунду загалом і ~20 на хвилину в групі. 0 у SEND_GLOBAL_RATE
+# вимикає обмеження. В особистому чаті Telegram допускає сплески (сторінка каталогу - це кілька
+# повідомлень одразу), тож за замовчуванням (SEND_CHAT_RATE=0) особисті чати окремо не обмежуються:
+# якщо Telegram все ж відповість RetryAfter, черга стане на паузу.
+SEND_GLOBAL_RATE = float(os.environ.get('SEND_GLOBAL_RATE', '30'))
+SEND_CHAT_RATE = float(os.environ.get('SEND_CHAT_RATE', '0'))
+SEND_CHAT_BURST = int(os.environ.get('SEND_CHAT_BURST', '5'))
+SEND_GROUP_RATE = float(os.environ.get('SEND_GROUP_RATE', str(20 / 60)))
+# Скільки разів повторювати запит після RetryAfter, перш ніж повернути помилку
+SEND_MAX_RETRIES = int(os.environ.get('SEND_MAX_RETRIES', '3'))
+# Після скількох відер чатів прибирати неактивні
+MAX_CHAT_BUCKETS = 1024
+
+# Пріоритети запитів (rate_limit_args методів context.bot): менше число - раніше в черзі.
+# Запити без rate_limit_args (відповіді на кнопки, меню) вважаються інтерактивними.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1        # Товари сторінки каталогу
+PRIORITY_BACKGROUND = 2  # Файли експорту та інші фонові відправки
+
+
+class TokenBucket:
+    """Відро токенів: rate токенів на секунду, не більше capacity в запасі."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Скільки секунд чекати до появи токена (0 - токен є)."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def reserve(self):
+        """Забирає токен (за потреби в борг) і повертає, скільки секунд чекати на свою чергу."""
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def is_full(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class SendScheduler(BaseRateLimiter):
+    """
+    Центральний планувальник вихідних запитів до Bot API (підключається через
+    ApplicationBuilder.rate_limiter), тож через нього проходять усі виклики context.bot.
+
+    Нове повідомлення (методи send*) спершу чекає на своє відро чату (порядок повідомлень
+    у чаті зберігається), потім стає в загальну чергу з пріоритетом: диспетчер видає глобальні
+    токени спочатку інтерактивним відповідям, потім товарам каталогу, потім фоновим відправкам.
+    Решта запитів (редагування і видалення повідомлень, відповіді на callback-запити тощо)
+    не обмежуються - вони лише чекають на кінець паузи після RetryAfter.
+
+    RetryAfter від Telegram ставить на паузу всю чергу один раз на весь вказаний час,
+    замість того щоб кожен запит окремо повторювався і знову впирався в ліміт;
+    після паузи запити повторюються в порядку пріоритету.
+    """
+
+    def __init__(self, global_rate=SEND_GLOBAL_RATE, chat_rate=SEND_CHAT_RATE, chat_burst=SEND_CHAT_BURST,
+                 group_rate=SEND_GROUP_RATE, max_retries=SEND_MAX_RETRIES):
+        self.enabled = global_rate > 0
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, max(global_rate, 1)) if self.enabled else None
+        self._chats = {}  # chat_id -> TokenBucket
+        self._queue = []  # (пріоритет, порядковий номер, future) запитів, що чекають на глобальний токен
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._dispatcher = None
+        self._paused_until = 0.0
+        self.retries = 0  # Скільки разів запити повторювалися після RetryAfter
+        metrics.add_collector(self._collect)
+
+    async def initialize(self):
+        if self.enabled and self._dispatcher is None:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        # Запити, що ще чекали в черзі, відпускаємо без обмеження, щоб вони не зависли
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                future.set_result(None)
+
+    def _collect(self):
+        return [("bot_api_queue_length", {}, len(self._queue)), ("bot_api_chat_buckets", {}, len(self._chats))]
+
+    def _chat_bucket(self, chat_id):
+        """Відро чату або None, якщо чат окремо не обмежується."""
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Групи (від'ємний id) та канали (@username) мають значно суворіший ліміт
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            if not is_group and self.chat_rate <= 0:
+                return None
+            if len(self._chats) > MAX_CHAT_BUCKETS:
+                for key in [key for key, other in self._chats.items() if other.is_full()]:
+                    del self._chats[key]
+            bucket = self._chats[chat_id] = (
+                TokenBucket(self.group_rate, 1) if is_group else TokenBucket(self.chat_rate, self.chat_burst)
+            )
+        return bucket
+
+    async def _dispatch(self):
+        """Видає глобальні токени запитам з черги в порядку пріоритету."""
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = max(self._paused_until - time.monotonic(), self._global.wait_time())
+            if delay > 0:
+                # За час очікування в чергу можуть потрапити запити з вищим пріоритетом
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._queue)
+            if future.done():  # Запит скасовано, поки він чекав
+                continue
+            self._global.take()
+            future.set_result(None)
+
+    async def _acquire(self, chat_id, priority):
+        bucket = self._chat_bucket(chat_id)
+        delay = bucket.reserve() if bucket is not None else 0.0
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._dispatcher is None:
+            await self.initialize()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        self._wakeup.set()
+        await future
+
+    def _pause(self, exc):
+        # Як і AIORateLimiter з PTB, читаємо timedelta напряму: властивість retry_after застаріла
+        delay = exc._retry_after.total_seconds() + 0.1
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        self.retries += 1
+        return delay
+
+    @staticmethod
+    async def _call(callback, args, kwargs, endpoint, data):
+        """Виконує запит до Bot API, вимірюючи його тривалість (без часу в черзі)."""
+        labels = {"method": endpoint}
+        if endpoint == "sendPhoto":
+            # Фото за URL Telegram спершу завантажує сам - такі запити помітно повільніші
+            photo = data.get("photo")
+            labels["photo"] = "url" if isinstance(photo, str) and photo.startswith("http") else "file_id"
+        with metrics.timer("bot_api", **labels):
+            return await callback(*args, **kwargs)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if not self.enabled:
+            return await self._call(callback, args, kwargs, endpoint, data)
+
+        priority = rate_limit_args if rate_limit_args is not None else PRIORITY_INTERACTIVE
+        # Ліміти Telegram стосуються нових повідомлень; редагування, видалення та відповіді
+        # на кнопки не чекають у черзі, щоб не гальмувати навігацію
+        chat_id = data.get("chat_id") if endpoint.startswith("send") else None
+        if chat_id is not None:
+            try:
+                chat_id = int(chat_id)
+            except (TypeError, ValueError):
+                pass  # @username каналу
+
+        for attempt in range(self.max_retries + 1):
+            queued_at = time.perf_counter()
+            if chat_id is not None:
+                await self._acquire(chat_id, priority)
+            else:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+            metrics.observe("bot_api_queue_wait_seconds", time.perf_counter() - queued_at, priority=priority)
+            try:
+                return await self._call(callback, args, kwargs, endpoint, data)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    logger.error(f"{endpoint}: ліміт Telegram перевищено після {self.max_retries} повторів")
+                    raise
+                delay = self._pause(e)
+                metrics.inc("bot_api_retries_total", method=endpoint)
+                logger.warning(f"{endpoint}: ліміт Telegram перевищено, черга на паузі {delay:.1f} с")
@@ -0,0 +1,166 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+from database import ready_store, storage_initialized
+
+logger = logging.getLogger(__name__)
+
+# Скільки сесій тримати в пам'яті та скільки секунд неактивна сесія може там залишатися
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '5000'))
+SESSION_IDLE_TTL = float(os.environ.get('SESSION_IDLE_TTL', '1800'))
+# Як часто змінені сесії записуються в БД одним пакетом (write-behind)
+SESSION_FLUSH_INTERVAL = float(os.environ.get('SESSION_FLUSH_INTERVAL', '5'))
+# Через скільки днів неактивності сесія видаляється з БД
+SESSION_RETENTION_DAYS = int(os.environ.get('SESSION_RETENTION_DAYS', '30'))
+
+# Глибина історії меню обмежена: у боті лише кілька різних меню
+MAX_MENU_DEPTH = 10
+
+
+def empty_filters():
+    """Порожні фільтри. Під час пошуку до них додається ключ 'query'."""
+    return {'brands': [], 'sizes': []}
+
+
+class Session:
+    """
+    Компактний стан одного користувача: фільтри, майстер додавання товару, історія меню
+    та товари, обрані адміном для видалення.
+    """
+
+    __slots__ = ('user_id', 'filters', 'adding', 'menu', 'selected', 'last_access')
+
+    def __init__(self, user_id, filters=None, adding=None, menu=None, selected=None):
+        self.user_id = user_id
+        self.filters = filters or empty_filters()
+        self.adding = adding    # {'step': ..., 'data': {...}} під час додавання товару, інакше None
+        self.menu = menu or []  # Історія меню для кнопки «Назад»
+        self.selected = selected or []  # id товарів, позначених для видалення
+        self.last_access = time.monotonic()
+
+    def push_menu(self, menu_name):
+        """
+        Додає меню в історію. Якщо меню вже є в історії, повертаємося до нього,
+        тому стек не росте при ходінні по колу між одними й тими ж меню.
+        """
+        if menu_name in self.menu:
+            del self.menu[self.menu.index(menu_name) + 1:]
+        else:
+            self.menu.append(menu_name)
+            del self.menu[:-MAX_MENU_DEPTH]
+
+    def to_json(self):
+        data = {}
+        if any(self.filters.values()):
+            data['f'] = self.filters
+        if self.adding:
+            data['a'] = self.adding
+        if self.menu:
+            data['m'] = self.menu
+        if self.selected:
+            data['s'] = self.selected
+        return data
+
+    @classmethod
+    def from_json(cls, user_id, data):
+        return cls(user_id, filters=data.get('f'), adding=data.get('a'), menu=data.get('m'), selected=data.get('s'))
+
+
+class SessionStore:
+    """
+    Сховище сесій користувачів з LRU/TTL-витісненням з пам'яті та збереженням у БД (сховище з database.get_store).
+
+    Зміни не пишуться в БД одразу: сесія позначається як змінена (mark_dirty), а фоновий
+    цикл раз на SESSION_FLUSH_INTERVAL секунд записує всі змінені сесії одним запитом.
+    Витіснена з пам'яті сесія при наступному зверненні завантажується з БД,
+    тому перезапуск бота не скидає фільтри та незавершене додавання товару.
+    """
+
+    def __init__(self, maxsize=SESSION_CACHE_SIZE, idle_ttl=SESSION_IDLE_TTL):
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()  # user_id -> Session, від найдавніше використаної
+        self._dirty = {}                # user_id -> Session, що чекає на запис у БД
+
+    async def get(self, user_id):
+        """Повертає сесію користувача (з пам'яті, з БД або нову)."""
+        session = self._sessions.get(user_id)
+        if session is None:
+            session = self._dirty.get(user_id)
+        if session is None and not storage_initialized():
+            # Сховище ще підключається у фоні (запуск зі знімка каталогу): не чекаємо на нього,
+            # а починаємо з порожньої сесії - зміни запише write-behind, коли сховище буде готове
+            session = Session(user_id)
+        if session is None:
+            try:
+                store = await ready_store()
+                data = await store.load_session(user_id)
+            except Exception as e:
+                logger.error(f"Не вдалося завантажити сесію користувача {user_id}: {e}")
+                data = None
+            # Поки чекали на БД, сесію могли створити в іншому обробнику
+            session = self._sessions.get(user_id) or (
+                Session.from_json(user_id, data) if data else Session(user_id)
+            )
+
+        session.last_access = time.monotonic()
+        self._sessions[user_id] = session
+        self._sessions.move_to_end(user_id)
+        self._evict()
+        return session
+
+    def mark_dirty(self, session):
+        self._dirty[session.user_id] = session
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._sessions:
+            user_id, oldest = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.maxsize and now - oldest.last_access < self.idle_ttl:
+                break
+            # Незбережена сесія залишається в _dirty до наступного запису в БД
+            del self._sessions[user_id]
+
+    def __len__(self):
+        return len(self._sessions)
+
+    async def flush(self):
+        """Записує всі змінені сесії в БД одним пакетом."""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        rows = [(user_id, session.to_json()) for user_id, session in batch.items()]
+
+        try:
+            store = await ready_store()
+            await store.save_sessions(rows)
+        except Exception as e:
+            logger.error(f"Не вдалося зберегти {len(rows)} сесій: {e}")
+            # Повертаємо сесії в чергу, не перезаписуючи новіші зміни
+            for user_id, session in batch.items():
+                self._dirty.setdefault(user_id, session)
+
+    async def purge_expired(self):
+        """Видаляє з БД сесії, неактивні довше за SESSION_RETENTION_DAYS."""
+        store = await ready_store()
+        return await store.purge_sessions(SESSION_RETENTION_DAYS)
+
+    async def run_flush_loop(self, interval=SESSION_FLUSH_INTERVAL):
+        """Фоновий цикл write-behind. Раз на годину також прибирає старі сесії з БД."""
+        last_purge = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+            self._evict()
+            if time.monotonic() - last_purge > 3600:
+                last_purge = time.monotonic()
+                try:
+                    await self.purge_expired()
+                except Exception as e:
+                    logger.error(f"Помилка очищення старих сесій: {e}")
+
+
+session_store = SessionStore()
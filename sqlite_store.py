@@ -0,0 +1,421 @@
+import csv
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+
+from metrics import metrics
+from storage import CatalogStore, SHOE_COLUMNS, SAMPLE_SHOES, filters_where, page_query
+
+logger = logging.getLogger(__name__)
+
+# Скільки мілісекунд чекати на блокування запису, перш ніж повернути "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = 5000
+# Обсяг файлу бази, що читається через mmap (0 - вимкнено)
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+
+
+def _seed_sample_data(cursor):
+    """Додає зразки товарів, якщо таблиця порожня."""
+    cursor.execute("SELECT COUNT(*) FROM shoes")
+    if cursor.fetchone()[0] == 0:
+        cursor.executemany("INSERT INTO shoes (name, brand, size, price, image) VALUES (?, ?, ?, ?, ?)", SAMPLE_SHOES)
+        logger.info("Sample data inserted into SQLite shoes table.")
+
+
+def _add_file_id_column(cursor):
+    # Старий shoes.db створено без image_file_id, а ADD COLUMN в SQLite не має IF NOT EXISTS
+    cursor.execute("PRAGMA table_info(shoes)")
+    if "image_file_id" not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE shoes ADD COLUMN image_file_id TEXT")
+
+
+def _add_image_check_columns(cursor):
+    cursor.execute("PRAGMA table_info(shoes)")
+    existing = [row[1] for row in cursor.fetchall()]
+    if "image_status" not in existing:
+        cursor.execute("ALTER TABLE shoes ADD COLUMN image_status TEXT")
+    if "image_checked_at" not in existing:
+        cursor.execute("ALTER TABLE shoes ADD COLUMN image_checked_at REAL")
+
+
+# Міграції SQLite-схеми: (версія, опис, кроки), як і MIGRATIONS у database.py, але з власною нумерацією.
+# Перша міграція ідемпотентна, щоб пройти на вже існуючому shoes.db без таблиці schema_migrations.
+SQLITE_MIGRATIONS = [
+    (1, "Таблиця shoes та тестові дані", [
+        '''
+        CREATE TABLE IF NOT EXISTS shoes (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            brand TEXT NOT NULL,
+            size REAL NOT NULL,
+            price INTEGER NOT NULL,
+            image TEXT,
+            image_file_id TEXT
+        )
+        ''',
+        _add_file_id_column,
+        _seed_sample_data,
+        # Як і в PostgreSQL, file_id скидається, щойно змінюється URL зображення
+        '''
+        CREATE TRIGGER IF NOT EXISTS shoes_reset_image_file_id
+        AFTER UPDATE OF image ON shoes
+        FOR EACH ROW WHEN NEW.image IS NOT OLD.image
+        BEGIN
+            UPDATE shoes SET image_file_id = NULL WHERE id = NEW.id;
+        END
+        ''',
+    ]),
+    (2, "Сесії користувачів", [
+        # data - JSON-рядок, updated_at - час Unix у секундах
+        '''
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        ''',
+    ]),
+    (3, "Індекси для фільтрів, діапазону цін і сортування", [
+        # Ті самі індекси, що й у PostgreSQL (міграції 4 і 6)
+        "CREATE INDEX IF NOT EXISTS idx_shoes_brand ON shoes (brand)",
+        "CREATE INDEX IF NOT EXISTS idx_shoes_size ON shoes (size)",
+        "CREATE INDEX IF NOT EXISTS idx_shoes_brand_size_id ON shoes (brand, size, id)",
+        "CREATE INDEX IF NOT EXISTS idx_shoes_price_id ON shoes (price, id)",
+        "CREATE INDEX IF NOT EXISTS idx_shoes_brand_price_id ON shoes (brand, price, id)",
+        "CREATE INDEX IF NOT EXISTS idx_shoes_size_price_id ON shoes (size, price, id)",
+    ]),
+    (4, "Повнотекстовий пошук за назвою та брендом (FTS5)", [
+        # Таблиця FTS5 лише індексує shoes (external content) і підтримується тригерами
+        "CREATE VIRTUAL TABLE IF NOT EXISTS shoes_fts USING fts5(name, brand, content='shoes', content_rowid='id')",
+        '''
+        CREATE TRIGGER IF NOT EXISTS shoes_fts_insert AFTER INSERT ON shoes BEGIN
+            INSERT INTO shoes_fts (rowid, name, brand) VALUES (NEW.id, NEW.name, NEW.brand);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS shoes_fts_delete AFTER DELETE ON shoes BEGIN
+            INSERT INTO shoes_fts (shoes_fts, rowid, name, brand) VALUES ('delete', OLD.id, OLD.name, OLD.brand);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS shoes_fts_update AFTER UPDATE OF name, brand ON shoes BEGIN
+            INSERT INTO shoes_fts (shoes_fts, rowid, name, brand) VALUES ('delete', OLD.id, OLD.name, OLD.brand);
+            INSERT INTO shoes_fts (rowid, name, brand) VALUES (NEW.id, NEW.name, NEW.brand);
+        END
+        ''',
+        # Індексуємо товари, що вже є в таблиці
+        "INSERT INTO shoes_fts (shoes_fts) VALUES ('rebuild')",
+    ]),
+    (5, "Стан перевірки зображень товарів", [
+        # image_checked_at - час Unix у секундах
+        _add_image_check_columns,
+        # Новий URL зображення - це нове зображення: скидаємо і file_id, і результат перевірки
+        "DROP TRIGGER IF EXISTS shoes_reset_image_file_id",
+        '''
+        CREATE TRIGGER shoes_reset_image_file_id
+        AFTER UPDATE OF image ON shoes
+        FOR EACH ROW WHEN NEW.image IS NOT OLD.image
+        BEGIN
+            UPDATE shoes SET image_file_id = NULL, image_status = NULL, image_checked_at = NULL WHERE id = NEW.id;
+        END
+        ''',
+        # Черга перевірки: неперевірені (NULL) ідуть першими
+        "CREATE INDEX IF NOT EXISTS idx_shoes_image_checked_at ON shoes (image_checked_at, id) WHERE image LIKE 'http%'",
+    ]),
+]
+
+SQLITE_LATEST_SCHEMA_VERSION = SQLITE_MIGRATIONS[-1][0]
+
+_SHOE_PLACEHOLDERS = ", ".join("?" * len(SHOE_COLUMNS.split(",")))
+
+
+class SqliteStore(CatalogStore):
+    """
+    Сховище в локальному файлі SQLite: самостійна база для невеликих розгортань
+    або локальна копія каталогу для читання (див. MirroredStore).
+
+    База працює в режимі WAL: читачі не блокують запис і бачать узгоджений знімок.
+    Кожен потік пулу asyncio.to_thread має власне з'єднання для читання; записи
+    серіалізуються блокуванням і виконуються в транзакціях BEGIN IMMEDIATE.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    # --- З'єднання ---
+
+    def _connect(self):
+        # isolation_level=None - транзакції керуються явно (BEGIN IMMEDIATE / COMMIT)
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        # У режимі WAL synchronous=NORMAL не втрачає узгодженості, лише останні транзакції при збої живлення
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        return conn
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def init(self):
+        conn = self._connection()
+        mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        if mode != "wal":
+            logger.warning(f"SQLite не перейшла в режим WAL (journal_mode={mode})")
+        applied = self._run_migrations(conn)
+        if applied:
+            logger.info(f"✅ Схему SQLite оновлено до версії {SQLITE_LATEST_SCHEMA_VERSION}.")
+        logger.info(f"✅ Сховище SQLite готове: {self.path}")
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def _run_migrations(self, conn):
+        """Застосовує нові міграції, кожну в окремій транзакції. Повертає список застосованих версій."""
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        applied = []
+        for version, description, steps in SQLITE_MIGRATIONS:
+            # BEGIN IMMEDIATE одразу бере блокування запису: інший процес не мігрує одночасно
+            with self._write_lock:
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    cursor.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,))
+                    if cursor.fetchone():
+                        cursor.execute("ROLLBACK")
+                        continue
+                    for step in steps:
+                        if callable(step):
+                            step(cursor)
+                        else:
+                            cursor.execute(step)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, description) VALUES (?, ?)",
+                        (version, description)
+                    )
+                    cursor.execute("COMMIT")
+                except Exception:
+                    cursor.execute("ROLLBACK")
+                    raise
+            applied.append(version)
+            logger.info(f"Застосовано міграцію SQLite {version}: {description}")
+        return applied
+
+    async def _run(self, fn, *args, label, write=False):
+        """
+        Виконує fn(cursor, *args) в окремому потоці та повертає результат.
+        write=True - в транзакції запису (одночасно лише одна).
+        """
+        def _work():
+            cursor = self._connection().cursor()
+            with metrics.timer("db_query", query=label):
+                if not write:
+                    return fn(cursor, *args)
+                with self._write_lock:
+                    cursor.execute("BEGIN IMMEDIATE")
+                    try:
+                        result = fn(cursor, *args)
+                        cursor.execute("COMMIT")
+                        return result
+                    except Exception:
+                        cursor.execute("ROLLBACK")
+                        raise
+
+        return await asyncio.to_thread(_work)
+
+    async def _fetch_all(self, query, params=(), label=None):
+        def _fetch(cursor):
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        return await self._run(_fetch, label=label)
+
+    # --- Читання каталогу ---
+
+    async def fetch_page(self, filters_data, limit, after_id=None, before_id=None, cursor_price=None):
+        query, params, reverse = page_query(filters_data, limit, after_id, before_id, placeholder="?", cursor_price=cursor_price)
+        rows = await self._fetch_all(query, params, label="shoes_page")
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if reverse:
+            rows.reverse()
+        return rows, has_more
+
+    async def count(self, filters_data):
+        clauses, params = filters_where(filters_data, placeholder="?")
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = await self._fetch_all(f"SELECT COUNT(*) FROM shoes{where}", params, label="shoes_count")
+        return rows[0][0]
+
+    async def search_ids(self, filters_data, limit):
+        # Кожне слово шукаємо як префікс: "nik air" знайде "Nike Air Max" (rank FTS5 - це bm25, менше - краще)
+        match = " ".join(f'"{word}"*' for word in filters_data['query'].split())
+        clauses, params = filters_where(filters_data, placeholder="?")
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = await self._fetch_all(
+            "SELECT shoes.id FROM shoes "
+            "JOIN (SELECT rowid, rank FROM shoes_fts WHERE shoes_fts MATCH ?) AS found ON found.rowid = shoes.id"
+            f"{where} ORDER BY found.rank, shoes.id LIMIT ?",
+            [match] + params + [limit],
+            label="search"
+        )
+        return [row[0] for row in rows]
+
+    async def fetch_by_ids(self, shoe_ids):
+        shoe_ids = list(shoe_ids)
+        return await self._fetch_all(
+            f"SELECT {SHOE_COLUMNS} FROM shoes WHERE id IN ({','.join('?' * len(shoe_ids))})",
+            shoe_ids,
+            label="search_page"
+        )
+
+    async def brands(self):
+        rows = await self._fetch_all("SELECT DISTINCT brand FROM shoes ORDER BY brand", label="brands")
+        return [row[0] for row in rows]
+
+    async def sizes(self):
+        rows = await self._fetch_all("SELECT DISTINCT size FROM shoes ORDER BY size", label="sizes")
+        return [row[0] for row in rows]
+
+    async def fetch_all_shoes(self):
+        return await self._fetch_all(f"SELECT {SHOE_COLUMNS} FROM shoes ORDER BY id", label="index_rebuild")
+
+    async def export(self, write_rows, batch_size):
+        def _export(cursor):
+            # Усі пакети читаються з одного знімка бази (одна транзакція читання в режимі WAL)
+            cursor.execute("BEGIN")
+            try:
+                cursor.execute("SELECT id, name, brand, size, price, image FROM shoes ORDER BY id")
+                total = 0
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    write_rows(rows)
+                    total += len(rows)
+                return total
+            finally:
+                cursor.execute("COMMIT")
+        return await self._run(_export, label="export")
+
+    # --- Зміни каталогу ---
+
+    async def add_shoe(self, name, brand, size, price, image):
+        def _insert(cursor):
+            cursor.execute(
+                "INSERT INTO shoes (name, brand, size, price, image) VALUES (?, ?, ?, ?, ?)",
+                (name, brand, size, price, image)
+            )
+            return (cursor.lastrowid, name, brand, size, price, image, None, None)
+        return await self._run(_insert, label="add_shoe", write=True)
+
+    async def delete_shoes(self, shoe_ids):
+        shoe_ids = list(shoe_ids)
+
+        def _delete(cursor):
+            cursor.execute(f"DELETE FROM shoes WHERE id IN ({','.join('?' * len(shoe_ids))})", shoe_ids)
+            return cursor.rowcount
+        return await self._run(_delete, label="delete_shoes", write=True)
+
+    async def bulk_insert(self, csv_file):
+        def _insert(cursor):
+            # Порожнє поле image у CSV означає NULL (як у COPY ... FORMAT csv)
+            rows = (
+                (name, brand, float(size), int(price), image or None)
+                for name, brand, size, price, image in csv.reader(csv_file)
+            )
+            cursor.executemany("INSERT INTO shoes (name, brand, size, price, image) VALUES (?, ?, ?, ?, ?)", rows)
+            return cursor.rowcount
+        return await self._run(_insert, label="import_copy", write=True)
+
+    async def set_file_id(self, shoe_id, file_id, image_url=None):
+        def _update(cursor):
+            if image_url is None:
+                cursor.execute("UPDATE shoes SET image_file_id = ? WHERE id = ?", (file_id, shoe_id))
+            else:
+                cursor.execute(
+                    "UPDATE shoes SET image_file_id = ? WHERE id = ? AND image = ?",
+                    (file_id, shoe_id, image_url)
+                )
+        await self._run(_update, label="save_file_id" if file_id else "clear_file_id", write=True)
+
+    async def set_image_status(self, shoe_id, image_url, status, checked_ago=0):
+        def _update(cursor):
+            cursor.execute(
+                "UPDATE shoes SET image_status = COALESCE(?, image_status), image_checked_at = ? "
+                "WHERE id = ? AND image = ?",
+                (status, time.time() - checked_ago, shoe_id, image_url)
+            )
+        await self._run(_update, label="image_status", write=True)
+
+    async def images_to_check(self, limit, recheck_after):
+        return await self._fetch_all(
+            "SELECT id, image, image_file_id FROM shoes "
+            "WHERE image LIKE 'http%' AND (image_checked_at IS NULL OR image_checked_at < ?) "
+            "ORDER BY image_checked_at, id LIMIT ?",
+            (time.time() - recheck_after, limit),
+            label="images_to_check"
+        )
+
+    async def reset_catalog(self):
+        def _reset(cursor):
+            cursor.execute("DELETE FROM shoes")
+        await self._run(_reset, label="reset_catalog", write=True)
+
+    async def upsert_rows(self, rows):
+        """Записує рядки товарів з уже відомими id (копія рядків з основного сховища)."""
+        def _upsert(cursor):
+            cursor.executemany(f"INSERT OR REPLACE INTO shoes ({SHOE_COLUMNS}) VALUES ({_SHOE_PLACEHOLDERS})", rows)
+        await self._run(_upsert, label="replica_upsert", write=True)
+
+    async def replace_all(self, rows):
+        """Замінює весь каталог рядками rows однією транзакцією: читачі бачать або старий, або новий каталог."""
+        def _replace(cursor):
+            cursor.execute("DELETE FROM shoes")
+            cursor.executemany(f"INSERT INTO shoes ({SHOE_COLUMNS}) VALUES ({_SHOE_PLACEHOLDERS})", rows)
+        await self._run(_replace, label="replica_sync", write=True)
+
+    # --- Сесії користувачів ---
+
+    async def load_session(self, user_id):
+        rows = await self._fetch_all("SELECT data FROM user_sessions WHERE user_id = ?", (user_id,), label="session_load")
+        return json.loads(rows[0][0]) if rows else None
+
+    async def save_sessions(self, sessions):
+        now = time.time()
+
+        def _upsert(cursor):
+            cursor.executemany(
+                "INSERT INTO user_sessions (user_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(user_id, json.dumps(data), now) for user_id, data in sessions]
+            )
+        await self._run(_upsert, label="session_flush", write=True)
+
+    async def purge_sessions(self, days):
+        def _purge(cursor):
+            cursor.execute("DELETE FROM user_sessions WHERE updated_at < ?", (time.time() - days * 86400,))
+            return cursor.rowcount
+        return await self._run(_purge, label="session_purge", write=True)
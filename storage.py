@@ -0,0 +1,318 @@
+import logging
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+SHOE_COLUMNS = "id, name, brand, size, price, image, image_file_id, image_status"
+
+# Стан зображення товару за результатами фонової перевірки (image_checker.py);
+# NULL - ще не перевірялося або перевірка не дала відповіді
+IMAGE_OK = "ok"
+IMAGE_BROKEN = "broken"
+
+# Порядки сортування каталогу: ключ -> (колонки keyset-курсора, напрям).
+# Кожен порядок обслуговується складеним індексом, тож сторінка коштує O(розміру сторінки).
+SORT_ORDERS = {
+    'id': (('id',), 'ASC'),                 # За замовчуванням (порядок додавання)
+    'newest': (('id',), 'DESC'),            # Спочатку нові
+    'price_asc': (('price', 'id'), 'ASC'),  # Спочатку дешевші
+    'price_desc': (('price', 'id'), 'DESC'),  # Спочатку дорожчі
+}
+
+# Зразки товарів для порожньої бази (name, brand, size, price, image)
+SAMPLE_SHOES = [
+    ('Nike Air Max', 'Nike', 42.5, 4500, 'https://i.ibb.co/23ZMzTj/image.jpg'),
+    ('Adidas Ultraboost', 'Adidas', 39.5, 3800, 'https://i.ibb.co/abc123/adidas.jpg'),
+    ('Puma RS-X', 'Puma', 40.5, 3200, 'https://i.ibb.co/xyz456/puma.jpg'),
+    ('New Balance 574', 'New Balance', 41.0, 2900, 'https://i.ibb.co/def789/nb.jpg'),
+    ('Reebok Classic', 'Reebok', 43.0, 2700, None)
+]
+
+
+def filters_where(filters_data, placeholder="%s"):
+    """
+    Будує умови WHERE та параметри для фільтрів користувача.
+    placeholder - плейсхолдер драйвера: %s для psycopg2, ? для sqlite3.
+    """
+    clauses = []
+    params = []
+
+    # Фільтр по брендам
+    if filters_data.get('brands'):
+        clauses.append(f"brand IN ({','.join([placeholder] * len(filters_data['brands']))})")
+        params.extend(filters_data['brands'])
+
+    # Фільтр по розмірам
+    if filters_data.get('sizes'):
+        clauses.append(f"size IN ({','.join([placeholder] * len(filters_data['sizes']))})")
+        params.extend(filters_data['sizes'])
+
+    # Діапазон цін: нижня межа включно, верхня - ні ("до 3000" означає < 3000)
+    if filters_data.get('price_min') is not None:
+        clauses.append(f"price >= {placeholder}")
+        params.append(filters_data['price_min'])
+    if filters_data.get('price_max') is not None:
+        clauses.append(f"price < {placeholder}")
+        params.append(filters_data['price_max'])
+
+    return clauses, params
+
+
+def page_query(filters_data, limit, after_id=None, before_id=None, placeholder="%s", cursor_price=None):
+    """
+    SQL однієї сторінки каталогу з keyset-пагінацією (однаковий для PostgreSQL і SQLite).
+    Повертає (query, params, reverse): береться limit + 1 рядок, щоб дізнатися, чи є ще товари;
+    reverse означає, що сторінку треба розвернути (гортання назад).
+    cursor_price - ціна товару-курсора для сортувань за ціною: з нею сторінка знаходиться,
+    навіть якщо сам товар-курсор уже видалено.
+    """
+    columns, direction = SORT_ORDERS.get(filters_data.get('sort') or 'id', SORT_ORDERS['id'])
+    clauses, params = filters_where(filters_data, placeholder)
+    cursor_id = before_id if before_id is not None else after_id
+    # Гортаючи назад, йдемо в протилежному напрямку, а потім розвертаємо сторінку
+    if before_id is not None:
+        direction = "DESC" if direction == "ASC" else "ASC"
+
+    if cursor_id is not None:
+        # Порівняння кортежів (price, id) > (ціна курсора, id курсора) використовує складений індекс
+        key = ", ".join(columns)
+        operator = ">" if direction == "ASC" else "<"
+        if columns == ('id',):
+            clauses.append(f"id {operator} {placeholder}")
+        elif cursor_price is not None:
+            clauses.append(f"({key}) {operator} ({placeholder}, {placeholder})")
+            params.append(cursor_price)
+        else:
+            # Кнопки без ціни в курсорі (зі старих повідомлень): ключ курсора беремо з самого товару
+            clauses.append(f"({key}) {operator} (SELECT {key} FROM shoes WHERE id = {placeholder})")
+        params.append(cursor_id)
+
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    order_by = ", ".join(f"{column} {direction}" for column in columns)
+    query = f"SELECT {SHOE_COLUMNS} FROM shoes{where} ORDER BY {order_by} LIMIT {placeholder}"
+    return query, params + [limit + 1], before_id is not None
+
+
+class CatalogStore(ABC):
+    """
+    Інтерфейс сховища товарів і сесій. Реалізації: PostgresStore (database.py) - основне
+    сховище, SqliteStore (sqlite_store.py) - локальна база в режимі WAL, та MirroredStore -
+    PostgreSQL із локальною SQLite-копією каталогу для читання.
+
+    Кеші, індекс каталогу в пам'яті та метрики живуть рівнем вище (database.py),
+    тому сховище відповідає лише за запити. Рядок товару - кортеж у порядку SHOE_COLUMNS.
+    Усі методи абстрактні: сховище, де якогось бракує, не вдасться навіть створити.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def init(self):
+        """Готує сховище до роботи (з'єднання, міграції схеми). Викликається синхронно при запуску."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def close(self):
+        raise NotImplementedError
+
+    # --- Читання каталогу ---
+
+    @abstractmethod
+    async def fetch_page(self, filters_data, limit, after_id=None, before_id=None, cursor_price=None):
+        """Сторінка товарів для фільтрів і сортування: (rows, has_more), див. page_query."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def count(self, filters_data):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def search_ids(self, filters_data, limit):
+        """id товарів, у назві чи бренді яких є слова filters_data['query'] (як префікси), за релевантністю."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def fetch_by_ids(self, shoe_ids):
+        """Рядки товарів з указаними id (у довільному порядку)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def brands(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def sizes(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def fetch_all_shoes(self):
+        """Усі товари, впорядковані за id (для індексу каталогу та синхронізації копій)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def export(self, write_rows, batch_size):
+        """Передає (id, name, brand, size, price, image) усіх товарів у write_rows пакетами. Повертає кількість."""
+        raise NotImplementedError
+
+    # --- Зміни каталогу ---
+
+    @abstractmethod
+    async def add_shoe(self, name, brand, size, price, image):
+        """Додає товар і повертає його рядок."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_shoes(self, shoe_ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def bulk_insert(self, csv_file):
+        """Додає товари з CSV-потоку (name, brand, size, price, image). Повертає кількість."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_file_id(self, shoe_id, file_id, image_url=None):
+        """
+        Зберігає (або скидає, якщо file_id None) Telegram file_id фото товару.
+        image_url - зберегти лише якщо зображення товару досі це.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_image_status(self, shoe_id, image_url, status, checked_ago=0):
+        """
+        Записує результат перевірки зображення та час перевірки, якщо зображення товару досі image_url.
+        status None - оновити лише час перевірки (попередній стан лишається).
+        checked_ago - на скільки секунд раніше за поточний момент записати час перевірки,
+        щоб товар знову потрапив у images_to_check раніше (напр. після перевірки без відповіді).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def images_to_check(self, limit, recheck_after):
+        """
+        (id, image, image_file_id) товарів із зображенням за URL, які ще не перевірялися
+        або перевірялися понад recheck_after секунд тому: спершу неперевірені, далі найдавніші.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def reset_catalog(self):
+        """Видаляє всі товари (для бенчмарку та тестових баз)."""
+        raise NotImplementedError
+
+    # --- Сесії користувачів ---
+
+    @abstractmethod
+    async def load_session(self, user_id):
+        """Дані сесії (dict) або None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_sessions(self, sessions):
+        """Записує сесії одним пакетом: sessions - список (user_id, dict)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def purge_sessions(self, days):
+        """Видаляє сесії, неактивні довше за days днів. Повертає кількість."""
+        raise NotImplementedError
+
+
+class MirroredStore(CatalogStore):
+    """
+    Основне сховище (PostgreSQL) з локальною копією каталогу в SQLite.
+
+    Перегляд каталогу (сторінки, лічильники, фасети, пошук) читає локальну копію без
+    мережевих звернень; усі зміни спершу записуються в основне сховище, а потім ті самі
+    рядки (з тими ж id) - у копію. Сесії та експорт працюють з основним сховищем.
+    Зміни, зроблені в PostgreSQL напряму, потрапляють у копію під час sync().
+    """
+
+    name = "mirrored"
+
+    def __init__(self, primary, replica):
+        self.primary = primary
+        self.replica = replica
+
+    def init(self):
+        self.primary.init()
+        self.replica.init()
+
+    def close(self):
+        self.replica.close()
+        self.primary.close()
+
+    async def sync(self):
+        """Повністю замінює локальну копію каталогу рядками з основного сховища."""
+        rows = await self.primary.fetch_all_shoes()
+        await self.replica.replace_all(rows)
+        logger.info(f"Локальну копію каталогу оновлено: {len(rows)} товарів")
+        return len(rows)
+
+    async def fetch_page(self, filters_data, limit, after_id=None, before_id=None, cursor_price=None):
+        return await self.replica.fetch_page(
+            filters_data, limit, after_id=after_id, before_id=before_id, cursor_price=cursor_price
+        )
+
+    async def count(self, filters_data):
+        return await self.replica.count(filters_data)
+
+    async def search_ids(self, filters_data, limit):
+        return await self.replica.search_ids(filters_data, limit)
+
+    async def fetch_by_ids(self, shoe_ids):
+        return await self.replica.fetch_by_ids(shoe_ids)
+
+    async def brands(self):
+        return await self.replica.brands()
+
+    async def sizes(self):
+        return await self.replica.sizes()
+
+    async def fetch_all_shoes(self):
+        return await self.replica.fetch_all_shoes()
+
+    async def export(self, write_rows, batch_size):
+        return await self.primary.export(write_rows, batch_size)
+
+    async def add_shoe(self, name, brand, size, price, image):
+        row = await self.primary.add_shoe(name, brand, size, price, image)
+        await self.replica.upsert_rows([row])
+        return row
+
+    async def delete_shoes(self, shoe_ids):
+        deleted = await self.primary.delete_shoes(shoe_ids)
+        await self.replica.delete_shoes(shoe_ids)
+        return deleted
+
+    async def bulk_insert(self, csv_file):
+        # id нових рядків призначає PostgreSQL, тому копію простіше перечитати цілком
+        inserted = await self.primary.bulk_insert(csv_file)
+        await self.sync()
+        return inserted
+
+    async def set_file_id(self, shoe_id, file_id, image_url=None):
+        await self.primary.set_file_id(shoe_id, file_id, image_url)
+        await self.replica.set_file_id(shoe_id, file_id, image_url)
+
+    async def set_image_status(self, shoe_id, image_url, status, checked_ago=0):
+        await self.primary.set_image_status(shoe_id, image_url, status, checked_ago)
+        await self.replica.set_image_status(shoe_id, image_url, status, checked_ago)
+
+    async def images_to_check(self, limit, recheck_after):
+        # Час перевірки веде лише основне сховище
+        return await self.primary.images_to_check(limit, recheck_after)
+
+    async def reset_catalog(self):
+        await self.primary.reset_catalog()
+        await self.replica.reset_catalog()
+
+    async def load_session(self, user_id):
+        return await self.primary.load_session(user_id)
+
+    async def save_sessions(self, sessions):
+        await self.primary.save_sessions(sessions)
+
+    async def purge_sessions(self, days):
+        return await self.primary.purge_sessions(days)
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Ліміт для семафора BaseUpdateProcessor (див. PerUserUpdateProcessor.__init__)
+_UNLIMITED = 2 ** 30
+
+
+class _UserLock:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0  # Скільки оновлень користувача зараз виконуються або чекають на чергу
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обробляє оновлення різних користувачів паралельно, а оновлення одного користувача - строго по черзі.
+
+    Для кожного користувача, що має оновлення в роботі, існує окремий asyncio.Lock.
+    Щойно черга користувача спорожніє, його блокування видаляється, тому словник
+    не росте разом із кількістю користувачів.
+    Оновлення без користувача (effective_user is None) обробляються без блокування.
+
+    Слот із max_concurrent_updates оновлення бере лише тоді, коли підійшла його черга:
+    оновлення, що чекають на попереднє оновлення того ж користувача, слотів не тримають,
+    тож один користувач (чи довгий імпорт адміна) не блокує решту.
+    """
+
+    __slots__ = ("_user_locks", "_slots")
+
+    def __init__(self, max_concurrent_updates):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        # Семафор BaseUpdateProcessor.process_update береться ще до черги користувача,
+        # тому він лише формальний, а справжній ліміт - self._slots у do_process_update
+        super().__init__(_UNLIMITED)
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._user_locks = {}
+
+    async def do_process_update(self, update, coroutine):
+        user = getattr(update, "effective_user", None)
+        if user is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        entry = self._user_locks.get(user.id)
+        if entry is None:
+            entry = self._user_locks[user.id] = _UserLock()
+        entry.pending += 1
+        try:
+            async with entry.lock:
+                async with self._slots:
+                    await coroutine
+        finally:
+            entry.pending -= 1
+            if entry.pending == 0:
+                del self._user_locks[user.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self._user_locks:
+            logger.info(f"Зупинка обробника оновлень: {len(self._user_locks)} користувачів ще мають оновлення в роботі.")